@@ -1,16 +1,48 @@
 from abc import ABC, abstractmethod
-from openai import OpenAI
+from collections import deque
+from openai import OpenAI, AsyncOpenAI
+from circuit_breaker import CircuitBreaker
+from routing import ProviderStats, create_policy
+from rate_limiter import FairRateLimiter, RateLimitExceeded
+from tracing import tracer
+from metrics import ai_request_seconds, ai_request_errors, record_usage
+from deadline import (DeadlineExceeded, remaining_budget, has_attempt_budget, mark_exhausted, is_exhausted,
+                      MIN_ATTEMPT_SECONDS, DEADLINE_RESERVE)
+import asyncio
 import logging
-import random
-from typing import Optional
+import time
+from typing import List, Optional, Union
 
 logger = logging.getLogger(__name__)
 
+DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
+
+# Ретраи SDK повторяют запрос в обход лимитов и умножают нагрузку при 429,
+# поэтому асинхронные клиенты почти не ретраят: дальше сработает fallback на другого провайдера
+ASYNC_MAX_RETRIES = 1
+
+# Промпт - строка (одно сообщение пользователя) или готовый список сообщений чата.
+# Неизменная часть промпта идет первой (system), чтобы провайдер мог взять ее из кэша префиксов
+Prompt = Union[str, List[dict]]
+
+def to_messages(prompt: Prompt) -> List[dict]:
+    """Сообщения для chat.completions: строка становится сообщением пользователя"""
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return prompt
+
+def request_client(client, timeout: Optional[float] = None, max_retries: Optional[int] = None):
+    """SDK клиент с таймаутом и числом ретраев для одного запроса (None - настройки клиента)"""
+    options = {key: value for key, value in (("timeout", timeout), ("max_retries", max_retries))
+               if value is not None}
+    return client.with_options(**options) if options else client
+
 class AIClientBase(ABC):
     """Базовый класс для AI клиентов"""
     
     @abstractmethod
-    def get_completion(self, prompt: str, max_tokens: int = 50, temperature: float = 0.9) -> str:
+    def get_completion(self, prompt: Prompt, max_tokens: int = 50, temperature: float = 0.9,
+                       timeout: Optional[float] = None, max_retries: Optional[int] = None) -> str:
         pass
     
     @abstractmethod
@@ -20,30 +52,45 @@ class AIClientBase(ABC):
 class OpenAIClient(AIClientBase):
     """Клиент для OpenAI API"""
     
-    def __init__(self, api_key: str):
+    cost_per_1k_tokens = 0.0006  # USD за 1000 выходных токенов gpt-4o-mini
+    prompt_cost_per_1k_tokens = 0.00015  # USD за 1000 токенов промпта
+    cached_prompt_cost_per_1k_tokens = 0.000075  # USD за 1000 токенов промпта из кэша префиксов
+    
+    max_retries = 5  # ретраи SDK без дедлайна
+    
+    def __init__(self, api_key: str, base_url: Optional[str] = None, http_client=None):
         self.client = OpenAI(
             api_key=api_key,
+            base_url=base_url,
             timeout=60.0,
-            max_retries=5
+            max_retries=self.max_retries,
+            http_client=http_client
         )
         self.model = "gpt-4o-mini"
     
-    def get_completion(self, prompt: str, max_tokens: int = 50, temperature: float = 0.9) -> str:
+    def get_completion(self, prompt: Prompt, max_tokens: int = 50, temperature: float = 0.9,
+                       timeout: Optional[float] = None, max_retries: Optional[int] = None) -> str:
+        started = time.perf_counter()
         try:
-            logger.info(f"[OpenAI] Отправляем запрос к {self.model}")
-            response = self.client.chat.completions.create(
+            logger.debug("[OpenAI] Отправляем запрос к %s", self.model)
+            response = request_client(self.client, timeout, max_retries).chat.completions.create(
                 model=self.model,
-                messages=[{"role": "user", "content": prompt}],
+                messages=to_messages(prompt),
                 max_tokens=max_tokens,
                 temperature=temperature,
                 top_p=0.9
             )
             
+            latency = time.perf_counter() - started
+            ai_request_seconds.observe(latency, "OpenAI")
+            record_usage("OpenAI", response.usage, latency)
+            
             result = response.choices[0].message.content.strip()
-            logger.info(f"[OpenAI] Получен ответ: '{result}'")
+            logger.debug("[OpenAI] Получен ответ: '%s'", result)
             return result
             
         except Exception as e:
+            ai_request_errors.inc("OpenAI", type(e).__name__)
             logger.error(f"[OpenAI] Ошибка: {type(e).__name__}: {e}")
             raise e
     
@@ -53,67 +100,200 @@ class OpenAIClient(AIClientBase):
 class DeepSeekClient(AIClientBase):
     """Клиент для DeepSeek API"""
     
-    def __init__(self, api_key: str):
+    cost_per_1k_tokens = 0.0011  # USD за 1000 выходных токенов deepseek-chat
+    prompt_cost_per_1k_tokens = 0.00027  # USD за 1000 токенов промпта
+    cached_prompt_cost_per_1k_tokens = 0.00007  # USD за 1000 токенов промпта из кэша контекста
+    
+    max_retries = 5  # ретраи SDK без дедлайна
+    
+    def __init__(self, api_key: str, base_url: Optional[str] = None, http_client=None):
         # DeepSeek совместим с OpenAI API
         self.client = OpenAI(
             api_key=api_key,
-            base_url="https://api.deepseek.com/v1",
+            base_url=base_url or DEEPSEEK_BASE_URL,
             timeout=60.0,
-            max_retries=5
+            max_retries=self.max_retries,
+            http_client=http_client
         )
         self.model = "deepseek-chat"
     
-    def get_completion(self, prompt: str, max_tokens: int = 50, temperature: float = 0.9) -> str:
+    def get_completion(self, prompt: Prompt, max_tokens: int = 50, temperature: float = 0.9,
+                       timeout: Optional[float] = None, max_retries: Optional[int] = None) -> str:
+        started = time.perf_counter()
         try:
-            logger.info(f"[DeepSeek] Отправляем запрос к {self.model}")
-            response = self.client.chat.completions.create(
+            logger.debug("[DeepSeek] Отправляем запрос к %s", self.model)
+            response = request_client(self.client, timeout, max_retries).chat.completions.create(
                 model=self.model,
-                messages=[{"role": "user", "content": prompt}],
+                messages=to_messages(prompt),
                 max_tokens=max_tokens,
                 temperature=temperature,
                 top_p=0.9
             )
             
+            latency = time.perf_counter() - started
+            ai_request_seconds.observe(latency, "DeepSeek")
+            record_usage("DeepSeek", response.usage, latency)
+            
             result = response.choices[0].message.content.strip()
-            logger.info(f"[DeepSeek] Получен ответ: '{result}'")
+            logger.debug("[DeepSeek] Получен ответ: '%s'", result)
             return result
             
         except Exception as e:
+            ai_request_errors.inc("DeepSeek", type(e).__name__)
             logger.error(f"[DeepSeek] Ошибка: {type(e).__name__}: {e}")
             raise e
     
     def get_provider_name(self) -> str:
         return "DeepSeek"
 
+class AsyncAIClientBase(ABC):
+    """Базовый класс для асинхронных AI клиентов"""
+    
+    @abstractmethod
+    async def get_completion(self, prompt: Prompt, max_tokens: int = 50, temperature: float = 0.9,
+                             timeout: Optional[float] = None, max_retries: Optional[int] = None) -> str:
+        pass
+    
+    @abstractmethod
+    def get_provider_name(self) -> str:
+        pass
+
+class AsyncOpenAIClient(AsyncAIClientBase):
+    """Асинхронный клиент для OpenAI API (не блокирует event loop бота)"""
+    
+    cost_per_1k_tokens = 0.0006  # USD за 1000 выходных токенов gpt-4o-mini
+    prompt_cost_per_1k_tokens = 0.00015  # USD за 1000 токенов промпта
+    cached_prompt_cost_per_1k_tokens = 0.000075  # USD за 1000 токенов промпта из кэша префиксов
+    
+    max_retries = ASYNC_MAX_RETRIES
+    
+    # Таймаут прогревающего запроса (список моделей)
+    PING_TIMEOUT = 5.0
+    
+    def __init__(self, api_key: str, base_url: Optional[str] = None, http_client=None):
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=60.0,
+            max_retries=self.max_retries,
+            http_client=http_client
+        )
+        self.model = "gpt-4o-mini"
+    
+    async def get_completion(self, prompt: Prompt, max_tokens: int = 50, temperature: float = 0.9,
+                             timeout: Optional[float] = None, max_retries: Optional[int] = None) -> str:
+        name = self.get_provider_name()
+        started = time.perf_counter()
+        try:
+            response = await request_client(self.client, timeout, max_retries).chat.completions.create(
+                model=self.model,
+                messages=to_messages(prompt),
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=0.9
+            )
+            
+            latency = time.perf_counter() - started
+            ai_request_seconds.observe(latency, name)
+            record_usage(name, response.usage, latency)
+            
+            result = response.choices[0].message.content.strip()
+            tracer.event("[%s] Ответ %s: '%s'", name, self.model, result)
+            return result
+            
+        except Exception as e:
+            ai_request_errors.inc(name, type(e).__name__)
+            logger.error("[%s] Ошибка: %s: %s", name, type(e).__name__, e)
+            raise e
+    
+    async def ping(self):
+        """Легкий запрос к провайдеру (список моделей): открывает или удерживает соединение"""
+        await self.client.with_options(timeout=self.PING_TIMEOUT, max_retries=0).models.list()
+    
+    def get_provider_name(self) -> str:
+        return "OpenAI"
+
+class AsyncDeepSeekClient(AsyncOpenAIClient):
+    """Асинхронный клиент для DeepSeek API"""
+    
+    cost_per_1k_tokens = 0.0011  # USD за 1000 выходных токенов deepseek-chat
+    prompt_cost_per_1k_tokens = 0.00027  # USD за 1000 токенов промпта
+    cached_prompt_cost_per_1k_tokens = 0.00007  # USD за 1000 токенов промпта из кэша контекста
+    
+    def __init__(self, api_key: str, base_url: Optional[str] = None, http_client=None):
+        # DeepSeek совместим с OpenAI API
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url or DEEPSEEK_BASE_URL,
+            timeout=60.0,
+            max_retries=self.max_retries,
+            http_client=http_client
+        )
+        self.model = "deepseek-chat"
+    
+    def get_provider_name(self) -> str:
+        return "DeepSeek"
+
 class MultiAIClient:
     """Клиент с поддержкой множественных AI провайдеров"""
     
-    def __init__(self, openai_key: Optional[str] = None, deepseek_key: str = None, provider: str = "deepseek"):
+    # Классы провайдеров (переопределяются в асинхронной версии)
+    deepseek_client_class = DeepSeekClient
+    openai_client_class = OpenAIClient
+    
+    # Доля оставшегося бюджета времени на попытку, если после нее есть куда переключиться
+    ATTEMPT_BUDGET_SHARE = 0.6
+    # Обычная задержка ответа провайдера, пока нет своих замеров (для числа ретраев в бюджете)
+    DEFAULT_EXPECTED_LATENCY = 2.0
+    
+    def __init__(self, openai_key: Optional[str] = None, deepseek_key: str = None, provider: str = "deepseek",
+                 breaker_settings: Optional[dict] = None, routing: str = "weighted",
+                 routing_options: Optional[dict] = None, fallback_answer: str = "Омлет с овощами",
+                 base_urls: Optional[dict] = None, http_transport=None):
         self.clients = {}
+        base_urls = base_urls or {}
+        # Общий пул соединений для всех провайдеров (без него у каждого SDK клиента свой)
+        self.http_transport = http_transport
+        http_client = self._http_client(http_transport) if http_transport else None
+        self.fallback_answer = fallback_answer  # ответ, когда все провайдеры недоступны
         self.fallback_clients = []
         
         # Инициализируем DeepSeek клиент (основной)
         if deepseek_key:
-            self.clients["deepseek"] = DeepSeekClient(deepseek_key)
+            self.clients["deepseek"] = self.deepseek_client_class(deepseek_key, base_url=base_urls.get("deepseek"),
+                                                                  http_client=http_client)
             self.fallback_clients.append("deepseek")
         
         # Инициализируем OpenAI клиент (резервный)
         if openai_key:
-            self.clients["openai"] = OpenAIClient(openai_key)
+            self.clients["openai"] = self.openai_client_class(openai_key, base_url=base_urls.get("openai"),
+                                                              http_client=http_client)
             self.fallback_clients.append("openai")
         
+        # Предохранители: недоступный провайдер пропускается сразу, без таймаутов и ретраев
+        self.breakers = {name: CircuitBreaker(name, **(breaker_settings or {})) for name in self.clients}
+        
+        # Маршрутизация в режиме mixed: оценки задержки, успешности и стоимости провайдеров
+        self.router = create_policy(routing, **(routing_options or {}))
+        self.provider_stats = {
+            name: ProviderStats(cost_per_1k_tokens=getattr(client, "cost_per_1k_tokens", 0.0))
+            for name, client in self.clients.items()
+        }
+        
         self.provider = provider.lower()
         logger.info(f"[MultiAI] Инициализирован с провайдером: {self.provider}")
         logger.info(f"[MultiAI] Доступные клиенты: {list(self.clients.keys())}")
     
-    def get_completion(self, prompt: str, max_tokens: int = 50, temperature: float = 0.9) -> str:
-        """Получить ответ от AI с fallback логикой"""
-        
-        # Определяем порядок попыток
-        if self.provider == "mixed":
-            # Случайный выбор для разнообразия
-            primary_client = random.choice(list(self.clients.keys()))
-            fallback_order = [c for c in self.fallback_clients if c != primary_client]
+    def _http_client(self, http_transport):
+        """httpx клиент общего пула для SDK клиентов провайдеров"""
+        return http_transport.sync_client()
+    
+    def _get_attempt_order(self):
+        """Определить основной клиент и порядок fallback клиентов"""
+        if self.provider == "mixed" and self.clients:
+            # Порядок определяет политика маршрутизации
+            ordered = self.router.order(list(self.clients.keys()), self.provider_stats)
+            primary_client, fallback_order = ordered[0], ordered[1:]
         elif self.provider in self.clients:
             # Используем указанный провайдер как основной
             primary_client = self.provider
@@ -123,39 +303,381 @@ class MultiAIClient:
             primary_client = self.fallback_clients[0] if self.fallback_clients else None
             fallback_order = self.fallback_clients[1:] if len(self.fallback_clients) > 1 else []
         
+        if not primary_client:
+            return None, []
+        
+        # Пропускаем провайдеров с открытым предохранителем
+        order = [c for c in [primary_client] + fallback_order if self.breakers[c].is_available()]
+        if not order:
+            logger.warning("[MultiAI] Все предохранители открыты, провайдеры пропущены")
+            return None, []
+        return order[0], order[1:]
+    
+    def _attempt_budget(self, fallbacks_left):
+        """Бюджет времени на попытку из дедлайна обработчика (deadline.py).
+        
+        None - дедлайна нет; 0 - на попытку не хватает, ответ будет без AI.
+        Если после попытки есть куда переключиться, ей достается только часть бюджета.
+        """
+        remaining = remaining_budget()
+        if remaining is None:
+            return None
+        budget = remaining - DEADLINE_RESERVE
+        if budget < MIN_ATTEMPT_SECONDS:
+            mark_exhausted()
+            return 0.0
+        if fallbacks_left and budget * (1 - self.ATTEMPT_BUDGET_SHARE) >= MIN_ATTEMPT_SECONDS:
+            budget *= self.ATTEMPT_BUDGET_SHARE
+        return budget
+    
+    def _expected_latency(self, client_name):
+        return self.DEFAULT_EXPECTED_LATENCY
+    
+    def _request_options(self, client_name, budget):
+        """Таймаут HTTP запроса и число ретраев SDK, которые укладываются в бюджет попытки"""
+        if budget is None:
+            return {}
+        # На каждый запрос (первый и повторы) - не меньше двух обычных задержек провайдера
+        needed = max(MIN_ATTEMPT_SECONDS, 2 * self._expected_latency(client_name))
+        retries = max(0, min(self.clients[client_name].max_retries, int(budget // needed) - 1))
+        return {"timeout": budget / (retries + 1), "max_retries": retries}
+    
+    def _call_sync(self, client_name, prompt, max_tokens, temperature, budget=None):
+        """Вызвать клиента с учетом предохранителя. None, если предохранитель не пропустил."""
+        breaker = self.breakers[client_name]
+        if not breaker.allow_request():
+            return None
+        started = time.monotonic()
+        try:
+            result = self.clients[client_name].get_completion(prompt, max_tokens, temperature,
+                                                              **self._request_options(client_name, budget))
+        except Exception:
+            breaker.record_failure()
+            self.provider_stats[client_name].record(success=False)
+            raise
+        latency = time.monotonic() - started
+        breaker.record_success(latency)
+        self.provider_stats[client_name].record(success=True, latency=latency)
+        return result
+    
+    def get_completion(self, prompt: Prompt, max_tokens: int = 50, temperature: float = 0.9) -> str:
+        """Получить ответ от AI с fallback логикой"""
+        primary_client, fallback_order = self._get_attempt_order()
+        
         if not primary_client:
             logger.error("[MultiAI] Нет доступных AI клиентов!")
-            return "Омлет с овощами"  # fallback блюдо
+            return self.fallback_answer
         
         # Пробуем основной клиент
+        budget = self._attempt_budget(len(fallback_order))
+        if budget == 0:
+            logger.warning("[MultiAI] Бюджет времени исчерпан, ответ без AI")
+            return self.fallback_answer
         try:
-            logger.info(f"[MultiAI] Используем основной клиент: {primary_client}")
-            result = self.clients[primary_client].get_completion(prompt, max_tokens, temperature)
+            logger.debug("[MultiAI] Используем основной клиент: %s", primary_client)
+            result = self._call_sync(primary_client, prompt, max_tokens, temperature, budget)
             if result and result.strip():
                 return result
         except Exception as e:
             logger.warning(f"[MultiAI] Основной клиент {primary_client} не сработал: {e}")
         
-        # Пробуем fallback клиенты
-        for fallback_client in fallback_order:
+        # Пробуем fallback клиенты, пока хватает бюджета
+        for index, fallback_client in enumerate(fallback_order):
+            budget = self._attempt_budget(len(fallback_order) - index - 1)
+            if budget == 0:
+                break
             try:
-                logger.info(f"[MultiAI] Пробуем fallback клиент: {fallback_client}")
-                result = self.clients[fallback_client].get_completion(prompt, max_tokens, temperature)
+                logger.debug("[MultiAI] Пробуем fallback клиент: %s", fallback_client)
+                result = self._call_sync(fallback_client, prompt, max_tokens, temperature, budget)
                 if result and result.strip():
-                    logger.info(f"[MultiAI] Успешно получен ответ от {fallback_client}")
+                    logger.debug("[MultiAI] Успешно получен ответ от %s", fallback_client)
                     return result
             except Exception as e:
                 logger.warning(f"[MultiAI] Fallback клиент {fallback_client} не сработал: {e}")
         
         # Если все клиенты не сработали
-        logger.error("[MultiAI] Все AI клиенты не сработали!")
-        return "Омлет с овощами"  # fallback блюдо
+        if not has_attempt_budget():
+            # Попытки съели бюджет (таймауты по дедлайну) - ответ без AI из-за дедлайна
+            mark_exhausted()
+        if is_exhausted():
+            logger.warning("[MultiAI] Бюджет времени исчерпан, ответ без AI")
+        else:
+            logger.error("[MultiAI] Все AI клиенты не сработали!")
+        return self.fallback_answer
     
     def get_active_provider(self) -> str:
         """Получить информацию об активном провайдере"""
         if self.provider == "mixed":
-            return f"Mixed ({', '.join(self.clients.keys())})"
+            return f"Mixed/{self.router.name} ({', '.join(self.clients.keys())})"
         elif self.provider in self.clients:
             return self.clients[self.provider].get_provider_name()
         else:
-            return "Unknown"
\ No newline at end of file
+            return "Unknown"
+    
+    def get_stats(self) -> dict:
+        """Состояние предохранителей провайдеров"""
+        return {
+            "provider": self.get_active_provider(),
+            "breakers": {name: breaker.get_stats() for name, breaker in self.breakers.items()},
+            "routing": {
+                "policy": self.router.name,
+                "providers": {name: stats.as_dict() for name, stats in self.provider_stats.items()},
+            },
+            "http": self.http_transport.get_stats() if self.http_transport else None,
+        }
+
+class AsyncMultiAIClient(MultiAIClient):
+    """Асинхронный клиент с поддержкой множественных AI провайдеров.
+    
+    Пока идет запрос к провайдеру, event loop бота продолжает
+    обрабатывать обновления других пользователей.
+    
+    В режиме хеджирования (hedge_percentile) тот же промпт отправляется
+    следующему провайдеру, если основной не ответил за время, которое
+    укладывается в заданный перцентиль его задержек. Берется первый ответ,
+    остальные запросы отменяются. Доля хеджированных запросов ограничена
+    бюджетом hedge_budget.
+    
+    rate_limits задает для провайдера лимиты запросов и токенов в минуту
+    (параметры FairRateLimiter). Запрос, не дождавшийся лимита, считается
+    неудачным без штрафа для предохранителя, и берется следующий провайдер.
+    """
+    
+    deepseek_client_class = AsyncDeepSeekClient
+    openai_client_class = AsyncOpenAIClient
+    
+    # Сколько последних задержек хранить и сколько нужно для расчета перцентиля
+    LATENCY_WINDOW = 100
+    MIN_LATENCY_SAMPLES = 10
+    # Запас бюджета хеджирования (сколько хеджей можно сделать подряд)
+    MAX_HEDGE_TOKENS = 5.0
+    # Грубая оценка токенов промпта для лимита токенов в минуту (русский текст)
+    CHARS_PER_TOKEN = 3
+    
+    def __init__(self, openai_key: Optional[str] = None, deepseek_key: str = None, provider: str = "deepseek",
+                 breaker_settings: Optional[dict] = None, routing: str = "weighted",
+                 routing_options: Optional[dict] = None, fallback_answer: str = "Омлет с овощами",
+                 base_urls: Optional[dict] = None, hedge_percentile: Optional[float] = None,
+                 hedge_budget: float = 0.1, hedge_default_delay: float = 3.0,
+                 rate_limits: Optional[dict] = None, http_transport=None):
+        super().__init__(openai_key=openai_key, deepseek_key=deepseek_key, provider=provider,
+                         breaker_settings=breaker_settings, routing=routing, routing_options=routing_options,
+                         fallback_answer=fallback_answer, base_urls=base_urls, http_transport=http_transport)
+        self.hedge_percentile = hedge_percentile
+        self.hedge_budget = hedge_budget
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_tokens = self.MAX_HEDGE_TOKENS
+        self.latencies = {name: deque(maxlen=self.LATENCY_WINDOW) for name in self.clients}
+        self.hedge_stats = {"requests": 0, "hedges": 0, "hedge_wins": 0}
+        self.last_used = {name: 0.0 for name in self.clients}  # время последнего обращения к провайдеру
+        self.rate_limiters = {
+            name: FairRateLimiter(self.clients[name].get_provider_name(), **settings)
+            for name, settings in (rate_limits or {}).items()
+            if name in self.clients and (settings.get("requests_per_minute") or settings.get("tokens_per_minute"))
+        }
+        if hedge_percentile:
+            logger.info(f"[MultiAI] Хеджирование: p{hedge_percentile * 100:.0f}, бюджет {hedge_budget:.0%}")
+    
+    def _http_client(self, http_transport):
+        return http_transport.async_client()
+    
+    async def warm_up(self, names=None):
+        """Открыть соединения с провайдерами заранее, чтобы первый запрос не ждал TCP/TLS.
+        
+        Ошибки только пишутся в лог: прогрев не должен мешать запуску бота.
+        """
+        names = [name for name in (names or self.clients) if self.breakers[name].is_available()]
+        results = await asyncio.gather(*(self.clients[name].ping() for name in names), return_exceptions=True)
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logger.warning(f"[MultiAI] Прогрев {name} не удался: {type(result).__name__}: {result}")
+            else:
+                self.last_used[name] = time.monotonic()
+    
+    async def keep_alive(self, idle_seconds):
+        """Пинговать провайдеров, к которым не обращались дольше idle_seconds (работает до отмены).
+        
+        Соединения в пуле не успевают закрыться по keep-alive таймауту, и первый
+        запрос после простоя не платит за новое соединение.
+        """
+        while True:
+            await asyncio.sleep(idle_seconds / 2)
+            now = time.monotonic()
+            idle = [name for name, used in self.last_used.items() if now - used >= idle_seconds]
+            if idle:
+                await self.warm_up(idle)
+    
+    async def aclose(self):
+        """Закрыть соединения общего пула и остановить потоки общего состояния предохранителей"""
+        for breaker in self.breakers.values():
+            await asyncio.to_thread(breaker.close)
+        if self.http_transport:
+            await self.http_transport.aclose()
+    
+    async def get_completion(self, prompt: Prompt, max_tokens: int = 50, temperature: float = 0.9) -> str:
+        """Получить ответ от AI с fallback логикой"""
+        primary_client, fallback_order = self._get_attempt_order()
+        
+        if not primary_client:
+            logger.error("[MultiAI] Нет доступных AI клиентов!")
+            return self.fallback_answer
+        
+        result = await self._get_completion_hedged([primary_client] + fallback_order, prompt, max_tokens, temperature)
+        if result:
+            return result
+        
+        # Если все клиенты не сработали
+        if not has_attempt_budget():
+            # Попытки съели бюджет (таймауты по дедлайну) - ответ без AI из-за дедлайна
+            mark_exhausted()
+        if is_exhausted():
+            logger.warning("[MultiAI] Бюджет времени исчерпан, ответ без AI")
+        else:
+            logger.error("[MultiAI] Все AI клиенты не сработали!")
+        return self.fallback_answer
+    
+    def _expected_latency(self, client_name):
+        samples = self.latencies.get(client_name)
+        if not samples or len(samples) < self.MIN_LATENCY_SAMPLES:
+            return self.DEFAULT_EXPECTED_LATENCY
+        return sorted(samples)[len(samples) // 2]
+    
+    async def _call_client(self, client_name, prompt, max_tokens, temperature, budget=None):
+        """Запрос к провайдеру; budget - секунды на всю попытку, включая ожидание лимита"""
+        breaker = self.breakers[client_name]
+        limiter = self.rate_limiters.get(client_name)
+        attempt_started = time.monotonic()
+        if limiter:
+            try:
+                # Провайдеры считают в лимит токенов и max_tokens ответа
+                with tracer.span("queue_wait", provider=client_name):
+                    prompt_chars = sum(len(message["content"]) for message in to_messages(prompt))
+                    max_wait = budget - MIN_ATTEMPT_SECONDS if budget is not None else None
+                    await limiter.acquire(prompt_chars // self.CHARS_PER_TOKEN + max_tokens, max_wait=max_wait)
+            except (RateLimitExceeded, asyncio.CancelledError):
+                breaker.record_cancelled()
+                raise
+        if budget is not None:
+            budget -= time.monotonic() - attempt_started
+            if budget < MIN_ATTEMPT_SECONDS:
+                mark_exhausted()
+                breaker.record_cancelled()
+                raise DeadlineExceeded(f"{client_name}: бюджет исчерпан в очереди лимита")
+        started = self.last_used[client_name] = time.monotonic()
+        try:
+            with tracer.span("provider_call", provider=client_name):
+                call = self.clients[client_name].get_completion(prompt, max_tokens, temperature,
+                                                                **self._request_options(client_name, budget))
+                # Таймаут SDK ограничивает отдельные операции чтения, а не весь запрос - ограничиваем целиком
+                result = await (asyncio.wait_for(call, budget) if budget is not None else call)
+        except asyncio.CancelledError:
+            breaker.record_cancelled()
+            # Отмененный запрос (проиграл хедж) шел не меньше elapsed: без этой цензурированной
+            # оценки в окне остаются только быстрые ответы и порог хеджа сползает вниз
+            elapsed = time.monotonic() - started
+            if self.hedge_percentile and elapsed >= self._hedge_delay(client_name):
+                self.latencies[client_name].append(elapsed)
+            raise
+        except asyncio.TimeoutError:
+            ai_request_errors.inc(self.clients[client_name].get_provider_name(), "DeadlineExceeded")
+            breaker.record_failure()
+            self.provider_stats[client_name].record(success=False)
+            raise DeadlineExceeded(f"{client_name}: нет ответа за {budget:.1f}с")
+        except Exception:
+            breaker.record_failure()
+            self.provider_stats[client_name].record(success=False)
+            raise
+        latency = time.monotonic() - started
+        self.latencies[client_name].append(latency)
+        breaker.record_success(latency)
+        self.provider_stats[client_name].record(success=True, latency=latency)
+        return result
+    
+    def _hedge_delay(self, client_name):
+        """Через сколько секунд без ответа от клиента стоит отправить хедж"""
+        samples = self.latencies.get(client_name)
+        if not samples or len(samples) < self.MIN_LATENCY_SAMPLES:
+            return self.hedge_default_delay
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(self.hedge_percentile * len(ordered)))
+        return ordered[index]
+    
+    async def _get_completion_hedged(self, order, prompt, max_tokens, temperature):
+        """Опросить клиентов по порядку, при медленном ответе запуская хедж. None если никто не ответил."""
+        remaining = list(order)
+        pending = {}  # задача -> имя клиента
+        hedged = False
+        
+        # Каждый запрос пополняет бюджет хеджирования на hedge_budget
+        self.hedge_stats["requests"] += 1
+        self.hedge_tokens = min(self.MAX_HEDGE_TOKENS, self.hedge_tokens + self.hedge_budget)
+        
+        def launch():
+            while remaining:
+                budget = self._attempt_budget(len(remaining) - 1)
+                if budget == 0:
+                    # Fallback и хедж не успеют ответить до дедлайна
+                    tracer.event("[MultiAI] Бюджет времени исчерпан, клиенты %s не вызываются", remaining)
+                    remaining.clear()
+                    return False
+                client_name = remaining.pop(0)
+                if not self.breakers[client_name].allow_request():
+                    tracer.event("[MultiAI] Клиент %s пропущен: предохранитель открыт", client_name)
+                    continue
+                tracer.event("[MultiAI] Используем клиент: %s", client_name)
+                task = asyncio.ensure_future(self._call_client(client_name, prompt, max_tokens, temperature,
+                                                               budget))
+                pending[task] = client_name
+                return True
+            return False
+        
+        try:
+            while pending or remaining:
+                if not pending:
+                    # Предыдущие клиенты упали - обычный fallback, бюджет не тратим
+                    if not launch():
+                        break
+                    continue
+                
+                can_hedge = bool(self.hedge_percentile) and bool(remaining) and self.hedge_tokens >= 1
+                timeout = self._hedge_delay(order[0]) if can_hedge else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not done:
+                    if launch():
+                        tracer.event("[MultiAI] Нет ответа за %.2fс, запрос захеджирован", timeout)
+                        self.hedge_tokens -= 1
+                        self.hedge_stats["hedges"] += 1
+                        hedged = True
+                    continue
+                
+                for task in done:
+                    client_name = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        logger.warning(f"[MultiAI] Клиент {client_name} не сработал: {e}")
+                        continue
+                    if result and result.strip():
+                        if hedged and client_name != order[0]:
+                            self.hedge_stats["hedge_wins"] += 1
+                        return result
+            return None
+        finally:
+            # Отменяем проигравшие запросы
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+    
+    def get_hedge_stats(self) -> dict:
+        """Статистика хеджирования и текущие пороги задержки по клиентам"""
+        stats = dict(self.hedge_stats)
+        stats["hedge_delays"] = {name: round(self._hedge_delay(name), 3) for name in self.clients}
+        return stats
+    
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        stats["hedging"] = self.get_hedge_stats()
+        stats["rate_limits"] = {name: limiter.get_stats() for name, limiter in self.rate_limiters.items()}
+        return stats
@@ -1,115 +1,618 @@
-from config import OPENAI_API_KEY, DEEPSEEK_API_KEY, AI_PROVIDER
-from memory_manager import dish_memory
+from config import (OPENAI_API_KEY, DEEPSEEK_API_KEY, AI_PROVIDER, MENU_CONCURRENCY, MENU_MODE,
+                    DISH_POOL_LOW, DISH_POOL_HIGH, DISH_POOL_TTL, HISTORY_DB_PATH, HISTORY_CACHE_SIZE,
+                    DISH_HISTORY_SIZE, SIMILARITY_THRESHOLD, SIMILARITY_RETRIES,
+                    HEDGE_PERCENTILE, HEDGE_BUDGET, HEDGE_DEFAULT_DELAY,
+                    BREAKER_FAILURE_RATE, BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_OPEN_SECONDS,
+                    BREAKER_SLOW_CALL_SECONDS, AI_ROUTING, ROUTING_EXPLORATION, ROUTING_MAX_COST_PER_1K,
+                    DISH_CATALOG_LEARNED_PATH, DEEPSEEK_BASE_URL, OPENAI_BASE_URL, DEEPSEEK_RPM, DEEPSEEK_TPM,
+                    OPENAI_RPM, OPENAI_TPM, AI_QUEUE_SIZE, AI_QUEUE_PER_USER, AI_QUEUE_TIMEOUT,
+                    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP2,
+                    STATE_BACKEND, STATE_PATH, REDIS_URL)
+from memory_manager import format_avoid_text
+from history_store import HistoryStore
+from shared_state import create_state
+from dish_similarity import normalize_dish, similarity, similarity_stats
 from prompt_variations import prompt_generator
-from ai_clients import MultiAIClient
+from rate_limiter import current_user
+from deadline import current_deadline, has_attempt_budget, mark_exhausted
+from dish_pool import DishPool
+from dish_catalog import DishCatalog
+from tracing import tracer
+from metrics import (ai_request_seconds, ai_request_errors, ai_tokens, handler_seconds, ai_queue_wait_seconds,
+                     ai_prompt_cache_seconds)
 
+import asyncio
+import json
 import logging
 import os
+import re
+import threading
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Инициализация универсального AI клиента
-try:
-    client = MultiAIClient(
-        openai_key=OPENAI_API_KEY,
-        deepseek_key=DEEPSEEK_API_KEY,
-        provider=AI_PROVIDER
-    )
-    logger.info(f"🤖 AI клиент инициализирован: {client.get_active_provider()}")
-except Exception as e:
-    logger.error(f"Ошибка инициализации AI клиента: {e}")
-    # Fallback на простой OpenAI клиент
-    from ai_clients import OpenAIClient
-    client = OpenAIClient(OPENAI_API_KEY)
-    logger.warning("⚠️ Используется fallback OpenAI клиент")
-
-def get_random_dish(meal_type):
-    """Получить случайное блюдо для завтрака, обеда или ужина"""
+# Параметры политики маршрутизации для режима mixed
+routing_options = {
+    "weighted": {"exploration": ROUTING_EXPLORATION},
+    "cost_bounded": {"max_cost_per_1k": ROUTING_MAX_COST_PER_1K},
+}.get(AI_ROUTING, {})
+
+# Лимиты провайдеров и справедливая очередь запросов
+queue_settings = {"max_queue": AI_QUEUE_SIZE, "max_queue_per_user": AI_QUEUE_PER_USER, "max_wait": AI_QUEUE_TIMEOUT}
+rate_limits = {
+    "deepseek": {"requests_per_minute": DEEPSEEK_RPM, "tokens_per_minute": DEEPSEEK_TPM, **queue_settings},
+    "openai": {"requests_per_minute": OPENAI_RPM, "tokens_per_minute": OPENAI_TPM, **queue_settings},
+}
+
+# AI клиент создается при первом запросе: импорт openai и создание SDK клиентов
+# не замедляют импорт модуля, а в офлайн режиме не происходят вовсе
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Получить универсальный AI клиент (создается при первом вызове, потокобезопасно)"""
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            _client = _create_client()
+    return _client
+
+def _create_client():
+    from ai_clients import AsyncMultiAIClient
+    from http_transport import HTTPTransport
+    try:
+        client = AsyncMultiAIClient(
+            openai_key=OPENAI_API_KEY,
+            deepseek_key=DEEPSEEK_API_KEY,
+            provider=AI_PROVIDER,
+            breaker_settings={
+                "failure_rate": BREAKER_FAILURE_RATE,
+                "window": BREAKER_WINDOW,
+                "min_calls": BREAKER_MIN_CALLS,
+                "open_seconds": BREAKER_OPEN_SECONDS,
+                "slow_call_seconds": BREAKER_SLOW_CALL_SECONDS,
+                # Открытый предохранитель видят все воркеры; с local состоянием делиться не с кем
+                "shared": get_shared_state() if STATE_BACKEND in ("sqlite", "redis") else None,
+            },
+            routing=AI_ROUTING,
+            routing_options=routing_options,
+            fallback_answer="",  # пустой ответ - блюдо подберем из локального каталога
+            base_urls={"deepseek": DEEPSEEK_BASE_URL, "openai": OPENAI_BASE_URL},
+            hedge_percentile=HEDGE_PERCENTILE,
+            hedge_budget=HEDGE_BUDGET,
+            hedge_default_delay=HEDGE_DEFAULT_DELAY,
+            rate_limits=rate_limits,
+            http_transport=HTTPTransport(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive=HTTP_MAX_KEEPALIVE,
+                                         keepalive_expiry=HTTP_KEEPALIVE_EXPIRY, http2=HTTP2)
+        )
+        logger.info(f"🤖 AI клиент инициализирован: {client.get_active_provider()}")
+    except Exception as e:
+        logger.error(f"Ошибка инициализации AI клиента: {e}")
+        # Fallback на простой OpenAI клиент
+        from ai_clients import AsyncOpenAIClient
+        client = AsyncOpenAIClient(OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+        logger.warning("⚠️ Используется fallback OpenAI клиент")
+    return client
+
+async def close_client():
+    """Закрыть соединения AI клиента, если он создавался"""
+    if hasattr(_client, "aclose"):
+        await _client.aclose()
+
+MEAL_TYPES = ["завтрак", "обед", "ужин"]
+WEEK_DAYS = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+TODAY = "Сегодня"
+FALLBACK_DISH = "Омлет с овощами"
+
+# Ограничение длины названия блюда (ответы длиннее не попадают в каталог и batch меню)
+MAX_DISH_NAME_LENGTH = 80
+MAX_DISH_NAME_WORDS = 7
+
+# AI_PROVIDER=offline - блюда только из локального каталога, без запросов к AI
+OFFLINE_MODE = AI_PROVIDER == "offline"
+
+# Сколько раз переспрашиваем AI, если блюдо уже есть в текущем меню
+MENU_DUPLICATE_RETRIES = 2
+
+# Хранилища создаются при первом обращении (или при сборке приложения в bot.build_application),
+# а не при импорте: импорт модуля не открывает базы и не запускает потоки
+_shared_state = None
+_history_store = None
+_dish_catalog = None
+_storage_lock = threading.Lock()
+
+def get_shared_state():
+    """Общее состояние воркеров (см. update_router); с Redis в нем же хранится история блюд"""
+    global _shared_state
+    if _shared_state is not None:
+        return _shared_state
+    with _storage_lock:
+        if _shared_state is None:
+            _shared_state = create_state(STATE_BACKEND, path=STATE_PATH, url=REDIS_URL)
+    return _shared_state
+
+def get_history_store():
+    """Персональная история блюд для каждого чата (SQLite история и так доступна всем процессам хоста)"""
+    global _history_store
+    if _history_store is not None:
+        return _history_store
+    state = get_shared_state() if STATE_BACKEND == "redis" else None
+    with _storage_lock:
+        if _history_store is None:
+            _history_store = HistoryStore(HISTORY_DB_PATH, cache_size=HISTORY_CACHE_SIZE,
+                                          history_size=DISH_HISTORY_SIZE, state=state)
+    return _history_store
+
+def get_dish_catalog():
+    """Локальный каталог блюд: запасной вариант при сбоях AI и источник для офлайн режима"""
+    global _dish_catalog
+    if _dish_catalog is not None:
+        return _dish_catalog
+    with _storage_lock:
+        if _dish_catalog is None:
+            _dish_catalog = DishCatalog(learned_path=DISH_CATALOG_LEARNED_PATH)
+    return _dish_catalog
+
+def close_storage():
+    """Сохранить и закрыть созданные хранилища"""
+    global _shared_state, _history_store, _dish_catalog
+    if _history_store is not None:
+        _history_store.close()
+        _history_store = None
+    if _dish_catalog is not None:
+        _dish_catalog.save()
+        _dish_catalog = None
+    if _shared_state is not None:
+        # Потоки предохранителей перестают читать общее состояние до его закрытия
+        for breaker in getattr(_client, "breakers", {}).values():
+            breaker.close()
+        _shared_state.close()
+        _shared_state = None
+
+async def get_memory(chat_id=None):
+    """Память блюд чата (chat_id=None - общая память без привязки к пользователю)"""
+    return await get_history_store().get_memory(chat_id if chat_id is not None else 0)
+
+async def _request_dish(meal_type, memory=None, extra_avoid=None):
+    """Запросить у AI название блюда (без записи в память). None при ошибке.
+    
+    Ответ, похожий на блюдо из истории или из extra_avoid, запрашивается
+    повторно (не больше SIMILARITY_RETRIES раз).
+    """
+    extra_avoid = list(extra_avoid or [])
     
-    # Получаем список блюд для избежания
-    avoid_text = dish_memory.get_avoid_list_text(meal_type)
-    logger.info(f"[AI DEBUG] Избегаем для {meal_type}: {avoid_text}")
+    if OFFLINE_MODE:
+        return _fallback_dish(meal_type, memory, extra_avoid)
+    
+    # До дедлайна обработчика ответ AI уже не успеет - вызывающий возьмет блюдо из каталога
+    if not has_attempt_budget():
+        mark_exhausted()
+        return None
     
     # Проверяем API ключ
     api_key = os.getenv('OPENAI_API_KEY') or OPENAI_API_KEY
     if not api_key or api_key == 'your_openai_key_here':
         logger.error("[AI ERROR] OpenAI API ключ не найден или не установлен!")
-        return "Омлет с овощами"
-    
-    logger.info(f"[AI DEBUG] API ключ найден, длина: {len(api_key)} символов")
-    
-    # Генерируем случайный промпт с учетом избегаемых блюд
-    prompt = prompt_generator.get_random_prompt(meal_type, avoid_text)
-    logger.info(f"[AI DEBUG] Промпт: {prompt[:100]}...")
+        return None
     
-    try:
-        logger.info("[AI DEBUG] Отправляем запрос к AI...")
-        dish_name = client.get_completion(
-            prompt=prompt,
-            max_tokens=50,
-            temperature=0.9
-        )
+    dish_name = None
+    for attempt in range(SIMILARITY_RETRIES + 1):
+        with tracer.span("prompt_build", meal=meal_type):
+            # Получаем список блюд для избежания
+            if memory is not None:
+                avoid_text = memory.get_avoid_list_text(meal_type, extra_avoid)
+            else:
+                avoid_text = format_avoid_text(extra_avoid)
+            
+            # Генерируем случайный промпт с учетом избегаемых блюд
+            prompt = prompt_generator.get_random_prompt(meal_type, avoid_text)
+        
+        try:
+            dish_name = await get_client().get_completion(
+                prompt=prompt,
+                max_tokens=50,
+                temperature=0.9
+            )
+        except Exception as e:
+            logger.error("[AI ERROR] Ошибка AI: %s: %s", type(e).__name__, e)
+            return None
         
-        logger.info(f"[AI DEBUG] Ответ AI: '{dish_name}'")
+        tracer.event("[AI] Ответ AI для %s: '%s'", meal_type, dish_name)
         
         # Проверяем что ответ не пустой
         if not dish_name:
-            logger.warning("[AI DEBUG] Пустой ответ от AI!")
-            return "Омлет с овощами"
+            logger.warning("[AI] Пустой ответ от AI")
+            return None
         
-        # Сохраняем блюдо в память для избежания повторов
-        dish_memory.add_dish(meal_type, dish_name)
-        logger.info(f"[AI DEBUG] Сохранено в память: {dish_name}")
+        similar = _find_similar(meal_type, dish_name, memory, extra_avoid)
+        # Переспрашиваем, только если до дедлайна успеем получить еще один ответ
+        rejected = similar is not None and attempt < SIMILARITY_RETRIES and has_attempt_budget()
+        similarity_stats.record(hit=similar is not None, rejected=rejected)
+        if not rejected:
+            break
+        tracer.event("[AI] '%s' похоже на '%s' (%.2f), запрашиваем заново", dish_name, similar[0], similar[1])
+        extra_avoid.append(dish_name)
+    
+    if _is_valid_dish_name(dish_name):
+        get_dish_catalog().record(meal_type, dish_name)
+    return dish_name
+
+def _is_valid_dish_name(dish_name):
+    """Похож ли ответ AI на название блюда (а не на объяснение или список)"""
+    return (len(dish_name) <= MAX_DISH_NAME_LENGTH
+            and len(dish_name.split()) <= MAX_DISH_NAME_WORDS
+            and "\n" not in dish_name)
+
+def _fallback_dish(meal_type, memory=None, extra_avoid=None):
+    """Блюдо из локального каталога без повторов недавней истории"""
+    avoid = list(extra_avoid or [])
+    reject = None
+    if memory is not None:
+        avoid += memory.get_recent_dishes(meal_type)
+        reject = lambda dish: memory.find_similar(meal_type, dish, SIMILARITY_THRESHOLD) is not None
+    dish_catalog = get_dish_catalog()
+    dish_name = (dish_catalog.pick(meal_type, avoid=avoid, reject=reject)
+                 or dish_catalog.pick(meal_type, avoid=avoid))
+    return dish_name or FALLBACK_DISH
+
+def _find_similar(meal_type, dish_name, memory=None, extra_avoid=None):
+    """Найти похожее блюдо в истории чата или в списке extra_avoid"""
+    if memory is not None:
+        similar = memory.find_similar(meal_type, dish_name, SIMILARITY_THRESHOLD)
+        if similar:
+            return similar
+    tokens = normalize_dish(dish_name)
+    for other in extra_avoid or []:
+        score = similarity(tokens, normalize_dish(other))
+        if score >= SIMILARITY_THRESHOLD:
+            return other, score
+    return None
+
+async def get_random_dish(meal_type, chat_id=None):
+    """Получить случайное блюдо для завтрака, обеда или ужина"""
+    current_user.set(chat_id)
+    memory = await get_memory(chat_id)
+    dish_name = await _request_dish(meal_type, memory) or _fallback_dish(meal_type, memory)
+    
+    # Сохраняем блюдо в память для избежания повторов
+    memory.add_dish(meal_type, dish_name)
+    tracer.event("[AI] Сохранено в память: %s", dish_name)
+    
+    return dish_name
+
+async def _generate_pool_dish(meal_type):
+    """Сгенерировать блюдо для буфера, не повторяя уже лежащие в нем"""
+    # Буфер наполняется в фоне: дедлайн обработчика, запустившего наполнение, к нему не относится
+    current_deadline.set(None)
+    return await _request_dish(meal_type, extra_avoid=dish_pool.peek(meal_type))
+
+# Буфер готовых блюд для мгновенного ответа на "Другое блюдо"
+dish_pool = DishPool(
+    _generate_pool_dish,
+    low_watermark=DISH_POOL_LOW,
+    high_watermark=DISH_POOL_HIGH,
+    ttl=DISH_POOL_TTL
+)
+
+async def get_dish_fast(meal_type, chat_id=None):
+    """Получить блюдо из буфера, а если буфер пуст - запросить у AI"""
+    memory = await get_memory(chat_id)
+    dish_name = dish_pool.pop(
+        meal_type,
+        avoid=memory.get_recent_dishes(meal_type),
+        reject=lambda dish: memory.find_similar(meal_type, dish, SIMILARITY_THRESHOLD) is not None
+    )
+    if not dish_name:
+        return await get_random_dish(meal_type, chat_id)
+    
+    memory.add_dish(meal_type, dish_name)
+    tracer.event("[AI] Блюдо из буфера сохранено в память: %s", dish_name)
+    return dish_name
+
+async def _generate_menu_slots(slots, memory, concurrency=None, chosen=None, on_result=None):
+    """Параллельно сгенерировать блюда для списка слотов [(ключ, тип приема пищи)].
+    
+    Места в памяти резервируются заранее в порядке слотов, а повторы внутри
+    меню отсекаются по мере получения ответов, поэтому одновременные запросы
+    не приводят к одинаковым блюдам в одном меню. on_result(ключ, блюдо)
+    вызывается для каждого слота сразу по готовности.
+    """
+    semaphore = asyncio.Semaphore(concurrency or MENU_CONCURRENCY)
+    if chosen is None:
+        chosen = {meal_type: [] for meal_type in MEAL_TYPES}
+    reserved = {key: memory.reserve_slot(meal_type) for key, meal_type in slots}
+    results = {}
+    
+    async def generate_slot(key, meal_type):
+        taken = chosen.setdefault(meal_type, [])
+        dish_name = None
+        for attempt in range(MENU_DUPLICATE_RETRIES + 1):
+            async with semaphore:
+                dish_name = await _request_dish(meal_type, memory, extra_avoid=taken)
+            if not dish_name:
+                break
+            # Проверка и запись без await между ними - атомарны для event loop
+            if _find_similar(meal_type, dish_name, extra_avoid=taken) is None:
+                break
+            tracer.event("[MENU] Повтор '%s' в меню, попытка %d", dish_name, attempt + 1)
+            if attempt == MENU_DUPLICATE_RETRIES or not has_attempt_budget():
+                # Повтор не принимаем - берем блюдо из каталога без блюд этого меню
+                dish_name = None
+                break
         
-        return dish_name
+        slot = reserved[key]
+        if not dish_name:
+            dish_name = _fallback_dish(meal_type, memory, taken)
         
-    except Exception as e:
-        logger.error(f"[AI ERROR] Ошибка AI: {type(e).__name__}: {e}")
-        logger.error(f"[AI ERROR] Полная ошибка: {str(e)}")
-        return "Омлет с овощами"  # fallback вариант
+        taken.append(dish_name)
+        if slot:
+            memory.fill_slot(slot, dish_name)
+        results[key] = dish_name
+        if on_result:
+            on_result(key, dish_name)
+    
+    try:
+        await asyncio.gather(*(generate_slot(key, meal_type) for key, meal_type in slots))
+    except asyncio.CancelledError:
+        # Генерацию отменил более новый запрос - незаполненные места освобождаем
+        for key, slot in reserved.items():
+            if slot and key not in results:
+                memory.release_slot(slot)
+        raise
+    return results
 
-def generate_weekly_menu():
-    """Сгенерировать меню на неделю"""
-    days = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
-    menu = {}
+def _parse_menu_json(text, days, memory=None):
+    """Разобрать JSON меню от AI. Возвращает {(день, прием пищи): блюдо} только для валидных слотов.
+    
+    Слот невалиден, если блюдо не похоже на название (см. _is_valid_dish_name),
+    похоже на блюдо из истории memory или на другое блюдо этого меню - такие
+    слоты дозапрашиваются по одному, как и при поблюдной генерации.
+    """
+    # Модели часто оборачивают JSON в ```json ... ```
+    match = re.search(r"\{.*\}", text or "", re.DOTALL)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    
+    parsed = {}
+    accepted = {meal_type: [] for meal_type in MEAL_TYPES}
+    for day in days:
+        meals = data.get(day)
+        if not isinstance(meals, dict):
+            continue
+        for meal_type in MEAL_TYPES:
+            dish_name = meals.get(meal_type)
+            if not isinstance(dish_name, str):
+                continue
+            dish_name = dish_name.strip().strip('"')
+            if not dish_name or not _is_valid_dish_name(dish_name):
+                continue
+            # Повтор истории или блюда этого же меню считаем невалидным слотом
+            similar = _find_similar(meal_type, dish_name, memory, accepted[meal_type])
+            if similar is not None:
+                tracer.event("[MENU] Batch: '%s' похоже на '%s' (%.2f), слот дозапросим",
+                             dish_name, similar[0], similar[1])
+                continue
+            accepted[meal_type].append(dish_name)
+            parsed[(day, meal_type)] = dish_name
+    return parsed
+
+async def _generate_menu_batch(days, memory, on_result=None):
+    """Сгенерировать меню одним запросом к AI, дозапросив только пропущенные слоты"""
+    with tracer.span("prompt_build", meal="menu"):
+        avoid_texts = {meal_type: memory.get_avoid_list_text(meal_type) for meal_type in MEAL_TYPES}
+        prompt = prompt_generator.get_menu_prompt(days, avoid_texts)
     
+    try:
+        answer = await get_client().get_completion(
+            prompt=prompt,
+            max_tokens=60 * len(days) * len(MEAL_TYPES),
+            temperature=0.9
+        )
+    except Exception as e:
+        logger.error(f"[AI ERROR] Ошибка batch генерации: {type(e).__name__}: {e}")
+        answer = ""
+    
+    results = _parse_menu_json(answer, days, memory)
+    tracer.event("[MENU] Batch ответ: валидных слотов %d из %d", len(results), len(days) * len(MEAL_TYPES))
+    
+    chosen = {meal_type: [] for meal_type in MEAL_TYPES}
     for day in days:
-        menu[day] = {
-            "завтрак": get_random_dish("завтрак"),
-            "обед": get_random_dish("обед"), 
-            "ужин": get_random_dish("ужин")
-        }
+        for meal_type in MEAL_TYPES:
+            dish_name = results.get((day, meal_type))
+            if dish_name:
+                chosen[meal_type].append(dish_name)
+                memory.add_dish(meal_type, dish_name)
+                if on_result:
+                    on_result((day, meal_type), dish_name)
+    
+    # Дозапрашиваем только пропущенные или испорченные слоты
+    missing = [((day, meal_type), meal_type) for day in days for meal_type in MEAL_TYPES
+               if (day, meal_type) not in results]
+    if missing:
+        results.update(await _generate_menu_slots(missing, memory, chosen=chosen, on_result=on_result))
     
+    return results
+
+# Виды меню и их дни
+MENU_DAYS = {"week": WEEK_DAYS, "day": [TODAY]}
+
+def _menu_from_results(results, days):
+    return {day: {meal_type: results.get((day, meal_type)) for meal_type in MEAL_TYPES} for day in days}
+
+async def _generate_menu(kind, chat_id=None, on_result=None):
+    """Сгенерировать блюда для меню вида kind в режиме MENU_MODE и запомнить меню чата"""
+    current_user.set(chat_id)
+    days = MENU_DAYS[kind]
+    memory = await get_memory(chat_id)
+    if MENU_MODE == "batch" and not OFFLINE_MODE:
+        results = await _generate_menu_batch(days, memory, on_result=on_result)
+    else:
+        slots = [((day, meal_type), meal_type) for day in days for meal_type in MEAL_TYPES]
+        results = await _generate_menu_slots(slots, memory, on_result=on_result)
+    
+    # Меню сохраняется, чтобы потом перегенерировать отдельный день или блюдо
+    memory.set_menu(kind, _menu_from_results(results, days))
+    return results
+
+async def regenerate_menu(kind, day, meal_type=None, chat_id=None):
+    """Перегенерировать в последнем меню чата один день или одно блюдо.
+    
+    Остальные блюда меню сохраняются и не повторяются в новых.
+    Возвращает обновленное меню {день: {прием пищи: блюдо}} или None, если меню не сохранено.
+    """
+    current_user.set(chat_id)
+    memory = await get_memory(chat_id)
+    menu = memory.get_menu(kind)
+    if not menu or day not in menu:
+        return None
+    
+    # Заменяемые блюда тоже в списке - новое блюдо должно от них отличаться
+    chosen = {meal_type: [meals[meal_type] for meals in menu.values() if meals.get(meal_type)]
+              for meal_type in MEAL_TYPES}
+    slots = [((day, meal), meal) for meal in ([meal_type] if meal_type else MEAL_TYPES)]
+    results = await _generate_menu_slots(slots, memory, chosen=chosen)
+    
+    for (slot_day, meal), dish_name in results.items():
+        menu[slot_day][meal] = dish_name
+    memory.set_menu(kind, menu)
     return menu
 
-def generate_daily_menu():
+async def stream_menu(kind, chat_id=None):
+    """Генерировать меню вида kind как поток (день, прием пищи, блюдо) в порядке готовности.
+    
+    Если потребитель прекращает чтение (или его отменяют), генерация отменяется.
+    """
+    results = asyncio.Queue()
+    generation = asyncio.ensure_future(
+        _generate_menu(kind, chat_id, on_result=lambda key, dish_name: results.put_nowait((*key, dish_name))))
+    getter = None
+    try:
+        while True:
+            if not results.empty():
+                yield results.get_nowait()
+                continue
+            if generation.done():
+                break
+            if getter is None or getter.done():
+                getter = asyncio.ensure_future(results.get())
+            await asyncio.wait({getter, generation}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+        generation.result()  # пробрасываем ошибку генерации, если была
+    finally:
+        if getter and not getter.done():
+            getter.cancel()
+        if not generation.done():
+            generation.cancel()
+            await asyncio.gather(generation, return_exceptions=True)
+
+async def generate_weekly_menu(chat_id=None):
+    """Сгенерировать меню на неделю"""
+    results = await _generate_menu("week", chat_id)
+    return _menu_from_results(results, WEEK_DAYS)
+
+async def generate_daily_menu(chat_id=None):
     """Сгенерировать меню на день"""
-    menu = {
-        "завтрак": get_random_dish("завтрак"),
-        "обед": get_random_dish("обед"), 
-        "ужин": get_random_dish("ужин")
-    }
-    return menu
+    results = await _generate_menu("day", chat_id)
+    return _menu_from_results(results, [TODAY])[TODAY]
+
+# Заглушка для блюда, которое еще генерируется
+PENDING_DISH = "⏳"
 
 def format_daily_menu(menu):
-    """Отформатировать меню на день для отправки в телеграм"""
+    """Отформатировать меню на день для отправки в телеграм (неготовые блюда - PENDING_DISH)"""
     text = "🍽️ *Меню на день:*\n\n"
-    text += f"🌅 *Завтрак:* {menu['завтрак']}\n\n"
-    text += f"☀️ *Обед:* {menu['обед']}\n\n"
-    text += f"🌙 *Ужин:* {menu['ужин']}\n\n"
+    text += f"🌅 *Завтрак:* {menu.get('завтрак') or PENDING_DISH}\n\n"
+    text += f"☀️ *Обед:* {menu.get('обед') or PENDING_DISH}\n\n"
+    text += f"🌙 *Ужин:* {menu.get('ужин') or PENDING_DISH}\n\n"
     text += "Приятного аппетита! 😋"
     return text
 
 def format_weekly_menu(menu):
-    """Отформатировать меню для отправки в телеграм"""
+    """Отформатировать меню для отправки в телеграм (неготовые блюда - PENDING_DISH)"""
     text = "🍽️ *Меню на неделю:*\n\n"
     
     for day, meals in menu.items():
         text += f"*{day}:*\n"
-        text += f"🌅 Завтрак: {meals['завтрак']}\n"
-        text += f"☀️ Обед: {meals['обед']}\n"
-        text += f"🌙 Ужин: {meals['ужин']}\n\n"
+        text += f"🌅 Завтрак: {meals.get('завтрак') or PENDING_DISH}\n"
+        text += f"☀️ Обед: {meals.get('обед') or PENDING_DISH}\n"
+        text += f"🌙 Ужин: {meals.get('ужин') or PENDING_DISH}\n\n"
+    
+    return text
+
+def _format_seconds(value):
+    return "-" if value is None else f"{value:g}с"
+
+def _format_prompt_cache(provider, client):
+    """Строка о кэше промптов провайдера: доля токенов из кэша, средняя задержка и экономия"""
+    hits = ai_prompt_cache_seconds.count(provider, "hit")
+    misses = ai_prompt_cache_seconds.count(provider, "miss")
+    if not hits and not misses:
+        return ""
+    prompt_tokens = ai_tokens.get(provider, "prompt")
+    cached = ai_tokens.get(provider, "cached_prompt")
+    hit_mean = ai_prompt_cache_seconds.mean(provider, "hit")
+    miss_mean = ai_prompt_cache_seconds.mean(provider, "miss")
+    text = (f"  кэш промпта: {hits} из {hits + misses} запросов, "
+            f"{cached / prompt_tokens if prompt_tokens else 0:.0%} токенов, "
+            f"в среднем {_format_seconds(hit_mean and round(hit_mean, 3))} против "
+            f"{_format_seconds(miss_mean and round(miss_mean, 3))} без кэша")
+    for provider_client in getattr(client, "clients", {}).values():
+        if provider_client.get_provider_name() == provider:
+            saved = cached * (provider_client.prompt_cost_per_1k_tokens
+                              - provider_client.cached_prompt_cost_per_1k_tokens) / 1000
+            text += f", сэкономлено ${saved:.4f}"
+    return text + "\n"
+
+def format_stats():
+    """Отформатировать статистику бота для команды /stats"""
+    client = _client  # статистика не должна создавать клиента
+    text = "📊 *Статистика*\n\n*AI провайдеры:*\n"
+    for provider in ("DeepSeek", "OpenAI"):
+        count = ai_request_seconds.count(provider)
+        errors = sum(value for labels, value in ai_request_errors.values.items() if labels[0] == provider)
+        if not count and not errors:
+            continue
+        text += (f"• {provider}: {count} запросов, ошибок {errors}, "
+                 f"p50 ≤ {_format_seconds(ai_request_seconds.quantile(0.5, provider))}, "
+                 f"p95 ≤ {_format_seconds(ai_request_seconds.quantile(0.95, provider))}, "
+                 f"токены {ai_tokens.get(provider, 'prompt')}/{ai_tokens.get(provider, 'completion')}\n")
+        text += _format_prompt_cache(provider, client)
+    
+    text += "\n*Обработчики:*\n"
+    for (handler,), _ in list(handler_seconds.series.items()):
+        text += (f"• `{handler}`: {handler_seconds.count(handler)}, "
+                 f"p50 ≤ {_format_seconds(handler_seconds.quantile(0.5, handler))}, "
+                 f"p95 ≤ {_format_seconds(handler_seconds.quantile(0.95, handler))}\n")
     
-    return text
\ No newline at end of file
+    if hasattr(client, "get_stats"):
+        client_stats = client.get_stats()
+        text += "\n*Предохранители:* " + ", ".join(
+            # Состояние в `...`: "half_open" без кода ломает разметку Markdown
+            f"{name} `{stats['state']}`" for name, stats in client_stats["breakers"].items()) + "\n"
+        for name, limiter in client_stats.get("rate_limits", {}).items():
+            provider = client.clients[name].get_provider_name()
+            wait = ai_queue_wait_seconds.quantile(0.95, provider)
+            text += (f"*Очередь {name}:* сейчас {limiter['queued']}, отклонено {limiter['shed']}, "
+                     f"ожидание p95 ≤ {_format_seconds(wait)}\n")
+        http = client_stats.get("http")
+        if http and http["requests"]:
+            connect = http["connect_seconds"] / http["new_connections"] if http["new_connections"] else None
+            text += (f"*HTTP соединения:* запросов {http['requests']}, по открытым {http['reuse_rate']:.0%}, "
+                     f"новых {http['new_connections']} (установка в среднем "
+                     f"{_format_seconds(connect and round(connect, 3))})\n")
+    
+    pool = dish_pool.get_stats()
+    text += f"*Буфер блюд:* попаданий {pool['hits']}, промахов {pool['misses']}\n"
+    similar = similarity_stats.get_stats()
+    text += f"*Похожие блюда:* найдено {similar['hit_rate']:.0%}, отклонено {similar['rejection_rate']:.0%}\n"
+    return text
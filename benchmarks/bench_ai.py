@@ -0,0 +1,157 @@
+"""Бенчмарк AI слоя против локального стаба: задержки p50/p95/p99 и пропускная способность.
+
+    python benchmarks/bench_ai.py --concurrency 1,10,50 --requests 100 --output bench_ai.json
+    python benchmarks/bench_ai.py --baseline bench_ai.json   # сравнить с прошлым запуском
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from stub_server import StubOpenAIServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = ("random_dish", "daily_menu", "weekly_menu")
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+def summarize(latencies, errors, wall_seconds):
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "mean": sum(latencies) / len(latencies) if latencies else None,
+        "wall_seconds": wall_seconds,
+        "throughput_rps": (len(latencies) / wall_seconds) if wall_seconds else None,
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def prepare_environment(base_url, workdir):
+    """Направить бота на стаб до импорта ai_helper (настройки читаются при импорте)"""
+    os.environ.setdefault("BOT_TOKEN", "benchmark")
+    os.environ["DEEPSEEK_API_KEY"] = "stub"
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["DEEPSEEK_BASE_URL"] = base_url
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["HISTORY_DB_PATH"] = os.path.join(workdir, "history.db")
+    os.environ["DISH_CATALOG_LEARNED_PATH"] = os.path.join(workdir, "learned.json")
+    os.environ["DISH_POOL_HIGH"] = "0"  # меряем сам путь запроса, без буфера
+    os.environ["METRICS_PORT"] = "0"
+    sys.path.insert(0, REPO_ROOT)
+
+async def run_level(ai_helper, target, concurrency, requests, chat_offset):
+    """Выполнить requests операций target при заданной конкурентности"""
+    operations = {
+        "random_dish": lambda chat_id: ai_helper.get_random_dish("обед", chat_id),
+        "daily_menu": lambda chat_id: ai_helper.generate_daily_menu(chat_id),
+        "weekly_menu": lambda chat_id: ai_helper.generate_weekly_menu(chat_id),
+    }
+    operation = operations[target]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    
+    async def one(index):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await operation(chat_offset + index % max(concurrency, 1))
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["target"], r["concurrency"]): r for r in baseline.get("results", [])}
+    print(f"\nСравнение с {baseline_path} (commit {baseline.get('meta', {}).get('commit')}):")
+    for result in results:
+        old = previous.get((result["target"], result["concurrency"]))
+        if not old or not old.get("p95") or not result.get("p95"):
+            continue
+        p95_delta = (result["p95"] / old["p95"] - 1) * 100
+        rps_delta = (result["throughput_rps"] / old["throughput_rps"] - 1) * 100 if old["throughput_rps"] else 0
+        print(f"  {result['target']:<12} c={result['concurrency']:<4} p95 {p95_delta:+.1f}%  rps {rps_delta:+.1f}%")
+
+async def main_async(args):
+    import logging
+    logging.disable(logging.WARNING)  # логи бота искажают замеры
+    import ai_helper
+    
+    results = []
+    chat_offset = 1000
+    for target in args.targets.split(","):
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            summary = await run_level(ai_helper, target, concurrency, args.requests, chat_offset)
+            chat_offset += concurrency + 1
+            summary.update({"target": target, "concurrency": concurrency})
+            results.append(summary)
+            print(f"{target:<12} c={concurrency:<4} p50={summary['p50'] or 0:.3f}s "
+                  f"p95={summary['p95'] or 0:.3f}s p99={summary['p99'] or 0:.3f}s "
+                  f"rps={summary['throughput_rps'] or 0:.1f} errors={summary['errors']}")
+    ai_helper.close_storage()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк AI слоя против локального стаба")
+    parser.add_argument("--latency", default="lognormal:-1.5:0.5", help="распределение задержки стаба")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", default="1,5,10,25,50")
+    parser.add_argument("--requests", type=int, default=50, help="операций на каждый уровень конкурентности")
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--output", default="bench_ai.json")
+    parser.add_argument("--baseline", help="JSON прошлого запуска для сравнения")
+    args = parser.parse_args()
+    
+    stub = StubOpenAIServer(latency=args.latency, error_rate=args.error_rate, seed=42)
+    base_url = stub.start()
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_environment(base_url, workdir)
+        results = asyncio.run(main_async(args))
+    stub.stop()
+    
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "timestamp": time.time(),
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "requests_per_level": args.requests,
+            "stub_requests": stub.stats["requests"],
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты записаны в {args.output}")
+    
+    if args.baseline:
+        compare(results, args.baseline)
+
+if __name__ == "__main__":
+    main()
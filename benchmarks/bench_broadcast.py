@@ -0,0 +1,154 @@
+"""Бенчмарк ежедневной рассылки: подготовка меню заранее против генерации в момент отправки.
+
+Рассылка (broadcast.BroadcastPipeline) идет через настоящий ai_helper против AI стаба
+и фейковый Bot, который, как Telegram, отвечает 429 (RetryAfter) при превышении
+лимита сообщений в секунду. Замеряются длительность отправки, пиковая нагрузка на AI
+провайдера (запросов в секунду) в каждой фазе и число ответов 429.
+    
+    python benchmarks/bench_broadcast.py --subscribers 1000 --prepare-window 300 --output bench_broadcast.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from collections import deque
+
+from bench_ai import git_commit, prepare_environment
+from stub_server import StubOpenAIServer, parse_latency
+
+SEND_TIME = "09:00"
+
+class FakeBot:
+    """Bot с методом send_message: задержка ответа и лимит сообщений в секунду, как у Telegram"""
+    
+    def __init__(self, latency="fixed:0.02", limit_per_second=30, retry_after=1):
+        self.latency = parse_latency(latency)
+        self.limit_per_second = limit_per_second
+        self.retry_after = retry_after
+        self.window = deque()  # время отправки за последнюю секунду
+        self.sent = 0
+        self.rejected = 0
+    
+    async def send_message(self, chat_id, text, **kwargs):
+        from telegram.error import RetryAfter
+        now = time.monotonic()
+        while self.window and self.window[0] <= now - 1.0:
+            self.window.popleft()
+        if len(self.window) >= self.limit_per_second:
+            self.rejected += 1
+            raise RetryAfter(self.retry_after)
+        self.window.append(now)
+        await asyncio.sleep(max(0.0, self.latency()))
+        self.sent += 1
+
+class LoadSampler:
+    """Пиковое число запросов к стабу за скользящую секунду"""
+    
+    def __init__(self, stub, interval=0.1):
+        self.stub = stub
+        self.interval = interval
+        self.samples = deque()
+        self.peak = 0
+        self.task = None
+    
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            self.samples.append((now, self.stub.stats["requests"]))
+            while self.samples[0][0] < now - 1.0:
+                self.samples.popleft()
+            self.peak = max(self.peak, self.samples[-1][1] - self.samples[0][1])
+            await asyncio.sleep(self.interval)
+    
+    def __enter__(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+        return self
+    
+    def __exit__(self, *exc):
+        self.task.cancel()
+
+async def run_scenario(stub, args, workdir, name, prepare):
+    from ai_helper import generate_daily_menu
+    from broadcast import BroadcastPipeline, SubscriptionStore
+    
+    store = SubscriptionStore(os.path.join(workdir, f"{name}.db"))
+    offset = random.randint(1, 10 ** 9)  # новые чаты - без истории прошлых сценариев
+    for chat_id in range(offset, offset + args.subscribers):
+        store.subscribe(chat_id, SEND_TIME)
+    bot = FakeBot(args.telegram_latency, args.telegram_limit)
+    pipeline = BroadcastPipeline(store, generate_daily_menu, lambda menu: {"text": str(menu)},
+                                 batch_size=args.batch_size, prepare_concurrency=args.prepare_concurrency,
+                                 rate=args.rate, senders=args.senders)
+    result = {"scenario": name}
+    
+    if prepare:
+        requests_before = stub.stats["requests"]
+        started = time.perf_counter()
+        with LoadSampler(stub) as sampler:
+            await pipeline.prepare(SEND_TIME, deadline=time.monotonic() + args.prepare_window)
+        result["prepare_seconds"] = time.perf_counter() - started
+        result["prepare_window"] = args.prepare_window
+        result["prepared"] = len(pipeline.prepared.get(SEND_TIME, {}))
+        result["prepare_ai_requests"] = stub.stats["requests"] - requests_before
+        result["prepare_ai_peak_rps"] = sampler.peak
+    
+    requests_before = stub.stats["requests"]
+    started = time.perf_counter()
+    with LoadSampler(stub) as sampler:
+        await pipeline.send(bot, SEND_TIME)
+    result.update({
+        "send_seconds": time.perf_counter() - started,
+        "send_ai_requests": stub.stats["requests"] - requests_before,
+        "send_ai_peak_rps": sampler.peak,
+        "delivered": bot.sent,
+        "failed": pipeline.stats["failed"],
+        "retry_after": bot.rejected,
+        "messages_per_second": bot.sent / (time.perf_counter() - started),
+    })
+    store.close()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк ежедневной рассылки меню")
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--prepare-window", type=float, default=120.0, help="окно подготовки, секунды")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--prepare-concurrency", type=int, default=8, help="пачек подготовки одновременно")
+    parser.add_argument("--rate", type=float, default=25.0, help="лимит отправки рассылки, сообщений в секунду")
+    parser.add_argument("--senders", type=int, default=8)
+    parser.add_argument("--telegram-limit", type=int, default=30, help="лимит фейкового Telegram в секунду")
+    parser.add_argument("--telegram-latency", default="fixed:0.02")
+    parser.add_argument("--ai-latency", default="fixed:1.5", help="задержка AI стаба")
+    parser.add_argument("--output", default="bench_broadcast.json")
+    args = parser.parse_args()
+    
+    stub = StubOpenAIServer(latency=args.ai_latency, seed=42)
+    base_url = stub.start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            prepare_environment(base_url, workdir)
+            for name, prepare in (("prepared", True), ("on_demand", False)):
+                result = asyncio.run(run_scenario(stub, args, workdir, name, prepare))
+                results.append(result)
+                prepared = (f"подготовка {result['prepare_seconds']:.1f}с при окне {args.prepare_window:.0f}с "
+                            f"({result['prepared']}/{args.subscribers}), пик AI {result['prepare_ai_peak_rps']} "
+                            f"запросов/с; " if prepare else "")
+                print(f"{name:>10}: {prepared}отправка {result['send_seconds']:.1f}с "
+                      f"({result['messages_per_second']:.1f} сообщений/с), пик AI {result['send_ai_peak_rps']} "
+                      f"запросов/с, доставлено {result['delivered']}/{args.subscribers}, 429: {result['retry_after']}")
+    finally:
+        stub.stop()
+    
+    report = {
+        "meta": {"commit": git_commit(), "timestamp": time.time(), "args": vars(args)},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Бенчмарк соединений с AI провайдером: первый запрос после старта и после простоя.
+
+Сравниваются отдельные SDK клиенты с транспортом httpx по умолчанию и общий
+пул соединений (http_transport.HTTPTransport) с прогревом и keep-alive пингами.
+Стаб добавляет задержку каждому новому соединению (--connect-latency), имитируя
+DNS/TCP/TLS настоящего API.
+
+    python benchmarks/bench_connections.py --rounds 5 --idle 8 --output bench_connections.json
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from bench_ai import REPO_ROOT, git_commit, percentile
+from stub_server import StubOpenAIServer
+
+PROMPT = "Предложи простое блюдо для обеда."
+
+async def run_scenario(base_url, args, shared):
+    from ai_clients import AsyncMultiAIClient
+    from http_transport import HTTPTransport
+    
+    transport = HTTPTransport(keepalive_expiry=args.keepalive_expiry) if shared else None
+    client = AsyncMultiAIClient(deepseek_key="stub", provider="deepseek", fallback_answer="",
+                                base_urls={"deepseek": base_url}, http_transport=transport)
+    keepalive = None
+    if shared:
+        await client.warm_up()
+        keepalive = asyncio.create_task(client.keep_alive(args.ping))
+    
+    async def timed_request():
+        started = time.perf_counter()
+        await client.get_completion(PROMPT)
+        return time.perf_counter() - started
+    
+    first = await timed_request()
+    after_idle = []
+    for _ in range(args.rounds):
+        await asyncio.sleep(args.idle)
+        after_idle.append(await timed_request())
+    
+    if keepalive:
+        keepalive.cancel()
+        await asyncio.gather(keepalive, return_exceptions=True)
+    result = {
+        "first_request": first,
+        "after_idle_p50": percentile(after_idle, 0.50),
+        "after_idle_max": max(after_idle) if after_idle else None,
+        "after_idle": after_idle,
+        "http": transport.get_stats() if transport else None,
+    }
+    await client.aclose()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк переиспользования соединений с AI провайдером")
+    parser.add_argument("--rounds", type=int, default=5, help="сколько запросов после простоя")
+    parser.add_argument("--idle", type=float, default=8.0, help="простой перед запросом, секунды")
+    parser.add_argument("--ping", type=float, default=4.0, help="пинг после стольких секунд простоя")
+    parser.add_argument("--keepalive-expiry", type=float, default=90.0)
+    parser.add_argument("--latency", default="fixed:0.05", help="задержка ответа стаба")
+    parser.add_argument("--connect-latency", type=float, default=0.15, help="задержка нового соединения")
+    parser.add_argument("--output", default="bench_connections.json")
+    args = parser.parse_args()
+    
+    sys.path.insert(0, REPO_ROOT)
+    results = {}
+    for name, shared in (("default", False), ("shared_pool", True)):
+        stub = StubOpenAIServer(latency=args.latency, seed=42, connect_latency=args.connect_latency)
+        base_url = stub.start()
+        try:
+            results[name] = asyncio.run(run_scenario(base_url, args, shared))
+        finally:
+            stub.stop()
+        results[name]["stub_connections"] = stub.stats["connections"]
+        print(f"{name:>12}: первый запрос {results[name]['first_request']:.3f}с, "
+              f"после простоя p50 {results[name]['after_idle_p50']:.3f}с, "
+              f"соединений {stub.stats['connections']}")
+    
+    report = {
+        "meta": {"commit": git_commit(), "timestamp": time.time(), "args": vars(args)},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
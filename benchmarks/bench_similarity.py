@@ -0,0 +1,91 @@
+"""Бенчмарк поиска похожих блюд (dish_similarity.DishIndex) на тысячах запомненных блюд.
+
+Названия синтетические: блюда каталога и сочетания частых основ ("Курица",
+"Овощи"), способов приготовления и гарниров - как раз те частые стемы, которые
+дают много кандидатов. Замеряется время find_similar на запрос.
+    
+    python benchmarks/bench_similarity.py --capacity 1000,5000 --queries 2000 --output bench_similarity.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from bench_ai import REPO_ROOT, git_commit, percentile
+
+MAINS = ["Курица", "Куриное филе", "Говядина", "Свинина", "Индейка", "Лосось", "Треска", "Овощи", "Грибы",
+         "Картофель", "Рис", "Гречка", "Тыква", "Кабачки", "Баклажаны", "Фасоль", "Нут", "Телятина", "Утка",
+         "Кролик", "Креветки", "Минтай", "Скумбрия", "Цветная капуста", "Брокколи", "Перец", "Омлет", "Сырники",
+         "Блины", "Каша", "Оладьи", "Запеканка", "Суп", "Борщ", "Рагу", "Плов", "Котлеты", "Тефтели", "Паста"]
+METHODS = ["запеченная", "тушеная", "жареная", "отварная", "на гриле", "в духовке", "на пару", "по-домашнему",
+           "по-французски", "в горшочке", "фаршированная", "томленая", ""]
+SIDES = ["с овощами", "с рисом", "с грибами", "в сливочном соусе", "с картофелем", "с гречкой", "с сыром",
+         "с зеленью", "с чесноком", "в томатном соусе", "с курицей", "с лапшой", "с фасолью", "с медом",
+         "с ягодами", "со сметаной", "с лимоном", "с булгуром", "с киноа", "с тыквой", ""]
+
+def dish_names(count, seed=7):
+    """count разных названий блюд: каталог и синтетические сочетания"""
+    rng = random.Random(seed)
+    with open(os.path.join(REPO_ROOT, "dish_catalog.json"), encoding="utf-8") as f:
+        catalog = json.load(f)
+    names = {dish["name"] for dishes in catalog.values() for dish in dishes}
+    while len(names) < count:
+        words = (rng.choice(MAINS), rng.choice(METHODS), rng.choice(SIDES))
+        names.add(" ".join(word for word in words if word))
+    names = sorted(names)
+    rng.shuffle(names)
+    return names[:count]
+
+def run_level(capacity, queries, threshold):
+    from dish_similarity import DishIndex
+    
+    names = dish_names(capacity + queries)
+    index = DishIndex(capacity=capacity)
+    for name in names[:capacity]:
+        index.add(name)
+    # Половина запросов - новые блюда, половина - уже запомненные
+    rng = random.Random(3)
+    lookups = names[capacity:capacity + queries // 2] + rng.choices(names[:capacity], k=queries - queries // 2)
+    
+    timings, hits = [], 0
+    for name in lookups:
+        started = time.perf_counter()
+        found = index.find_similar(name, threshold)
+        timings.append(time.perf_counter() - started)
+        hits += found is not None
+    return {
+        "capacity": capacity,
+        "queries": len(lookups),
+        "hits": hits,
+        "mean_ms": sum(timings) / len(timings) * 1000,
+        "p50_ms": percentile(timings, 0.50) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска похожих блюд")
+    parser.add_argument("--capacity", default="50,1000,5000", help="сколько блюд в индексе, через запятую")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=0.75)
+    parser.add_argument("--output", default="bench_similarity.json")
+    args = parser.parse_args()
+    sys.path.insert(0, REPO_ROOT)
+    
+    results = []
+    for capacity in (int(value) for value in args.capacity.split(",")):
+        result = run_level(capacity, args.queries, args.threshold)
+        results.append(result)
+        print(f"блюд {capacity:>5}: {result['mean_ms']:.3f} мс на поиск (p50 {result['p50_ms']:.3f}, "
+              f"p99 {result['p99_ms']:.3f}), найдено похожих {result['hits']}/{result['queries']}")
+    
+    report = {
+        "meta": {"commit": git_commit(), "timestamp": time.time(), "args": vars(args)},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
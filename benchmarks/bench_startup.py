@@ -0,0 +1,115 @@
+"""Бенчмарк холодного старта: от запуска процесса до первого обработанного обновления.
+
+Каждый прогон - новый процесс Python (холодные импорты), Telegram API заменен
+FakeTelegramRequest, AI - локальным стабом.
+
+    python benchmarks/bench_startup.py --runs 10 --output bench_startup.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_ai import REPO_ROOT, git_commit, percentile, prepare_environment
+from stub_server import StubOpenAIServer
+
+PHASES = ("import", "build", "init", "first_update", "total")
+
+async def child_run(started):
+    import logging
+    logging.disable(logging.WARNING)
+    
+    import bot
+    imported = time.perf_counter()
+    
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    from load_telegram import FakeTelegramRequest, make_callback_update
+    
+    transport = FakeTelegramRequest("fixed:0")
+    application = bot.build_application("123456:STARTUP", request=transport)
+    served = asyncio.Event()
+    
+    async def mark_served(update, context):
+        served.set()
+    
+    application.add_handler(TypeHandler(Update, mark_served), group=1)
+    built = time.perf_counter()
+    
+    await application.initialize()
+    await bot.post_init(application)
+    await application.start()
+    initialized = time.perf_counter()
+    
+    await application.update_queue.put(make_callback_update(1, 1, "dish_завтрак", application.bot))
+    await served.wait()
+    first_update = time.perf_counter()
+    
+    await application.stop()
+    await bot.post_stop(application)
+    await bot.post_shutdown(application)
+    await application.shutdown()
+    return {
+        "import": imported - started,
+        "build": built - imported,
+        "init": initialized - built,
+        "first_update": first_update - initialized,
+        "total": first_update - started,
+    }
+
+def child_main():
+    started = time.perf_counter()
+    sys.path.insert(0, REPO_ROOT)
+    result = asyncio.run(child_run(started))
+    print(json.dumps(result))
+
+def run_once(env):
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--child"], env=env, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного старта бота")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--ai-latency", default="fixed:0.2", help="задержка AI стаба")
+    parser.add_argument("--offline", action="store_true", help="AI_PROVIDER=offline (без AI клиента)")
+    parser.add_argument("--output", default="bench_startup.json")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        child_main()
+        return
+    
+    stub = StubOpenAIServer(latency=args.ai_latency, seed=42)
+    base_url = stub.start()
+    runs = []
+    try:
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as workdir:
+                prepare_environment(base_url, workdir)
+                env = dict(os.environ)
+                if args.offline:
+                    env["AI_PROVIDER"] = "offline"
+                runs.append(run_once(env))
+    finally:
+        stub.stop()
+    
+    summary = {phase: {"p50": percentile([run[phase] for run in runs], 0.50),
+                       "p95": percentile([run[phase] for run in runs], 0.95)} for phase in PHASES}
+    report = {
+        "meta": {"commit": git_commit(), "timestamp": time.time(), "args": vars(args)},
+        "summary": summary,
+        "runs": runs,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    for phase in PHASES:
+        print(f"{phase:>12}: p50 {summary[phase]['p50']:.3f}с, p95 {summary[phase]['p95']:.3f}с")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Масштабирование на несколько воркеров: пропускная способность в зависимости от числа процессов.
+
+Родительский процесс играет роль воркера 0 (приема обновлений от Telegram): раскладывает
+синтетические нажатия кнопок по очередям воркеров в общем хранилище (update_router),
+а дочерние процессы (bot.run_worker с фейковым Telegram API и AI стабом) их обрабатывают.
+Общее хранилище - SQLite файл или RESP сервер (benchmarks/resp_server.py либо настоящий Redis).
+
+    python benchmarks/bench_workers.py --workers 1,2,4 --updates 2000 --backend redis
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_ai import REPO_ROOT, git_commit, prepare_environment
+from stub_server import StubOpenAIServer
+
+DONE_QUEUE = "bench:done"
+READY_QUEUE = "bench:ready"
+
+def child_main(telegram_latency):
+    import asyncio
+    import logging
+    logging.disable(logging.WARNING)
+    sys.path.insert(0, REPO_ROOT)
+
+    import bot
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    from load_telegram import FakeTelegramRequest
+
+    application = bot.build_application("123456:WORKERS", request=FakeTelegramRequest(telegram_latency),
+                                        concurrent_updates=int(os.environ["CONCURRENT_UPDATES"]))
+
+    async def mark_done(update, context):
+        await asyncio.to_thread(bot.get_shared_state().push, DONE_QUEUE, str(update.update_id))
+
+    application.add_handler(TypeHandler(Update, mark_done), group=1)
+    bot.get_shared_state().push(READY_QUEUE, str(bot.WORKER_INDEX))
+    asyncio.run(bot.run_worker(application))
+
+def run_level(args, workers, env):
+    sys.path.insert(0, REPO_ROOT)
+    from load_telegram import TRAFFIC, callback_payload, parse_mix
+    from shared_state import create_state
+    from update_router import UpdateRouter
+
+    state = create_state(env["STATE_BACKEND"], path=env["STATE_PATH"], url=env["REDIS_URL"])
+    children = []
+    for index in range(workers):
+        child_env = dict(env, WORKER_INDEX=str(index), WORKER_COUNT=str(workers))
+        children.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child",
+                                          "--telegram-latency", args.telegram_latency], env=child_env))
+    try:
+        for _ in range(workers):
+            if state.pop(READY_QUEUE, timeout=60) is None:
+                raise RuntimeError("Воркеры не запустились")
+
+        kinds, weights = parse_mix(args.mix)
+        begin = time.perf_counter()
+        for update_id in range(1, args.updates + 1):
+            chat_id = random.randint(1, args.users)
+            payload = callback_payload(update_id, chat_id, TRAFFIC[random.choices(kinds, weights)[0]]())
+            state.push(UpdateRouter.queue_name(chat_id % workers), json.dumps(payload, ensure_ascii=False))
+
+        done = set()
+        deadline = time.monotonic() + args.timeout
+        while len(done) < args.updates and time.monotonic() < deadline:
+            update_id = state.pop(DONE_QUEUE, timeout=1.0)
+            if update_id is not None:
+                done.add(update_id)
+        wall = time.perf_counter() - begin
+    finally:
+        for child in children:
+            child.send_signal(signal.SIGTERM)
+        for child in children:
+            child.wait(timeout=60)
+        state.close()
+    return {"workers": workers, "updates_done": len(done), "wall_seconds": wall,
+            "throughput_ups": len(done) / wall if wall else None}
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк масштабирования на несколько воркеров")
+    parser.add_argument("--workers", default="1,2,4", help="число воркеров через запятую")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--mix", default="random_dish:1,dish:5,daily_menu:2,weekly_menu:1")
+    parser.add_argument("--backend", choices=("sqlite", "redis"), default="sqlite")
+    parser.add_argument("--redis-url", help="настоящий Redis; без него запускается benchmarks/resp_server.py")
+    parser.add_argument("--concurrent-updates", type=int, default=16, help="параллельных обновлений на воркер")
+    parser.add_argument("--ai-latency", default="fixed:0.05", help="задержка AI стаба")
+    parser.add_argument("--telegram-latency", default="fixed:0.01", help="задержка фейкового Telegram API")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--output", default="bench_workers.json")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(args.telegram_latency)
+        return
+
+    stub = StubOpenAIServer(latency=args.ai_latency, seed=42)
+    base_url = stub.start()
+    resp_server = None
+    redis_url = args.redis_url
+    if args.backend == "redis" and not redis_url:
+        from resp_server import RESPServer
+        resp_server = RESPServer()
+        redis_url = resp_server.start()
+
+    results = []
+    try:
+        for workers in (int(value) for value in args.workers.split(",")):
+            with tempfile.TemporaryDirectory() as workdir:
+                prepare_environment(base_url, workdir)
+                env = dict(os.environ, STATE_BACKEND=args.backend, STATE_PATH=os.path.join(workdir, "state.db"),
+                           REDIS_URL=redis_url or "", CONCURRENT_UPDATES=str(args.concurrent_updates))
+                result = run_level(args, workers, env)
+            results.append(result)
+            print(f"воркеров {workers}: обработано {result['updates_done']}/{args.updates} "
+                  f"за {result['wall_seconds']:.1f}с ({result['throughput_ups']:.1f} обновлений/с)")
+    finally:
+        stub.stop()
+        if resp_server:
+            resp_server.stop()
+
+    report = {
+        "meta": {"commit": git_commit(), "timestamp": time.time(), "args": vars(args)},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""Нагрузочный тест обработчиков бота: синтетические обновления Telegram через фейковый транспорт.
+
+Все работает офлайн: Telegram API заменен FakeTelegramRequest, AI - локальным стабом.
+
+    python benchmarks/load_telegram.py --users 2000 --updates 3000 --rate 300 --output bench_telegram.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+
+from telegram import Update
+from telegram.ext import TypeHandler
+from telegram.request import BaseRequest
+
+from bench_ai import git_commit, percentile, prepare_environment
+from stub_server import StubOpenAIServer, parse_latency
+
+# Виды трафика и callback_data
+TRAFFIC = {
+    "random_dish": lambda: "random_dish",
+    "dish": lambda: random.choice(["dish_завтрак", "dish_обед", "dish_ужин"]),
+    "daily_menu": lambda: "daily_menu",
+    "weekly_menu": lambda: "weekly_menu",
+    # Замена одного блюда в последнем меню недели (без сохраненного меню - только клавиатура)
+    "regen_meal": lambda: f"regen:week:{random.randrange(7)}:{random.randrange(3)}",
+}
+
+class FakeTelegramRequest(BaseRequest):
+    """Транспорт Telegram Bot API, отвечающий локально с заданной задержкой"""
+    
+    def __init__(self, latency="fixed:0.02"):
+        self.latency = parse_latency(latency)
+        self.calls = {}
+        self.menu_edits = []  # (chat_id, время) правок с содержимым меню - для time-to-first-content
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+    
+    @property
+    def read_timeout(self):
+        return None
+    
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        params = request_data.parameters if request_data else {}
+        await asyncio.sleep(max(0.0, self.latency()))
+        if api_method == "editMessageText" and "Меню на" in params.get("text", ""):
+            self.menu_edits.append((int(params.get("chat_id", 1)), time.perf_counter()))
+        
+        if api_method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "LoadTest", "username": "load_test_bot"}
+        elif api_method in ("editMessageText", "sendMessage"):
+            result = {
+                "message_id": int(params.get("message_id", 1)),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 1)), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        elif api_method == "getUpdates":
+            result = []
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+def callback_payload(update_id, chat_id, data, message_id=1):
+    """JSON обновления с нажатием inline-кнопки"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "LoadTest"},
+                "text": "🍽️ Главное меню",
+            },
+        },
+    }
+
+def make_callback_update(update_id, chat_id, data, bot, message_id=1):
+    return Update.de_json(callback_payload(update_id, chat_id, data, message_id), bot)
+
+def parse_mix(spec):
+    kinds, weights = [], []
+    for part in spec.split(","):
+        kind, weight = part.split(":")
+        if kind not in TRAFFIC:
+            raise ValueError(f"Неизвестный вид трафика: {kind}")
+        kinds.append(kind)
+        weights.append(float(weight))
+    return kinds, weights
+
+async def monitor_event_loop(interval, lags, stop):
+    """Замер задержек event loop: насколько позже запланированного просыпается задача"""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+def summarize(values):
+    return {
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else None,
+    }
+
+async def run(args):
+    import logging
+    logging.disable(logging.WARNING)
+    import bot
+    
+    transport = FakeTelegramRequest(args.telegram_latency)
+    application = bot.build_application("123456:LOADTEST", request=transport,
+                                        concurrent_updates=args.concurrent_updates)
+    
+    enqueued, started, finished = {}, {}, {}
+    menu_updates = {}  # update_id -> chat_id обновлений с генерацией меню
+    hot_updates = set()  # обновления "горячего" чата
+    all_done = asyncio.Event()
+    
+    async def mark_started(update, context):
+        started[update.update_id] = time.perf_counter()
+    
+    async def mark_finished(update, context):
+        finished[update.update_id] = time.perf_counter()
+        if len(finished) >= args.updates:
+            all_done.set()
+    
+    application.add_handler(TypeHandler(Update, mark_started), group=-1)
+    application.add_handler(TypeHandler(Update, mark_finished), group=1)
+    
+    await application.initialize()
+    await bot.post_init(application)
+    await application.start()
+    
+    lags = []
+    stop_monitor = asyncio.Event()
+    monitor = asyncio.create_task(monitor_event_loop(0.01, lags, stop_monitor))
+    
+    kinds, weights = parse_mix(args.mix)
+    counts = {kind: 0 for kind in kinds}
+    begin = time.perf_counter()
+    for update_id in range(1, args.updates + 1):
+        # Открытая модель нагрузки: обновления приходят по расписанию, не дожидаясь ответов
+        delay = begin + update_id / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if random.random() < args.hot_chat_share:
+            # Один чат раз за разом жмет "меню на неделю" под разными сообщениями - очередь чата растет
+            kind, chat_id = "weekly_menu", args.users + 1
+            hot_updates.add(update_id)
+            update = make_callback_update(update_id, chat_id, TRAFFIC[kind](), application.bot, message_id=update_id)
+        else:
+            kind = random.choices(kinds, weights)[0]
+            chat_id = random.randint(1, args.users)
+            update = make_callback_update(update_id, chat_id, TRAFFIC[kind](), application.bot)
+        counts[kind] = counts.get(kind, 0) + 1
+        if kind in ("daily_menu", "weekly_menu"):
+            menu_updates[update_id] = chat_id
+        enqueued[update_id] = time.perf_counter()
+        await application.update_queue.put(update)
+    
+    try:
+        await asyncio.wait_for(all_done.wait(), timeout=args.timeout)
+    except asyncio.TimeoutError:
+        print(f"Таймаут: обработано {len(finished)} из {args.updates}")
+    wall = time.perf_counter() - begin
+    
+    stop_monitor.set()
+    await monitor
+    await application.stop()
+    await bot.post_stop(application)
+    await bot.post_shutdown(application)
+    await application.shutdown()
+    
+    done_ids = [i for i in finished if i in started]
+    other_ids = [i for i in done_ids if i not in hot_updates]
+    queue_delays = [started[i] - enqueued[i] for i in done_ids]
+    handler_latencies = [finished[i] - started[i] for i in done_ids]
+    end_to_end = [finished[i] - enqueued[i] for i in done_ids]
+    
+    # Первая правка с блюдами меню в том же чате во время обработки обновления
+    # (обновления одного чата обрабатываются по очереди, так что правка принадлежит ему)
+    edits_by_chat = {}
+    for chat_id, at in transport.menu_edits:
+        edits_by_chat.setdefault(chat_id, []).append(at)
+    first_content = []
+    for update_id, chat_id in menu_updates.items():
+        if update_id not in finished or update_id not in started:
+            continue
+        times = [at for at in edits_by_chat.get(chat_id, []) if started[update_id] <= at <= finished[update_id]]
+        if times:
+            first_content.append(min(times) - started[update_id])
+    return {
+        "updates_sent": args.updates,
+        "updates_done": len(done_ids),
+        "traffic": counts,
+        "wall_seconds": wall,
+        "throughput_ups": len(done_ids) / wall if wall else None,
+        "queue_delay": summarize(queue_delays),
+        "handler_latency": summarize(handler_latencies),
+        "end_to_end": summarize(end_to_end),
+        "menu_first_content": summarize(first_content),
+        # Задержка до начала обработки в остальных чатах: занятый чат не должен забирать общие слоты
+        "other_chats_queue_delay": summarize([started[i] - enqueued[i] for i in other_ids]),
+        "hot_chat_updates": len(hot_updates),
+        "event_loop_lag": summarize(lags),
+        "telegram_calls": transport.calls,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест обработчиков Telegram бота")
+    parser.add_argument("--users", type=int, default=2000, help="количество симулируемых пользователей")
+    parser.add_argument("--updates", type=int, default=2000, help="сколько обновлений отправить")
+    parser.add_argument("--rate", type=float, default=200.0, help="обновлений в секунду")
+    parser.add_argument("--mix", default="random_dish:1,dish:5,daily_menu:2,weekly_menu:1")
+    parser.add_argument("--telegram-latency", default="fixed:0.02", help="задержка фейкового Telegram API")
+    parser.add_argument("--ai-latency", default="lognormal:-1.5:0.5", help="задержка AI стаба")
+    parser.add_argument("--concurrent-updates", type=int, default=64, help="1 - последовательная обработка")
+    parser.add_argument("--hot-chat-share", type=float, default=0.0,
+                        help="доля обновлений от одного чата, раз за разом запрашивающего меню на неделю")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--output", default="bench_telegram.json")
+    args = parser.parse_args()
+    
+    stub = StubOpenAIServer(latency=args.ai_latency, seed=42)
+    base_url = stub.start()
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_environment(base_url, workdir)
+        result = asyncio.run(run(args))
+    stub.stop()
+    
+    report = {
+        "meta": {"commit": git_commit(), "timestamp": time.time(), "args": vars(args),
+                 "stub_requests": stub.stats["requests"]},
+        "result": result,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    print(f"Обработано {result['updates_done']}/{result['updates_sent']} за {result['wall_seconds']:.1f}с "
+          f"({result['throughput_ups'] or 0:.1f} обновлений/с)")
+    for key in ("queue_delay", "handler_latency", "end_to_end", "menu_first_content", "other_chats_queue_delay",
+                "event_loop_lag"):
+        stats = result[key]
+        print(f"  {key:<23} p50={stats['p50'] or 0:.3f}s p95={stats['p95'] or 0:.3f}s "
+              f"p99={stats['p99'] or 0:.3f}s max={stats['max'] or 0:.3f}s")
+    print(f"Результаты записаны в {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Минимальный сервер с протоколом Redis (RESP2) в памяти - для проверки RedisState без Redis.
+
+Поддерживает команды, которые использует shared_state.RedisState:
+PING, AUTH, SELECT, GET, SET (PX, NX), MSET, DEL, RPUSH, BLPOP.
+
+    python benchmarks/resp_server.py --port 6390
+и затем STATE_BACKEND=redis REDIS_URL=redis://127.0.0.1:6390/0 python bot.py
+"""
+import argparse
+import socketserver
+import threading
+import time
+from collections import defaultdict, deque
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class RESPServer:
+    """Хранилище строк с TTL и списков, доступное по протоколу Redis"""
+    
+    def __init__(self, host="127.0.0.1", port=0):
+        self.values = {}  # ключ -> (значение, время истечения или None)
+        self.lists = defaultdict(deque)
+        self.condition = threading.Condition()
+        self.stats = {"commands": 0, "connections": 0}
+        self.server = _Server((host, port), self._make_handler())
+        self.thread = None
+    
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="resp-server", daemon=True)
+        self.thread.start()
+        return self.url
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def _get(self, key):
+        item = self.values.get(key)
+        if item and item[1] is not None and item[1] <= time.monotonic():
+            del self.values[key]
+            return None
+        return item[0] if item else None
+    
+    def execute(self, args):
+        """Выполнить команду; возвращает значение ответа (исключение - ответ с ошибкой)"""
+        command = args[0].upper()
+        with self.condition:
+            self.stats["commands"] += 1
+            if command in ("PING", "AUTH", "SELECT"):
+                return "PONG" if command == "PING" else "OK"
+            if command == "GET":
+                return self._get(args[1])
+            if command == "SET":
+                key, value, options = args[1], args[2], [option.upper() for option in args[3:]]
+                if "NX" in options and self._get(key) is not None:
+                    return None
+                expires = None
+                if "PX" in options:
+                    expires = time.monotonic() + int(args[3 + options.index("PX") + 1]) / 1000
+                self.values[key] = (value, expires)
+                return "OK"
+            if command == "MSET":
+                for key, value in zip(args[1::2], args[2::2]):
+                    self.values[key] = (value, None)
+                return "OK"
+            if command == "DEL":
+                return sum(1 for key in args[1:] if self.values.pop(key, None) is not None)
+            if command == "RPUSH":
+                self.lists[args[1]].extend(args[2:])
+                self.condition.notify_all()
+                return len(self.lists[args[1]])
+            if command == "BLPOP":
+                keys, timeout = args[1:-1], float(args[-1])
+                deadline = time.monotonic() + timeout if timeout else None
+                while True:
+                    for key in keys:
+                        if self.lists[key]:
+                            return [key, self.lists[key].popleft()]
+                    remaining = deadline - time.monotonic() if deadline else None
+                    if remaining is not None and remaining <= 0:
+                        return None
+                    self.condition.wait(remaining)
+        raise ValueError(f"ERR unknown command '{command}'")
+    
+    def _make_handler(self):
+        server = self
+        
+        class Handler(socketserver.StreamRequestHandler):
+            def _read_command(self):
+                line = self.rfile.readline()
+                if not line:
+                    return None
+                if not line.startswith(b"*"):
+                    return line.decode("utf-8").split()  # inline команда (например, из telnet)
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int(self.rfile.readline()[1:])
+                    args.append(self.rfile.read(length + 2)[:-2].decode("utf-8"))
+                return args
+            
+            def _encode(self, value):
+                if value is None:
+                    return b"$-1\r\n"
+                if isinstance(value, int):
+                    return b":%d\r\n" % value
+                if isinstance(value, list):
+                    return b"*%d\r\n" % len(value) + b"".join(self._encode(item) for item in value)
+                data = value.encode("utf-8")
+                return b"$%d\r\n%s\r\n" % (len(data), data)
+            
+            def handle(self):
+                with server.condition:
+                    server.stats["connections"] += 1
+                while True:
+                    args = self._read_command()
+                    if not args:
+                        return
+                    try:
+                        reply = server.execute(args)
+                        if reply == "OK" or reply == "PONG":
+                            self.wfile.write(b"+%s\r\n" % reply.encode())
+                        elif reply is None and args[0].upper() == "BLPOP":
+                            self.wfile.write(b"*-1\r\n")
+                        else:
+                            self.wfile.write(self._encode(reply))
+                    except Exception as e:
+                        self.wfile.write(b"-%s\r\n" % str(e).encode("utf-8"))
+                    self.wfile.flush()
+        
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Минимальный сервер с протоколом Redis")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    
+    server = RESPServer(args.host, args.port)
+    print(f"RESP сервер запущен: {server.url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
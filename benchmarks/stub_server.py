@@ -0,0 +1,188 @@
+"""Локальный OpenAI/DeepSeek-совместимый стаб для бенчмарков без платных запросов.
+
+Запуск отдельно:
+    python benchmarks/stub_server.py --port 8081 --latency lognormal:-1.5:0.5 --error-rate 0.02
+и затем DEEPSEEK_BASE_URL=http://127.0.0.1:8081/v1 python bot.py
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dish_catalog.json")
+MENU_DAYS = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье", "Сегодня"]
+MEAL_TYPES = ["завтрак", "обед", "ужин"]
+
+def parse_latency(spec):
+    """Распределение задержки: fixed:0.2, uniform:0.1:0.5 или lognormal:mu:sigma (секунды)"""
+    kind, *params = spec.split(":")
+    params = [float(p) for p in params]
+    if kind == "fixed":
+        return lambda: params[0]
+    if kind == "uniform":
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(params[0], params[1])
+    raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+def load_dishes():
+    with open(CATALOG_PATH, encoding="utf-8") as f:
+        catalog = json.load(f)
+    return {meal_type: [dish["name"] for dish in dishes] for meal_type, dishes in catalog.items()}
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # стандартные 5 дают отказы соединений под нагрузкой
+    
+    def handle_error(self, request, client_address):
+        # Клиент отменил запрос (например, генерацию отменил более новый запрос) - это не ошибка
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+class StubOpenAIServer:
+    """HTTP сервер, отвечающий как /v1/chat/completions, с заданной задержкой и долей ошибок"""
+    
+    def __init__(self, host="127.0.0.1", port=0, latency="fixed:0.2", error_rate=0.0,
+                 rate_limit_rate=0.0, seed=None, connect_latency=0.0):
+        self.latency = parse_latency(latency)
+        self.connect_latency = connect_latency  # имитация DNS/TCP/TLS для каждого нового соединения
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.dishes = load_dishes()
+        self.all_dishes = [dish for dishes in self.dishes.values() for dish in dishes]
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "connections": 0}
+        self.prompt_cache = set()  # уже встречавшиеся префиксы (все сообщения, кроме последнего)
+        self.lock = threading.Lock()
+        self.server = _Server((host, port), self._make_handler())
+        self.thread = None
+    
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="stub-openai", daemon=True)
+        self.thread.start()
+        return self.base_url
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def _answer(self, prompt):
+        if "JSON" in prompt:
+            menu = {day: {meal: self.random.choice(self.dishes.get(meal, self.all_dishes)) for meal in MEAL_TYPES}
+                    for day in MENU_DAYS if f'"{day}"' in prompt}
+            return json.dumps(menu, ensure_ascii=False)
+        for meal_type, dishes in self.dishes.items():
+            if meal_type in prompt:
+                return self.random.choice(dishes)
+        return self.random.choice(self.all_dishes)
+    
+    def _cached_tokens(self, messages):
+        """Кэш префиксов как у DeepSeek: повторный префикс засчитывается блоками по 64 токена"""
+        prefix = "\n".join(str(m.get("content", "")) for m in messages[:-1])
+        with self.lock:
+            seen = prefix in self.prompt_cache
+            self.prompt_cache.add(prefix)
+        return (len(prefix) // 4) // 64 * 64 if seen else 0
+    
+    def _make_handler(self):
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего API
+            
+            def setup(self):
+                with stub.lock:
+                    stub.stats["connections"] += 1
+                if stub.connect_latency:
+                    time.sleep(stub.connect_latency)
+                super().setup()
+            
+            def _send_json(self, status, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [
+                        {"id": "deepseek-chat", "object": "model"}, {"id": "gpt-4o-mini", "object": "model"}]})
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+            
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                with stub.lock:
+                    stub.stats["requests"] += 1
+                    roll = stub.random.random()
+                    delay = stub.latency()
+                time.sleep(max(0.0, delay))
+                
+                if roll < stub.rate_limit_rate:
+                    with stub.lock:
+                        stub.stats["rate_limited"] += 1
+                    self._send_json(429, {"error": {"message": "Rate limit", "type": "rate_limit_error"}})
+                    return
+                if roll < stub.rate_limit_rate + stub.error_rate:
+                    with stub.lock:
+                        stub.stats["errors"] += 1
+                    self._send_json(500, {"error": {"message": "Stub failure", "type": "server_error"}})
+                    return
+                
+                messages = request.get("messages", [])
+                prompt = "\n".join(str(m.get("content", "")) for m in messages)
+                content = stub._answer(str(messages[-1].get("content", "")) if messages else "")
+                prompt_tokens = len(prompt) // 4
+                cached = stub._cached_tokens(messages)
+                self._send_json(200, {
+                    "id": f"stub-{time.monotonic_ns()}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 2,
+                              "total_tokens": prompt_tokens + len(content) // 2,
+                              "prompt_cache_hit_tokens": cached,
+                              "prompt_cache_miss_tokens": prompt_tokens - cached,
+                              "prompt_tokens_details": {"cached_tokens": cached}},
+                })
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный OpenAI-совместимый стаб")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", default="lognormal:-1.5:0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--connect-latency", type=float, default=0.0, help="задержка нового соединения, секунды")
+    args = parser.parse_args()
+    
+    stub = StubOpenAIServer(args.host, args.port, args.latency, args.error_rate, args.rate_limit_rate,
+                            connect_latency=args.connect_latency)
+    print(f"Стаб запущен: {stub.base_url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
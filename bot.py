@@ -1,8 +1,28 @@
+import asyncio
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import signal
+import sys
+import time
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand
+from telegram.error import TelegramError
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
-from config import BOT_TOKEN
-from ai_helper import get_random_dish, generate_weekly_menu, format_weekly_menu, generate_daily_menu, format_daily_menu
+from config import (BOT_TOKEN, METRICS_PORT, METRICS_HOST, ADMIN_IDS, BOT_MODE, WEBHOOK_URL, WEBHOOK_LISTEN,
+                    WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, CONCURRENT_UPDATES, DRAIN_TIMEOUT,
+                    STREAM_EDIT_INTERVAL, TRACE_SAMPLE_RATE, TRACE_SLOW_SECONDS, HTTP_KEEPALIVE_PING,
+                    WORKER_INDEX, WORKER_COUNT, UPDATE_DEDUP_TTL, SUBSCRIPTIONS_DB_PATH, BROADCAST_DEFAULT_TIME,
+                    BROADCAST_TIMEZONE, BROADCAST_PREPARE_AHEAD, BROADCAST_BATCH_SIZE, BROADCAST_RATE,
+                    BROADCAST_PREPARE_CONCURRENCY, BROADCAST_SENDERS, DISH_DEADLINE, DAILY_MENU_DEADLINE,
+                    WEEKLY_MENU_DEADLINE, ConfigError, validate_settings)
+from ai_helper import (get_dish_fast, stream_menu, regenerate_menu, format_weekly_menu, format_daily_menu,
+                       MEAL_TYPES, MENU_DAYS, TODAY, dish_pool, format_stats, get_client, close_client,
+                       OFFLINE_MODE, get_shared_state, get_history_store, get_dish_catalog, close_storage,
+                       generate_daily_menu)
+from broadcast import SubscriptionStore, BroadcastPipeline, parse_send_time
+from metrics import timed_handler, start_http_server
+from update_processor import ChatOrderedUpdateProcessor
+from update_router import UpdateRouter
+from inflight import inflight, GenerationSuperseded
+from tracing import tracer
 
 # Настройка логирования
 logging.basicConfig(
@@ -11,6 +31,100 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Распределение чатов между воркерами, подписки и рассылка создаются в build_application,
+# а не при импорте модуля (импорт не открывает базы и не подключается к общему состоянию)
+update_router = None
+subscription_store = None
+broadcast = None
+
+async def edit_message(query, text, **kwargs):
+    """Изменить текст сообщения с кнопкой (замеряется в трассе обновления)"""
+    with tracer.span("message_edit"):
+        return await query.edit_message_text(text, **kwargs)
+
+class ThrottledEditor:
+    """Правки одного сообщения не чаще раза в interval секунд.
+    
+    Промежуточные правки слишком рано пропускаются (и их ошибки не критичны).
+    Финальная отправляется сразу: одна лишняя правка укладывается в допустимый
+    всплеск, а ожидание интервала задерживало бы готовое меню.
+    """
+    
+    def __init__(self, query, interval=STREAM_EDIT_INTERVAL):
+        self.query = query
+        self.interval = interval
+        self.last_edit = 0.0
+        self.last_text = None
+    
+    async def edit(self, text, final=False, **kwargs):
+        wait = self.last_edit + self.interval - time.monotonic()
+        if not final:
+            if wait > 0 or text == self.last_text:
+                return
+            try:
+                await edit_message(self.query, text, **kwargs)
+            except TelegramError as e:
+                logger.warning(f"Промежуточная правка сообщения не удалась: {e}")
+        else:
+            await edit_message(self.query, text, **kwargs)
+        self.last_edit = time.monotonic()
+        self.last_text = text
+
+# Подписи кнопок для перегенерации отдельных дней и блюд
+DAY_LABELS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+MEAL_LABELS = {"завтрак": "🌅 Завтрак", "обед": "☀️ Обед", "ужин": "🌙 Ужин"}
+
+def format_menu(kind, menu):
+    """Текст меню вида kind ("week" или "day")"""
+    if kind == "week":
+        return format_weekly_menu(menu)
+    return format_daily_menu(menu[TODAY])
+
+def menu_keyboard(kind):
+    """Клавиатура под готовым меню: новое меню и перегенерация частей.
+    
+    callback_data: regen:<вид>:<номер дня>[:<номер приема пищи>] и menu_day:<вид>:<номер дня>.
+    """
+    if kind == "week":
+        day_buttons = [InlineKeyboardButton(f"🔄 {label}", callback_data=f"menu_day:week:{index}")
+                       for index, label in enumerate(DAY_LABELS)]
+        keyboard = [
+            day_buttons[:4],
+            day_buttons[4:],
+            [InlineKeyboardButton("🔄 Новое меню", callback_data="weekly_menu")],
+        ]
+    else:
+        keyboard = [
+            [InlineKeyboardButton(MEAL_LABELS[meal_type], callback_data=f"regen:day:0:{index}")
+             for index, meal_type in enumerate(MEAL_TYPES)],
+            [InlineKeyboardButton("🔄 Новое меню на день", callback_data="daily_menu")],
+        ]
+    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_main")])
+    return InlineKeyboardMarkup(keyboard)
+
+def day_keyboard(kind, day_index):
+    """Выбор, что перегенерировать в одном дне меню"""
+    day = MENU_DAYS[kind][day_index]
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"🔄 Весь день ({day})", callback_data=f"regen:{kind}:{day_index}")],
+        [InlineKeyboardButton(MEAL_LABELS[meal_type], callback_data=f"regen:{kind}:{day_index}:{index}")
+         for index, meal_type in enumerate(MEAL_TYPES)],
+        [InlineKeyboardButton("⬅️ Назад", callback_data=f"menu_keyboard:{kind}")],
+    ])
+
+def broadcast_message(menu):
+    """Сообщение ежедневной рассылки: меню на день с кнопками перегенерации"""
+    return {"text": "🔔 " + format_daily_menu(menu), "parse_mode": 'Markdown',
+            "reply_markup": menu_keyboard("day")}
+
+async def stream_menu_message(editor, kind, chat_id):
+    """Сгенерировать меню, показывая готовые блюда по мере появления. Возвращает {день: {прием пищи: блюдо}}."""
+    menu = {day: {} for day in MENU_DAYS[kind]}
+    async for day, meal_type, dish_name in stream_menu(kind, chat_id):
+        menu[day][meal_type] = dish_name
+        await editor.edit(format_menu(kind, menu), parse_mode='Markdown')
+    return menu
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /start"""
     keyboard = [
@@ -33,6 +147,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 • 🎲 *Случайное блюдо* - предложу блюдо для завтрака, обеда или ужина
 • 🍽️ *Меню на день* - составлю завтрак, обед и ужин на один день
 • 📅 *Меню на неделю* - составлю полное меню на всю неделю
+
+🔔 /subscribe - буду присылать меню на день каждый день в удобное время
     """
     
     await update.message.reply_text(
@@ -54,28 +170,27 @@ async def random_dish_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(
+    await edit_message(
+        query,
         "🎲 *Выбери категорию блюда:*",
         reply_markup=reply_markup,
         parse_mode='Markdown'
     )
 
+@timed_handler("get_dish_suggestion", deadline=DISH_DEADLINE)
 async def get_dish_suggestion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Получить предложение блюда от ИИ"""
     query = update.callback_query
     await query.answer()
     
     meal_type = query.data.replace("dish_", "")
-    print(f"[BOT DEBUG] Запрос блюда для: {meal_type}")
-    print(f"[BOT DEBUG] Callback data: {query.data}")
     
     # Показываем загрузку
-    await query.edit_message_text("🤔 Думаю над блюдом...")
+    await edit_message(query, "🤔 Думаю над блюдом...")
     
     try:
-        print(f"[BOT DEBUG] Вызываем get_random_dish({meal_type})")
-        dish = get_random_dish(meal_type)
-        print(f"[BOT DEBUG] Получили блюдо: '{dish}'")
+        dish = await inflight.run(update, get_dish_fast(meal_type, update.effective_chat.id))
+        tracer.event("[BOT] Блюдо для %s: '%s'", meal_type, dish)
         
         keyboard = [
             [InlineKeyboardButton("🔄 Другое блюдо", callback_data=f"dish_{meal_type}")],
@@ -86,79 +201,109 @@ async def get_dish_suggestion(update: Update, context: ContextTypes.DEFAULT_TYPE
         
         emoji_map = {"завтрак": "🌅", "обед": "☀️", "ужин": "🌙"}
         
-        await query.edit_message_text(
+        await edit_message(
+            query,
             f"{emoji_map[meal_type]} *{meal_type.capitalize()}:*\n\n🍽️ *{dish}*\n\nНравится предложение?",
             reply_markup=reply_markup,
             parse_mode='Markdown'
         )
-        print(f"[BOT DEBUG] Сообщение отправлено пользователю")
         
+    except GenerationSuperseded:
+        # Сообщение обновит более новый запрос
+        tracer.event("[BOT] Генерация блюда для %s отменена новым запросом", meal_type)
     except Exception as e:
-        print(f"[BOT ERROR] Ошибка при получении блюда: {type(e).__name__}: {e}")
-        logger.error(f"Ошибка при получении блюда: {e}")
-        await query.edit_message_text(
+        logger.error("Ошибка при получении блюда: %s: %s", type(e).__name__, e)
+        await edit_message(
+            query,
             "😕 Произошла ошибка. Попробуй еще раз.",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="random_dish")]])
         )
 
+@timed_handler("generate_menu", deadline=WEEKLY_MENU_DEADLINE)
 async def generate_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Сгенерировать меню на неделю"""
     query = update.callback_query
     await query.answer()
     
-    await query.edit_message_text("🍽️ Составляю меню на неделю... Это займет немного времени ⏱️")
+    await edit_message(query, "🍽️ Составляю меню на неделю... Это займет немного времени ⏱️")
+    editor = ThrottledEditor(query)
     
     try:
-        menu = generate_weekly_menu()
-        menu_text = format_weekly_menu(menu)
-        
-        keyboard = [
-            [InlineKeyboardButton("🔄 Новое меню", callback_data="weekly_menu")],
-            [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_main")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
-            menu_text,
-            reply_markup=reply_markup,
-            parse_mode='Markdown'
-        )
+        menu = await inflight.run(update, stream_menu_message(editor, "week", update.effective_chat.id))
+        await editor.edit(format_menu("week", menu), final=True, reply_markup=menu_keyboard("week"),
+                          parse_mode='Markdown')
+    except GenerationSuperseded:
+        pass
     except Exception as e:
         logger.error(f"Ошибка при генерации меню: {e}")
-        await query.edit_message_text(
+        await edit_message(
+            query,
             "😕 Произошла ошибка при создании меню. Попробуй еще раз.",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")]])
         )
 
+@timed_handler("generate_daily_menu_handler", deadline=DAILY_MENU_DEADLINE)
 async def generate_daily_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Сгенерировать меню на день"""
     query = update.callback_query
     await query.answer()
     
-    await query.edit_message_text("🍽️ Составляю меню на день... ⏱️")
+    await edit_message(query, "🍽️ Составляю меню на день... ⏱️")
+    editor = ThrottledEditor(query)
     
     try:
-        menu = generate_daily_menu()
-        menu_text = format_daily_menu(menu)
-        
-        keyboard = [
-            [InlineKeyboardButton("🔄 Новое меню на день", callback_data="daily_menu")],
-            [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_main")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
-            menu_text,
-            reply_markup=reply_markup,
-            parse_mode='Markdown'
-        )
+        menu = await inflight.run(update, stream_menu_message(editor, "day", update.effective_chat.id))
+        await editor.edit(format_menu("day", menu), final=True, reply_markup=menu_keyboard("day"),
+                          parse_mode='Markdown')
+    except GenerationSuperseded:
+        pass
     except Exception as e:
         logger.error(f"Ошибка при генерации меню на день: {e}")
-        await query.edit_message_text(
+        await edit_message(
+            query,
             "😕 Произошла ошибка при создании меню на день. Попробуй еще раз.",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")]])
         )
 
+async def show_menu_keyboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показать клавиатуру выбора дня (menu_day) или вернуть основную клавиатуру меню (menu_keyboard)"""
+    query = update.callback_query
+    await query.answer()
+    
+    action, kind, *rest = query.data.split(":")
+    if action == "menu_day":
+        await query.edit_message_reply_markup(reply_markup=day_keyboard(kind, int(rest[0])))
+    else:
+        await query.edit_message_reply_markup(reply_markup=menu_keyboard(kind))
+
+@timed_handler("regenerate_menu_part", deadline=DAILY_MENU_DEADLINE)
+async def regenerate_menu_part(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Перегенерировать один день или одно блюдо в последнем меню (regen:<вид>:<день>[:<прием пищи>])"""
+    query = update.callback_query
+    _, kind, day_index, *meal_index = query.data.split(":")
+    day = MENU_DAYS[kind][int(day_index)]
+    meal_type = MEAL_TYPES[int(meal_index[0])] if meal_index else None
+    tracer.event("[BOT] Перегенерация: %s, %s, %s", kind, day, meal_type or "весь день")
+    await query.answer("🔄 Меняю...")
+    
+    try:
+        menu = await inflight.run(update, regenerate_menu(kind, day, meal_type, update.effective_chat.id))
+        if menu is None:
+            # Меню не сохранилось (например, после очистки истории) - предлагаем составить новое
+            new_menu = "weekly_menu" if kind == "week" else "daily_menu"
+            await query.edit_message_reply_markup(reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🔄 Новое меню", callback_data=new_menu)],
+                [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_main")]
+            ]))
+            return
+        await edit_message(query, format_menu(kind, menu), reply_markup=menu_keyboard(kind),
+                           parse_mode='Markdown')
+    except GenerationSuperseded:
+        pass
+    except Exception as e:
+        logger.error(f"Ошибка при перегенерации меню: {e}")
+        await query.edit_message_reply_markup(reply_markup=menu_keyboard(kind))
+
 async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Вернуться в главное меню"""
     query = update.callback_query
@@ -175,7 +320,8 @@ async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(
+    await edit_message(
+        query,
         "🍽️ *Главное меню*\n\nЧто тебе нужно?",
         reply_markup=reply_markup,
         parse_mode='Markdown'
@@ -184,31 +330,101 @@ async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик всех кнопок"""
     query = update.callback_query
-    print(f"[BOT DEBUG] Нажата кнопка: {query.data}")
-    print(f"[BOT DEBUG] От пользователя: {query.from_user.id}")
+    tracer.event("[BOT] Кнопка %s от пользователя %s", query.data, query.from_user.id)
+    
+    if inflight.is_coalesced(update):
+        # Та же генерация уже идет и сама обновит сообщение
+        tracer.event("[BOT] Повторное нажатие %s схлопнуто с идущей генерацией", query.data)
+        await query.answer()
+        return
     
     if query.data == "random_dish":
-        print("[BOT DEBUG] Переход к меню случайного блюда")
         await random_dish_menu(update, context)
     elif query.data == "daily_menu":
-        print("[BOT DEBUG] Переход к генерации меню на день")
         await generate_daily_menu_handler(update, context)
     elif query.data == "weekly_menu":
-        print("[BOT DEBUG] Переход к генерации меню на неделю")
         await generate_menu(update, context)
     elif query.data.startswith("dish_"):
-        print(f"[BOT DEBUG] Запрос конкретного блюда: {query.data}")
         await get_dish_suggestion(update, context)
+    elif query.data.startswith("regen:"):
+        await regenerate_menu_part(update, context)
+    elif query.data.startswith(("menu_day:", "menu_keyboard:")):
+        await show_menu_keyboard(update, context)
     elif query.data == "back_to_main":
-        print("[BOT DEBUG] Возврат в главное меню")
         await back_to_main(update, context)
     else:
-        print(f"[BOT WARNING] Неизвестная кнопка: {query.data}")
+        logger.warning("Неизвестная кнопка: %s", query.data)
+
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /subscribe [ЧЧ:ММ]: ежедневное меню на день"""
+    send_time = parse_send_time(context.args[0]) if context.args else BROADCAST_DEFAULT_TIME
+    if send_time is None:
+        await update.message.reply_text("Укажи время в формате ЧЧ:ММ, например: /subscribe 08:30")
+        return
+    
+    subscription_store.subscribe(update.effective_chat.id, send_time)
+    tracer.event("[BOT] Подписка чата %s на %s", update.effective_chat.id, send_time)
+    await update.message.reply_text(
+        f"🔔 Готово! Каждый день в *{send_time}* ({BROADCAST_TIMEZONE}) пришлю меню на день.\n\n"
+        f"Изменить время: /subscribe ЧЧ:ММ, отписаться: /unsubscribe",
+        parse_mode='Markdown'
+    )
+
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /unsubscribe"""
+    if subscription_store.unsubscribe(update.effective_chat.id):
+        await update.message.reply_text("🔕 Подписка отменена. Вернуться: /subscribe")
+    else:
+        await update.message.reply_text("Подписки нет. Подписаться на ежедневное меню: /subscribe")
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /stats (только для администраторов)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        logger.warning("/stats от не-администратора: %s", update.effective_user.id)
+        return
+    
+    coalesce = inflight.stats
+    text = format_stats() + (f"*Генерации:* запущено {coalesce['started']}, схлопнуто {coalesce['coalesced']}, "
+                             f"отменено {coalesce['superseded']}\n")
+    if update_router.enabled:
+        routing = update_router.get_stats()
+        text += (f"*Воркер {routing['worker']} из {routing['workers']}:* своих {routing['local']}, "
+                 f"передано {routing['forwarded']}, из очереди {routing['consumed']}, "
+                 f"повторов {routing['duplicates']}\n")
+    mailing = broadcast.get_stats()
+    text += f"*Рассылка:* подписчиков {mailing['subscribers']}"
+    if mailing["last_run"]:
+        last_run = mailing["last_run"]
+        text += (f", последняя ({last_run['send_time']}): отправлено {last_run['sent']} из {last_run['chats']} "
+                 f"за {last_run['seconds']:.0f}с, 429: {last_run['retry_after']}")
+    text += "\n"
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+async def trace_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /trace [id] (только для администраторов): медленные трассы"""
+    if update.effective_user.id not in ADMIN_IDS:
+        logger.warning("/trace от не-администратора: %s", update.effective_user.id)
+        return
+    
+    if context.args:
+        trace = tracer.find(context.args[0])
+        if trace is None:
+            await update.message.reply_text("Трасса не найдена")
+            return
+        # Лимит сообщения Telegram - 4096 символов
+        await update.message.reply_text(trace.format()[:4000])
+        return
+    
+    traces = list(tracer.recent_slow)[-10:]
+    if not traces:
+        await update.message.reply_text(f"Медленных трасс (дольше {tracer.slow_seconds:g}с) пока нет")
+        return
+    lines = [f"{trace.trace_id} {trace.duration:.2f}s {trace.attrs.get('chat_id')}" for trace in reversed(traces)]
+    await update.message.reply_text("Медленные трассы (/trace <id>):\n" + "\n".join(lines))
 
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик текстовых сообщений"""
-    print(f"[BOT DEBUG] Получено текстовое сообщение: '{update.message.text}'")
-    print(f"[BOT DEBUG] От пользователя: {update.message.from_user.id}")
+    tracer.event("[BOT] Текстовое сообщение от пользователя %s", update.message.from_user.id)
     
     keyboard = [
         [
@@ -226,34 +442,161 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         reply_markup=reply_markup
     )
 
-def main():
-    """Запуск бота"""
-    print("🚀 Запускаю бота...")
+async def warm_up() -> None:
+    """Создать AI клиент в фоне (импорт SDK не блокирует event loop), открыть соединения
+    с провайдерами, загрузить каталог блюд и наполнить буфер. Дальше - держать соединения открытыми при простое."""
+    client = None
+    if not OFFLINE_MODE:
+        try:
+            client = await asyncio.to_thread(get_client)
+            if hasattr(client, "warm_up"):
+                await client.warm_up()
+        except Exception as e:
+            logger.error(f"Ошибка прогрева AI клиента: {e}")
+    await asyncio.to_thread(get_dish_catalog)
+    dish_pool.start()
+    if HTTP_KEEPALIVE_PING and hasattr(client, "keep_alive"):
+        await client.keep_alive(HTTP_KEEPALIVE_PING)
+
+async def broadcast_tick(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Задача job queue раз в минуту: подготовка и отправка ежедневной рассылки"""
+    broadcast.tick(context.bot)
+
+async def post_init(application: Application) -> None:
+    """Запуск в event loop приложения: команды бота, метрики, рассылка и фоновый прогрев.
+    
+    Прогрев не задерживает прием обновлений - первый запрос, пришедший раньше,
+    сам создаст клиента.
+    """
+    await application.bot.set_my_commands([
+        BotCommand("start", "🏠 Главное меню"),
+        BotCommand("subscribe", "🔔 Меню на день каждый день"),
+        BotCommand("unsubscribe", "🔕 Отписаться от рассылки"),
+    ])
+    if application.job_queue:
+        # Проверка в начале каждой минуты
+        application.job_queue.run_repeating(broadcast_tick, interval=60, first=60 - time.time() % 60,
+                                            name="broadcast")
+    else:
+        logger.warning("Нет job queue (нужен python-telegram-bot[job-queue]) - рассылка отключена")
+    if METRICS_PORT:
+        application.bot_data["metrics_server"] = start_http_server(METRICS_PORT, METRICS_HOST)
+    application.bot_data["warmup_task"] = asyncio.create_task(warm_up())
+
+async def post_stop(application: Application) -> None:
+    """Дождаться начатых обновлений, пока HTTP клиент бота еще открыт.
+    
+    Обработчики выполняются в задачах ChatOrderedUpdateProcessor, которых
+    Application.stop() не ждет, а bot.shutdown() вызывается раньше
+    shutdown() processor - иначе их ответы уходили бы в закрытый клиент.
+    """
+    await application.update_processor.drain()
+
+async def post_shutdown(application: Application) -> None:
+    """Остановка фоновых задач"""
+    warmup_task = application.bot_data.pop("warmup_task", None)
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
+    await broadcast.stop()
+    await dish_pool.stop()
+    await close_client()
+    metrics_server = application.bot_data.pop("metrics_server", None)
+    if metrics_server:
+        metrics_server.shutdown()
+    subscription_store.close()
+    close_storage()
+
+def build_application(token: str = BOT_TOKEN, request=None,
+                      concurrent_updates: int = CONCURRENT_UPDATES) -> Application:
+    """Собрать приложение с обработчиками.
+    
+    request - необязательный транспорт Telegram API (например, фейковый
+    для нагрузочного тестирования).
+    """
+    global update_router, subscription_store, broadcast
+    tracer.configure(sample_rate=TRACE_SAMPLE_RATE, slow_seconds=TRACE_SLOW_SECONDS)
     
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Хранилища открываются здесь, а не при импорте; каталог блюд загружается в warm_up
+    get_history_store()
+    # Доля чатов этого воркера (при WORKER_COUNT > 1)
+    update_router = UpdateRouter(get_shared_state(), WORKER_INDEX, WORKER_COUNT, dedup_ttl=UPDATE_DEDUP_TTL)
+    # Подписки и ежедневная рассылка своей доли чатов
+    subscription_store = SubscriptionStore(SUBSCRIPTIONS_DB_PATH)
+    broadcast = BroadcastPipeline(subscription_store, generate_daily_menu, broadcast_message,
+                                  timezone=BROADCAST_TIMEZONE, prepare_ahead=BROADCAST_PREPARE_AHEAD,
+                                  batch_size=BROADCAST_BATCH_SIZE, prepare_concurrency=BROADCAST_PREPARE_CONCURRENCY,
+                                  rate=BROADCAST_RATE, senders=BROADCAST_SENDERS,
+                                  worker_index=WORKER_INDEX, worker_count=WORKER_COUNT)
+    
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(ChatOrderedUpdateProcessor(concurrent_updates, drain_timeout=DRAIN_TIMEOUT,
+                                                       on_update=inflight.on_update_received,
+                                                       route=update_router.route))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
     
     # Регистрируем обработчики
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("subscribe", subscribe_command))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("trace", trace_command))
     application.add_handler(CallbackQueryHandler(button_handler))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
+    return application
+
+async def run_worker(application: Application) -> None:
+    """Воркер без связи с Telegram: обновления своей доли чатов приходят из общей очереди"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
     
-    # Устанавливаем команды бота для меню
-    import asyncio
-    async def set_commands():
-        from telegram import BotCommand
-        commands = [
-            BotCommand("start", "🏠 Главное меню"),
-        ]
-        await application.bot.set_my_commands(commands)
-    
-    print("✅ Бот запущен и готов к работе!")
+    async with application:
+        await post_init(application)
+        await application.start()
+        consumer = asyncio.create_task(update_router.consume(application.update_queue, application.bot, stop))
+        await stop.wait()
+        await consumer
+        await application.stop()
+        await post_stop(application)
+        await post_shutdown(application)
+
+def main():
+    """Запуск бота"""
+    try:
+        validate_settings()
+    except ConfigError as e:
+        logger.error(f"❌ {e}")
+        sys.exit(1)
     
-    # Устанавливаем команды и запускаем
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(set_commands())
+    # Команды бота и фоновые задачи запускаются в post_init, в event loop приложения
+    application = build_application()
+    logger.info(f"🚀 Запускаю бота, режим: {BOT_MODE}")
     
-    application.run_polling()
+    if WORKER_INDEX > 0:
+        logger.info(f"Воркер {WORKER_INDEX} из {WORKER_COUNT}: обновления из общей очереди")
+        asyncio.run(run_worker(application))
+    elif BOT_MODE == "webhook":
+        # Telegram сам присылает обновления - нет лишнего круга long polling
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=min(max(CONCURRENT_UPDATES, 1), 100)
+        )
+    else:
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
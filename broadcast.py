@@ -0,0 +1,324 @@
+import asyncio
+import datetime
+import logging
+import sqlite3
+import threading
+import time
+from zoneinfo import ZoneInfo
+
+from telegram.error import Forbidden, NetworkError, RetryAfter, TelegramError
+
+from metrics import broadcast_messages, broadcast_phase_seconds
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+def parse_send_time(text):
+    """Время рассылки из текста "ЧЧ:ММ" (можно "9:30" или "9.30") в виде "09:30"; None, если формат неверный"""
+    try:
+        parsed = time.strptime(text.strip().replace(".", ":"), "%H:%M")
+    except ValueError:
+        return None
+    return f"{parsed.tm_hour:02d}:{parsed.tm_min:02d}"
+
+def retry_after_seconds(error):
+    """Пауза из ответа 429: в разных версиях python-telegram-bot - число секунд или timedelta"""
+    value = error.retry_after
+    return value.total_seconds() if isinstance(value, datetime.timedelta) else float(value)
+
+class SubscriptionStore:
+    """Подписки на ежедневное меню в SQLite: чат -> время рассылки "ЧЧ:ММ"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # busy_timeout - файл могут одновременно использовать несколько воркеров
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS subscriptions ("
+                          "chat_id INTEGER PRIMARY KEY, send_time TEXT NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS subscriptions_send_time ON subscriptions (send_time)")
+    
+    def subscribe(self, chat_id, send_time):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO subscriptions (chat_id, send_time) VALUES (?, ?)",
+                              (chat_id, send_time))
+    
+    def unsubscribe(self, chat_id) -> bool:
+        """Удалить подписку. False, если чат не был подписан"""
+        with self.lock:
+            cursor = self.conn.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+        return cursor.rowcount > 0
+    
+    def get(self, chat_id):
+        """Время рассылки чата или None"""
+        with self.lock:
+            row = self.conn.execute("SELECT send_time FROM subscriptions WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row[0] if row else None
+    
+    def chats_at(self, send_time):
+        with self.lock:
+            rows = self.conn.execute("SELECT chat_id FROM subscriptions WHERE send_time = ? ORDER BY chat_id",
+                                     (send_time,)).fetchall()
+        return [row[0] for row in rows]
+    
+    def send_times(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT DISTINCT send_time FROM subscriptions").fetchall()
+        return [row[0] for row in rows]
+    
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0]
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class BroadcastPipeline:
+    """Ежедневная рассылка меню подписчикам.
+    
+    Меню готовятся заранее: за prepare_ahead секунд до рассылки пачками по batch_size,
+    пачки равномерно распределены по первой половине этого окна - провайдеры AI
+    получают ровный поток запросов вместо всплеска в момент отправки. Пачка
+    стартует по расписанию, не дожидаясь предыдущих: если AI отвечает дольше
+    интервала между пачками, они идут параллельно (не больше prepare_concurrency
+    одновременно), так что подготовка укладывается в окно при любом числе
+    подписчиков, пока хватает prepare_concurrency. Подписчикам,
+    для которых меню не готово (подписались позже, генерация не удалась, перезапуск),
+    меню генерируется во время отправки.
+    
+    Отправка идет через ограниченную очередь (генерация не убегает вперед отправки)
+    несколькими отправителями: не быстрее rate сообщений в секунду и не чаще раза
+    в per_chat_interval секунд в один чат. Ответ 429 (RetryAfter) приостанавливает
+    всю отправку на указанное Telegram время и снижает темп до конца рассылки;
+    сообщение отправляется повторно.
+    
+    Каждый воркер рассылает своей доле чатов (chat_id % worker_count, как в
+    update_router), лимит отправки делится между воркерами.
+    """
+    
+    # Рассылка, пропущенная не больше стольких секунд назад (например, из-за перезапуска), еще отправляется
+    SEND_GRACE = 300
+    # Во сколько раз снижается темп отправки после ответа 429
+    RETRY_AFTER_SLOWDOWN = 0.8
+    
+    def __init__(self, store, generate, render, timezone="UTC", prepare_ahead=900.0, batch_size=10,
+                 prepare_concurrency=8, rate=25.0, senders=8, per_chat_interval=1.0, max_retries=5,
+                 worker_index=0, worker_count=1):
+        self.store = store
+        self.generate = generate  # async функция chat_id -> меню (None - не удалось)
+        self.render = render  # меню -> аргументы bot.send_message (text, parse_mode, reply_markup)
+        self.timezone = ZoneInfo(timezone)
+        self.prepare_ahead = prepare_ahead
+        self.batch_size = max(1, batch_size)
+        self.prepare_concurrency = max(1, prepare_concurrency)  # пачек подготовки одновременно
+        self.worker_index = worker_index
+        self.worker_count = max(1, worker_count)
+        self.rate = rate / self.worker_count
+        self.senders = max(1, senders)
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        # Всплеск не больше пятой части секундного лимита
+        self.bucket = TokenBucket(self.rate * 60, capacity=max(1.0, self.rate / 5))
+        self.send_lock = asyncio.Lock()
+        self.paused_until = 0.0
+        self.last_sent = {}  # chat_id -> время последней попытки отправки
+        self.prepared = {}  # время рассылки -> {chat_id: меню}
+        self.started = set()  # (этап, время рассылки, дата) - уже запущенные этапы
+        self.tasks = {}  # этап -> задача
+        self.stats = {"generated": 0, "generation_failed": 0, "on_demand": 0, "sent": 0,
+                      "retry_after": 0, "retried": 0, "blocked": 0, "failed": 0}
+        self.last_run = None
+        self.last_prepare = None
+    
+    def _chats(self, send_time):
+        return [chat_id for chat_id in self.store.chats_at(send_time)
+                if chat_id % self.worker_count == self.worker_index]
+    
+    def _next_run(self, send_time, now):
+        """Ближайшее время рассылки send_time (не раньше SEND_GRACE секунд назад)"""
+        hour, minute = map(int, send_time.split(":"))
+        run_at = datetime.datetime.combine(now.date(), datetime.time(hour, minute), tzinfo=self.timezone)
+        if run_at < now - datetime.timedelta(seconds=self.SEND_GRACE):
+            run_at += datetime.timedelta(days=1)
+        return run_at
+    
+    def tick(self, bot, now=None):
+        """Запустить подготовку и отправку, время которых наступило (вызывается раз в минуту из job queue)"""
+        now = now or datetime.datetime.now(self.timezone)
+        self.started = {key for key in self.started if key[2] >= now.date() - datetime.timedelta(days=1)}
+        for send_time in self.store.send_times():
+            run_at = self._next_run(send_time, now)
+            seconds_left = (run_at - now).total_seconds()
+            if 0 < seconds_left <= self.prepare_ahead:
+                deadline = time.monotonic() + seconds_left
+                self._start(("prepare", send_time, run_at.date()),
+                            lambda send_time=send_time, deadline=deadline: self.prepare(send_time, deadline))
+            elif seconds_left <= 0:
+                # Недоготовленные меню сгенерирует отправка
+                prepare = self.tasks.get(("prepare", send_time, run_at.date()))
+                if prepare:
+                    prepare.cancel()
+                self._start(("send", send_time, run_at.date()), lambda send_time=send_time: self.send(bot, send_time))
+    
+    def _start(self, key, run):
+        if key in self.started:
+            return
+        self.started.add(key)
+        task = asyncio.get_running_loop().create_task(self._timed(key[0], run))
+        self.tasks[key] = task
+        task.add_done_callback(lambda _: self.tasks.pop(key, None))
+    
+    async def _timed(self, phase, run):
+        started = time.monotonic()
+        try:
+            await run()
+        except Exception as e:
+            logger.error(f"[BROADCAST] Ошибка рассылки ({phase}): {type(e).__name__}: {e}")
+        finally:
+            broadcast_phase_seconds.observe(time.monotonic() - started, phase)
+    
+    async def stop(self):
+        """Остановить идущие подготовку и отправку"""
+        tasks = [task for task in self.tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _generate(self, chat_id):
+        try:
+            menu = await self.generate(chat_id)
+        except Exception as e:
+            logger.warning(f"[BROADCAST] Ошибка генерации меню для чата {chat_id}: {type(e).__name__}: {e}")
+            menu = None
+        self.stats["generated" if menu else "generation_failed"] += 1
+        return menu
+    
+    async def _generate_batch(self, chat_ids):
+        """Меню для пачки чатов: [(chat_id, меню)] без неудавшихся"""
+        menus = await asyncio.gather(*(self._generate(chat_id) for chat_id in chat_ids))
+        return [(chat_id, menu) for chat_id, menu in zip(chat_ids, menus) if menu]
+    
+    async def prepare(self, send_time, deadline=None):
+        """Сгенерировать меню подписчикам send_time пачками, распределив пачки до deadline (time.monotonic)"""
+        prepared = self.prepared[send_time] = {}
+        chat_ids = self._chats(send_time)
+        batches = [chat_ids[start:start + self.batch_size] for start in range(0, len(chat_ids), self.batch_size)]
+        begin = time.monotonic()
+        window = deadline - begin if deadline else None
+        # Пачки стартуют равномерно в первой половине окна, вторая половина - запас
+        interval = window / 2 / len(batches) if window and batches else 0.0
+        slots = asyncio.Semaphore(self.prepare_concurrency)
+        
+        async def run_batch(batch):
+            try:
+                prepared.update(await self._generate_batch(batch))
+            finally:
+                slots.release()
+        
+        tasks = []
+        try:
+            for index, batch in enumerate(batches):
+                await asyncio.sleep(max(0.0, begin + index * interval - time.monotonic()))
+                # Отстали от расписания (AI отвечает медленно) - следующая пачка стартует, как только освободится слот
+                await slots.acquire()
+                tasks.append(asyncio.create_task(run_batch(batch)))
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.last_prepare = {"send_time": send_time, "chats": len(chat_ids), "prepared": len(prepared),
+                                 "seconds": time.monotonic() - begin, "window": window}
+        window_text = f" (окно {window:.0f}с)" if window else ""
+        logger.info(f"[BROADCAST] {send_time}: подготовлено меню {len(prepared)} из {len(chat_ids)} "
+                    f"за {self.last_prepare['seconds']:.1f}с{window_text}")
+    
+    async def send(self, bot, send_time):
+        """Отправить меню подписчикам send_time: сначала готовые, затем сгенерированные по ходу"""
+        prepared = self.prepared.pop(send_time, {})
+        chat_ids = self._chats(send_time)
+        before = dict(self.stats)
+        started = time.monotonic()
+        self.bucket.rate = self.rate  # темп, сниженный после 429 в прошлый раз, восстанавливается
+        queue = asyncio.Queue(maxsize=self.senders * 2)
+        senders = [asyncio.create_task(self._sender(bot, queue)) for _ in range(self.senders)]
+        try:
+            for chat_id in chat_ids:
+                if chat_id in prepared:
+                    await queue.put((chat_id, prepared[chat_id]))
+            missing = [chat_id for chat_id in chat_ids if chat_id not in prepared]
+            self.stats["on_demand"] += len(missing)
+            for start in range(0, len(missing), self.batch_size):
+                for item in await self._generate_batch(missing[start:start + self.batch_size]):
+                    await queue.put(item)
+            for _ in senders:
+                await queue.put(None)
+            await asyncio.gather(*senders)
+        finally:
+            for task in senders:
+                task.cancel()
+        
+        self.last_run = {key: self.stats[key] - before[key] for key in ("sent", "failed", "blocked", "retry_after")}
+        self.last_run.update(send_time=send_time, chats=len(chat_ids), seconds=time.monotonic() - started)
+        logger.info(f"[BROADCAST] {send_time}: отправлено {self.last_run['sent']} из {len(chat_ids)} "
+                    f"за {self.last_run['seconds']:.1f}с, 429: {self.last_run['retry_after']}")
+    
+    async def _sender(self, bot, queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            chat_id, menu = item
+            await self._deliver(bot, chat_id, self.render(menu))
+    
+    async def _acquire(self, chat_id):
+        """Дождаться слота отправки: пауза после 429, лимит в секунду и интервал между сообщениями в чат"""
+        chat_wait = self.last_sent.get(chat_id, float("-inf")) + self.per_chat_interval - time.monotonic()
+        if chat_wait > 0:
+            await asyncio.sleep(chat_wait)
+        async with self.send_lock:
+            while True:
+                wait = max(self.paused_until - time.monotonic(), self.bucket.time_until(1))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.bucket.consume(1)
+        self.last_sent[chat_id] = time.monotonic()
+    
+    def _count(self, result):
+        self.stats[result] += 1
+        broadcast_messages.inc(result)
+    
+    async def _deliver(self, bot, chat_id, message):
+        try:
+            for attempt in range(self.max_retries + 1):
+                await self._acquire(chat_id)
+                try:
+                    await bot.send_message(chat_id=chat_id, **message)
+                    self._count("sent")
+                    return
+                except RetryAfter as e:
+                    # Лимит Telegram превышен - пауза для всех отправителей и темп ниже
+                    self._count("retry_after")
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after_seconds(e))
+                    self.bucket.rate = max(self.bucket.rate * self.RETRY_AFTER_SLOWDOWN, self.rate / 10)
+                except Forbidden:
+                    # Бот заблокирован или чат удален - подписка больше не нужна
+                    self.store.unsubscribe(chat_id)
+                    self._count("blocked")
+                    return
+                except NetworkError as e:
+                    self._count("retried")
+                    logger.warning(f"[BROADCAST] Сетевая ошибка отправки в чат {chat_id}: {e}")
+                    await asyncio.sleep(min(2 ** attempt, 30))
+                except TelegramError as e:
+                    logger.warning(f"[BROADCAST] Не удалось отправить меню в чат {chat_id}: {e}")
+                    break
+            self._count("failed")
+        finally:
+            self.last_sent.pop(chat_id, None)
+    
+    def get_stats(self) -> dict:
+        return {"subscribers": self.store.count(), **self.stats, "last_run": self.last_run,
+                "last_prepare": self.last_prepare}
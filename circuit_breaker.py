@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """Предохранитель для AI провайдера.
+    
+    closed - запросы идут как обычно, результаты пишутся в скользящее окно;
+    open - доля ошибок превысила порог, провайдер пропускается сразу;
+    half_open - после паузы пропускается пробный запрос: успех закрывает
+    предохранитель, ошибка снова открывает его.
+    
+    shared - общее состояние воркеров (shared_state.SharedState): открытие
+    предохранителя видят все воркеры, и недоступный провайдер пропускается
+    сразу везде, а не после собственных min_calls ошибок в каждом процессе.
+    С общим состоянием работает фоновый поток (раз в shared_check_interval
+    и при смене состояния), а сам предохранитель читает только локальную
+    копию - запросы не ждут Redis, даже если он недоступен. close()
+    останавливает поток; вызывать до закрытия общего состояния.
+    """
+    
+    def __init__(self, name, failure_rate=0.5, window=20, min_calls=5, open_seconds=30.0,
+                 half_open_calls=1, slow_call_seconds=None, shared=None, shared_check_interval=1.0):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.slow_call_seconds = slow_call_seconds  # медленный ответ считается ошибкой
+        self.outcomes = deque(maxlen=window)  # True - успех, False - ошибка/таймаут
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+        self.shared = shared
+        self.shared_check_interval = shared_check_interval
+        self.shared_key = f"breaker:{name}"
+        self.shared_open_until = 0.0  # до какого времени (time.time) открыт другим воркером, по последнему чтению
+        self.shared_pending = None  # что опубликовать: секунды открытия, 0 - закрыт
+        self.shared_lock = threading.Lock()
+        self.shared_wakeup = threading.Event()
+        self.shared_stop = threading.Event()
+        self.shared_thread = None
+        if shared is not None:
+            self.shared_thread = threading.Thread(target=self._shared_loop, name=f"breaker-{name}", daemon=True)
+            self.shared_thread.start()
+    
+    def _refresh_state(self):
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self._set_state(HALF_OPEN)
+            self.probes_in_flight = 0
+        elif self.state == CLOSED and self.shared is not None:
+            self._check_shared()
+    
+    def _check_shared(self):
+        """Открыть предохранитель, если его открыл другой воркер (по локальной копии общего состояния)"""
+        remaining = self.shared_open_until - time.time()
+        if remaining > 0:
+            self._open(publish=False)
+            # Закрываемся одновременно с воркером, который открыл предохранитель
+            self.opened_at = time.monotonic() - max(0.0, self.open_seconds - remaining)
+    
+    def _publish(self, open_seconds):
+        if self.shared is None:
+            return
+        self.shared_open_until = time.time() + open_seconds if open_seconds else 0.0
+        with self.shared_lock:
+            self.shared_pending = open_seconds
+        self.shared_wakeup.set()
+    
+    def _shared_loop(self):
+        """Фоновый обмен с общим состоянием: публикация своих изменений и чтение чужих"""
+        while not self.shared_stop.is_set():
+            self.shared_wakeup.wait(self.shared_check_interval)
+            self.shared_wakeup.clear()
+            if self.shared_stop.is_set():
+                break
+            with self.shared_lock:
+                pending, self.shared_pending = self.shared_pending, None
+            try:
+                if pending:
+                    self.shared.set(self.shared_key, str(time.time() + pending), ttl=pending)
+                elif pending is not None:
+                    self.shared.delete(self.shared_key)
+                open_until = self.shared.get(self.shared_key)
+                with self.shared_lock:
+                    # Пока шло чтение, состояние могло смениться локально - прочитанное уже устарело
+                    if self.shared_pending is None:
+                        self.shared_open_until = float(open_until) if open_until else 0.0
+            except Exception as e:
+                logger.warning(f"[Breaker] {self.name}: общее состояние недоступно: {e}")
+    
+    def close(self, timeout=5.0):
+        """Остановить фоновый поток общего состояния (блокирует до его завершения)"""
+        if self.shared_thread is None:
+            return
+        self.shared_stop.set()
+        self.shared_wakeup.set()
+        self.shared_thread.join(timeout)
+        self.shared_thread = None
+    
+    def _set_state(self, state):
+        if state != self.state:
+            logger.warning(f"[Breaker] {self.name}: {self.state} -> {state}")
+            self.state = state
+    
+    def is_available(self) -> bool:
+        """Можно ли сейчас отправить запрос провайдеру (без резервирования пробы)"""
+        self._refresh_state()
+        if self.state == OPEN:
+            return False
+        if self.state == HALF_OPEN:
+            return self.probes_in_flight < self.half_open_calls
+        return True
+    
+    def allow_request(self) -> bool:
+        """Разрешить запрос. В half_open резервирует место под пробный запрос."""
+        if not self.is_available():
+            self.stats["rejected"] += 1
+            return False
+        if self.state == HALF_OPEN:
+            self.probes_in_flight += 1
+        return True
+    
+    def record_success(self, latency=None):
+        if self.slow_call_seconds and latency is not None and latency > self.slow_call_seconds:
+            self.record_failure()
+            return
+        self.stats["successes"] += 1
+        if self.state == HALF_OPEN:
+            # Проба прошла - провайдер снова в строю
+            self.outcomes.clear()
+            self._set_state(CLOSED)
+            self._publish(0)
+        self.outcomes.append(True)
+    
+    def record_failure(self):
+        self.stats["failures"] += 1
+        if self.state == HALF_OPEN:
+            self._open()
+            return
+        self.outcomes.append(False)
+        if len(self.outcomes) >= self.min_calls:
+            failures = self.outcomes.count(False)
+            if failures / len(self.outcomes) >= self.failure_rate:
+                self._open()
+    
+    def record_cancelled(self):
+        """Запрос отменен (например, проиграл хедж) - результат не учитывается"""
+        if self.state == HALF_OPEN and self.probes_in_flight > 0:
+            self.probes_in_flight -= 1
+    
+    def _open(self, publish=True):
+        self._set_state(OPEN)
+        self.opened_at = time.monotonic()
+        self.probes_in_flight = 0
+        self.outcomes.clear()
+        self.stats["opened"] += 1
+        if publish:
+            self._publish(self.open_seconds)
+    
+    def get_stats(self) -> dict:
+        self._refresh_state()
+        failures = self.outcomes.count(False)
+        return {
+            "state": self.state,
+            "error_rate": round(failures / len(self.outcomes), 3) if self.outcomes else 0.0,
+            **self.stats,
+        }
@@ -1,30 +1,210 @@
+import logging
 import os
+import time
+from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Числовые настройки, которые не удалось разобрать: при импорте берется значение по умолчанию,
+# а validate_settings() сообщает о них через ConfigError
+_invalid_settings = []
+
+def _env_number(name, default, cast=float):
+    """Числовая переменная окружения (пустая - значение по умолчанию)"""
+    raw = os.getenv(name, '').strip()
+    if not raw:
+        return cast(default)
+    try:
+        return cast(raw)
+    except ValueError:
+        _invalid_settings.append(f"{name}={raw}")
+        return cast(default)
+
+def _env_number_list(name, cast=float):
+    """Список чисел через запятую"""
+    values = []
+    for raw in os.getenv(name, '').split(','):
+        if not raw.strip():
+            continue
+        try:
+            values.append(cast(raw))
+        except ValueError:
+            _invalid_settings.append(f"{name}={raw.strip()}")
+    return values
+
 # Основные токены
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
 # Новые AI провайдеры
 DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
-AI_PROVIDER = os.getenv('AI_PROVIDER', 'deepseek').lower()  # deepseek, openai, mixed
+AI_PROVIDER = os.getenv('AI_PROVIDER', 'deepseek').lower()  # deepseek, openai, mixed, offline
+
+# Адреса API (по умолчанию - официальные; переопределяются, например, для локального стаба в бенчмарках)
+DEEPSEEK_BASE_URL = os.getenv('DEEPSEEK_BASE_URL') or None
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+
+# Политика выбора провайдера в режиме mixed: weighted, least_latency, cost_bounded, round_robin, random
+AI_ROUTING = os.getenv('AI_ROUTING', 'weighted').lower()
+ROUTING_EXPLORATION = _env_number('ROUTING_EXPLORATION', 0.1)  # доля запросов для переоценки провайдеров
+ROUTING_MAX_COST_PER_1K = _env_number('ROUTING_MAX_COST_PER_1K', 0.001)  # для cost_bounded, USD
+
+# Сколько запросов к AI отправляется одновременно при генерации меню
+MENU_CONCURRENCY = _env_number('MENU_CONCURRENCY', 7, int)
+
+# Хеджирование: если основной провайдер не ответил за HEDGE_PERCENTILE его задержек,
+# запрос дублируется следующему провайдеру (0 - отключено). HEDGE_BUDGET - максимальная доля хеджей
+HEDGE_PERCENTILE = _env_number('HEDGE_PERCENTILE', 0)
+HEDGE_BUDGET = _env_number('HEDGE_BUDGET', 0.1)
+HEDGE_DEFAULT_DELAY = _env_number('HEDGE_DEFAULT_DELAY', 3.0)  # пока нет статистики задержек
+
+# Предохранитель провайдера: открывается при доле ошибок BREAKER_FAILURE_RATE среди последних
+# BREAKER_WINDOW запросов (но не раньше BREAKER_MIN_CALLS), пробный запрос через BREAKER_OPEN_SECONDS
+BREAKER_FAILURE_RATE = _env_number('BREAKER_FAILURE_RATE', 0.5)
+BREAKER_WINDOW = _env_number('BREAKER_WINDOW', 20, int)
+BREAKER_MIN_CALLS = _env_number('BREAKER_MIN_CALLS', 5, int)
+BREAKER_OPEN_SECONDS = _env_number('BREAKER_OPEN_SECONDS', 30)
+BREAKER_SLOW_CALL_SECONDS = _env_number('BREAKER_SLOW_CALL_SECONDS', 20)  # медленнее - считается ошибкой
+
+# Режим генерации меню: per_meal - отдельный запрос на каждое блюдо, batch - все меню одним JSON запросом
+MENU_MODE = os.getenv('MENU_MODE', 'per_meal').lower()
+
+# Буфер заранее сгенерированных блюд: наполняется до DISH_POOL_HIGH, когда падает ниже DISH_POOL_LOW
+DISH_POOL_LOW = _env_number('DISH_POOL_LOW', 2, int)
+DISH_POOL_HIGH = _env_number('DISH_POOL_HIGH', 4, int)  # 0 - отключить буфер
+DISH_POOL_TTL = _env_number('DISH_POOL_TTL', 3600)  # секунды жизни блюда в буфере
+
+# Персональная история блюд (SQLite) и размер кэша активных пользователей в памяти
+HISTORY_DB_PATH = os.getenv('HISTORY_DB_PATH', 'dish_history.db')
+HISTORY_CACHE_SIZE = _env_number('HISTORY_CACHE_SIZE', 1000, int)
+
+# Поиск похожих блюд: сколько блюд помнить на категорию, порог похожести (0..1) и число повторных запросов
+DISH_HISTORY_SIZE = _env_number('DISH_HISTORY_SIZE', 50, int)
+SIMILARITY_THRESHOLD = _env_number('SIMILARITY_THRESHOLD', 0.75)
+SIMILARITY_RETRIES = _env_number('SIMILARITY_RETRIES', 2, int)
+
+# Куда сохранять блюда, которыми AI пополняет локальный каталог
+DISH_CATALOG_LEARNED_PATH = os.getenv('DISH_CATALOG_LEARNED_PATH', 'dish_catalog_learned.json')
+
+# Метрики: порт HTTP эндпоинта /metrics в формате Prometheus (0 - отключен)
+METRICS_PORT = _env_number('METRICS_PORT', 0, int)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Telegram ID администраторов через запятую (доступ к /stats)
+ADMIN_IDS = set(_env_number_list('ADMIN_IDS', int))
 
-# Проверка обязательных параметров
-if not BOT_TOKEN:
-    print("ОШИБКА: Токен бота не найден. Создайте файл .env и добавьте BOT_TOKEN=ваш_токен")
-    exit(1)
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # публичный адрес, например https://example.com
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = _env_number('WEBHOOK_PORT' if os.getenv('WEBHOOK_PORT') else 'PORT', 8443, int)  # PORT - как на Railway
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or None
 
-if not DEEPSEEK_API_KEY:
-    print("ОШИБКА: API ключ DeepSeek не найден. Добавьте DEEPSEEK_API_KEY=ваш_ключ в .env")
-    exit(1)
+# Сколько обновлений обрабатывается одновременно (1 - строго по очереди).
+# Обновления одного чата всегда обрабатываются по порядку
+CONCURRENT_UPDATES = _env_number('CONCURRENT_UPDATES', 64, int)
+DRAIN_TIMEOUT = _env_number('DRAIN_TIMEOUT', 30)  # ожидание начатых обновлений при остановке
 
-# Информация о конфигурации AI
-print(f"🤖 AI Провайдер: {AI_PROVIDER}")
-if OPENAI_API_KEY:
-    print("✅ OpenAI API ключ найден (резервный)")
-else:
-    print("⚠️ OpenAI API ключ не найден (будет использоваться только DeepSeek)")
+# Меню выводится по мере генерации; сообщение редактируется не чаще раза в STREAM_EDIT_INTERVAL секунд
+# (Telegram ограничивает частоту правок в одном чате)
+STREAM_EDIT_INTERVAL = _env_number('STREAM_EDIT_INTERVAL', 1.5)
+
+# Трассировка обновлений: доля трасс, выводимых в лог (0 - только медленные и с ошибками),
+# и порог медленного обновления в секундах - такие трассы доступны админам через /trace
+TRACE_SAMPLE_RATE = _env_number('TRACE_SAMPLE_RATE', 0)
+TRACE_SLOW_SECONDS = _env_number('TRACE_SLOW_SECONDS', 5)
+
+# Лимиты провайдеров в минуту (0 - без лимита). Сверх лимита запросы ждут в очереди,
+# которая обслуживает пользователей по кругу; при переполнении или ожидании дольше
+# AI_QUEUE_TIMEOUT блюдо сразу берется из буфера или локального каталога
+DEEPSEEK_RPM = _env_number('DEEPSEEK_RPM', 0, int)
+DEEPSEEK_TPM = _env_number('DEEPSEEK_TPM', 0, int)
+OPENAI_RPM = _env_number('OPENAI_RPM', 0, int)
+OPENAI_TPM = _env_number('OPENAI_TPM', 0, int)
+AI_QUEUE_SIZE = _env_number('AI_QUEUE_SIZE', 100, int)
+AI_QUEUE_PER_USER = _env_number('AI_QUEUE_PER_USER', 16, int)
+AI_QUEUE_TIMEOUT = _env_number('AI_QUEUE_TIMEOUT', 5)
+
+# Общий пул HTTP соединений к AI провайдерам: размер, сколько держать простаивающее соединение (секунды)
+# и HTTP/2 (нужен пакет h2). HTTP_KEEPALIVE_PING - пинговать провайдера после стольких секунд простоя,
+# чтобы первый запрос после паузы не открывал соединение заново (0 - отключено)
+HTTP_MAX_CONNECTIONS = _env_number('HTTP_MAX_CONNECTIONS', 100, int)
+HTTP_MAX_KEEPALIVE = _env_number('HTTP_MAX_KEEPALIVE', 20, int)
+HTTP_KEEPALIVE_EXPIRY = _env_number('HTTP_KEEPALIVE_EXPIRY', 90)
+HTTP2 = os.getenv('HTTP2', '0').lower() in ('1', 'true', 'yes')
+HTTP_KEEPALIVE_PING = _env_number('HTTP_KEEPALIVE_PING', 45)
+
+# Несколько воркеров: общее состояние (local - один процесс, sqlite - процессы одного хоста в файле
+# STATE_PATH, redis - воркеры на разных хостах, REDIS_URL). Чаты делятся между WORKER_COUNT воркерами
+# по chat_id; обновления от Telegram получает воркер с WORKER_INDEX=0 и передает остальным
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'local').lower()
+STATE_PATH = os.getenv('STATE_PATH', 'shared_state.db')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/0')
+WORKER_INDEX = _env_number('WORKER_INDEX', 0, int)
+WORKER_COUNT = _env_number('WORKER_COUNT', 1, int)
+UPDATE_DEDUP_TTL = _env_number('UPDATE_DEDUP_TTL', 3600)  # сколько помнить ID обработанных обновлений
+
+# Дедлайны обработчиков (секунды, 0 - без дедлайна): запросы к AI подстраивают под оставшийся бюджет
+# таймауты, ретраи и переключение на другого провайдера, а когда бюджет исчерпан - блюдо берется из каталога
+DISH_DEADLINE = _env_number('DISH_DEADLINE', 8)
+DAILY_MENU_DEADLINE = _env_number('DAILY_MENU_DEADLINE', 20)
+WEEKLY_MENU_DEADLINE = _env_number('WEEKLY_MENU_DEADLINE', 45)
+
+# Ежедневная рассылка меню подписчикам (/subscribe [ЧЧ:ММ]): время по умолчанию и часовой пояс,
+# за сколько секунд до рассылки готовить меню и сколько меню генерировать одновременно,
+# лимит отправки (Telegram допускает около 30 сообщений в секунду на бота)
+SUBSCRIPTIONS_DB_PATH = os.getenv('SUBSCRIPTIONS_DB_PATH', HISTORY_DB_PATH)
+BROADCAST_DEFAULT_TIME = os.getenv('BROADCAST_DEFAULT_TIME', '09:00')
+BROADCAST_TIMEZONE = os.getenv('BROADCAST_TIMEZONE', 'Europe/Moscow')
+BROADCAST_PREPARE_AHEAD = _env_number('BROADCAST_PREPARE_AHEAD', 900)
+BROADCAST_BATCH_SIZE = _env_number('BROADCAST_BATCH_SIZE', 10, int)
+BROADCAST_PREPARE_CONCURRENCY = _env_number('BROADCAST_PREPARE_CONCURRENCY', 8, int)  # пачек одновременно
+BROADCAST_RATE = _env_number('BROADCAST_RATE', 25)
+BROADCAST_SENDERS = _env_number('BROADCAST_SENDERS', 8, int)
+
+class ConfigError(Exception):
+    """Не хватает обязательных настроек или они противоречат друг другу"""
+
+def validate_settings():
+    """Проверить настройки перед запуском бота (при импорте config ничего не проверяется).
+    
+    Бросает ConfigError с понятным сообщением; вызывается из bot.main.
+    """
+    if _invalid_settings:
+        raise ConfigError("Настройки должны быть числами: " + ", ".join(_invalid_settings))
+    
+    if not BOT_TOKEN:
+        raise ConfigError("Токен бота не найден. Создайте файл .env и добавьте BOT_TOKEN=ваш_токен")
+    
+    if not DEEPSEEK_API_KEY and AI_PROVIDER != 'offline':
+        raise ConfigError("API ключ DeepSeek не найден. Добавьте DEEPSEEK_API_KEY=ваш_ключ в .env")
+    
+    if BOT_MODE == 'webhook' and not WEBHOOK_URL:
+        raise ConfigError("Для BOT_MODE=webhook нужен WEBHOOK_URL (публичный адрес бота)")
+    
+    if not 0 <= WORKER_INDEX < max(WORKER_COUNT, 1):
+        raise ConfigError(f"WORKER_INDEX должен быть от 0 до {WORKER_COUNT - 1}")
+    
+    if WORKER_COUNT > 1 and STATE_BACKEND not in ('sqlite', 'redis'):
+        raise ConfigError("Для WORKER_COUNT > 1 нужно общее состояние: STATE_BACKEND=sqlite или redis")
+    
+    try:
+        time.strptime(BROADCAST_DEFAULT_TIME, '%H:%M')
+    except ValueError:
+        raise ConfigError(f"BROADCAST_DEFAULT_TIME должно быть в формате ЧЧ:ММ, сейчас: {BROADCAST_DEFAULT_TIME}")
+    
+    try:
+        ZoneInfo(BROADCAST_TIMEZONE)
+    except (ValueError, LookupError):
+        raise ConfigError(f"Неизвестный часовой пояс BROADCAST_TIMEZONE: {BROADCAST_TIMEZONE}")
     
-print("✅ DeepSeek API ключ найден (основной)")
\ No newline at end of file
+    # Информация о конфигурации AI
+    logger.info(f"🤖 AI Провайдер: {AI_PROVIDER}")
+    if OPENAI_API_KEY:
+        logger.info("✅ OpenAI API ключ найден (резервный)")
+    else:
+        logger.warning("⚠️ OpenAI API ключ не найден (будет использоваться только DeepSeek)")
@@ -0,0 +1,64 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# Меньше стольких секунд на попытку запрос к AI не имеет смысла - сразу локальный fallback
+MIN_ATTEMPT_SECONDS = 1.0
+# Столько секунд бюджета остается обработчику на локальный fallback и ответ в Telegram
+DEADLINE_RESERVE = 0.5
+
+class DeadlineExceeded(Exception):
+    """Бюджета времени не хватает на запрос к AI"""
+
+class Deadline:
+    """Бюджет времени обработчика: ответ нужен до expires (по time.monotonic)"""
+    
+    __slots__ = ("name", "expires", "exhausted")
+    
+    def __init__(self, seconds, name=None):
+        self.name = name
+        self.expires = time.monotonic() + seconds
+        self.exhausted = False  # на запрос к AI не хватило бюджета - ответ без AI
+    
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+# Дедлайн текущего обработчика (задачи, созданные внутри, наследуют его)
+current_deadline = contextvars.ContextVar("current_deadline", default=None)
+
+@contextmanager
+def deadline_scope(seconds, name=None):
+    """Установить дедлайн на время блока; вложенный дедлайн не позже внешнего. seconds=0 - без дедлайна"""
+    if not seconds:
+        yield None
+        return
+    deadline = Deadline(seconds, name)
+    outer = current_deadline.get()
+    if outer is not None:
+        deadline.expires = min(deadline.expires, outer.expires)
+    token = current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
+
+def remaining_budget() -> Optional[float]:
+    """Сколько секунд осталось до дедлайна (None - дедлайна нет)"""
+    deadline = current_deadline.get()
+    return deadline.remaining() if deadline is not None else None
+
+def has_attempt_budget() -> bool:
+    """Хватает ли оставшегося бюджета еще на одну попытку запроса к AI"""
+    remaining = remaining_budget()
+    return remaining is None or remaining - DEADLINE_RESERVE >= MIN_ATTEMPT_SECONDS
+
+def mark_exhausted():
+    """Отметить, что ответ отдан без AI из-за исчерпанного бюджета"""
+    deadline = current_deadline.get()
+    if deadline is not None:
+        deadline.exhausted = True
+
+def is_exhausted() -> bool:
+    deadline = current_deadline.get()
+    return deadline is not None and deadline.exhausted
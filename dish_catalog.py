@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import random
+
+logger = logging.getLogger(__name__)
+
+# Встроенный каталог блюд лежит рядом с модулем
+BUILTIN_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dish_catalog.json")
+
+# Теги, по которым строится индекс
+TAGS = ("cuisine", "prep_time", "ingredient")
+
+class DishCatalog:
+    """Локальный каталог блюд по приемам пищи.
+    
+    Используется как мгновенный запасной вариант при недоступности AI,
+    как офлайн режим для нагрузочного тестирования и пополняется
+    проверенными ответами AI.
+    """
+    
+    def __init__(self, builtin_path=BUILTIN_CATALOG_PATH, learned_path=None, max_learned=500):
+        self.learned_path = learned_path
+        self.max_learned = max_learned
+        self.entries = {}  # прием пищи -> список блюд
+        self.names = {}  # прием пищи -> множество названий в нижнем регистре
+        self.tag_index = {}  # (прием пищи, тег, значение) -> список блюд
+        self.learned = {}  # прием пищи -> названия, добавленные из ответов AI
+        self.dirty = False
+        
+        self._load(builtin_path, learned=False)
+        if learned_path and os.path.exists(learned_path):
+            self._load(learned_path, learned=True)
+    
+    def _load(self, path, learned):
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"[CATALOG] Не удалось загрузить каталог {path}: {e}")
+            return
+        for meal_type, dishes in data.items():
+            for dish in dishes:
+                if isinstance(dish, str):
+                    dish = {"name": dish}
+                self._add(meal_type, dish, learned)
+    
+    def _add(self, meal_type, dish, learned=False):
+        name = dish.get("name", "").strip()
+        if not name or name.lower() in self.names.setdefault(meal_type, set()):
+            return False
+        self.names[meal_type].add(name.lower())
+        self.entries.setdefault(meal_type, []).append(dish)
+        for tag in TAGS:
+            if tag in dish:
+                self.tag_index.setdefault((meal_type, tag, dish[tag]), []).append(dish)
+        if learned:
+            self.learned.setdefault(meal_type, []).append(name)
+        return True
+    
+    def __len__(self):
+        return sum(len(dishes) for dishes in self.entries.values())
+    
+    def pick(self, meal_type, avoid=(), reject=None, **tags):
+        """Случайное блюдо для приема пищи с учетом тегов и списка исключений. None, если нет подходящих."""
+        if tags:
+            # Берем самый узкий список по тегам и проверяем остальные теги
+            candidates = min(
+                (self.tag_index.get((meal_type, tag, value), []) for tag, value in tags.items()),
+                key=len
+            )
+        else:
+            candidates = self.entries.get(meal_type, [])
+        if not candidates:
+            return None
+        
+        avoid_lower = {dish.lower() for dish in avoid}
+        
+        def suitable(dish):
+            if dish["name"].lower() in avoid_lower:
+                return False
+            if any(dish.get(tag) != value for tag, value in tags.items()):
+                return False
+            return not (reject and reject(dish["name"]))
+        
+        # Обычно подходит первый же случайный кандидат - полный перебор только как запасной путь
+        for _ in range(8):
+            dish = random.choice(candidates)
+            if suitable(dish):
+                return dish["name"]
+        suitable_dishes = [dish for dish in candidates if suitable(dish)]
+        return random.choice(suitable_dishes)["name"] if suitable_dishes else None
+    
+    def record(self, meal_type, dish_name):
+        """Добавить проверенный ответ AI в каталог"""
+        if meal_type not in self.entries:
+            return
+        if len(self.learned.get(meal_type, [])) >= self.max_learned:
+            return
+        if self._add(meal_type, {"name": dish_name, "source": "ai"}, learned=True):
+            self.dirty = True
+    
+    def save(self):
+        """Сохранить блюда, добавленные из ответов AI"""
+        if not self.learned_path or not self.dirty:
+            return
+        try:
+            with open(self.learned_path, "w", encoding="utf-8") as f:
+                json.dump(self.learned, f, ensure_ascii=False, indent=2)
+            self.dirty = False
+        except OSError as e:
+            logger.error(f"[CATALOG] Не удалось сохранить каталог: {e}")
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+class DishPool:
+    """Буфер заранее сгенерированных блюд для каждого приема пищи.
+    
+    Фоновые задачи держат количество блюд между нижней и верхней границей,
+    а запрос пользователя обслуживается из буфера без ожидания AI.
+    
+    Наполнение делает не больше high_watermark * 2 запросов за раз: если модель
+    раз за разом повторяет блюда из буфера, наполнение прекращается и
+    возобновляется не раньше чем через refill_backoff секунд.
+    """
+    
+    def __init__(self, generate, low_watermark=2, high_watermark=4, ttl=3600.0, refill_backoff=60.0,
+                 meal_types=("завтрак", "обед", "ужин")):
+        self.generate = generate  # async функция meal_type -> название блюда или None
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.ttl = ttl
+        self.refill_backoff = refill_backoff
+        self.backoff_until = {}  # meal_type -> time.monotonic(), до которого наполнение не запускается
+        self.buffers = {meal_type: deque() for meal_type in meal_types}
+        self.refill_tasks = {}
+        self.hits = 0
+        self.misses = 0
+    
+    @property
+    def enabled(self):
+        return self.high_watermark > 0
+    
+    def start(self):
+        """Запустить первичное наполнение буферов (нужен запущенный event loop)"""
+        for meal_type in self.buffers:
+            self._ensure_refill(meal_type)
+    
+    async def stop(self):
+        """Остановить фоновые задачи наполнения"""
+        tasks = [task for task in self.refill_tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.refill_tasks.clear()
+    
+    def peek(self, meal_type):
+        """Блюда, которые сейчас лежат в буфере"""
+        return [dish_name for dish_name, _ in self.buffers.get(meal_type, ())]
+    
+    def pop(self, meal_type, avoid=(), reject=None):
+        """Взять готовое блюдо из буфера. None, если подходящего блюда нет.
+        
+        reject - необязательная проверка блюда (например, на похожесть на историю).
+        """
+        if not self.enabled or meal_type not in self.buffers:
+            return None
+        
+        buffer = self.buffers[meal_type]
+        avoid_lower = {dish.lower() for dish in avoid}
+        expire_before = time.monotonic() - self.ttl
+        dish = None
+        
+        while buffer:
+            dish_name, created_at = buffer.popleft()
+            # Устаревшие блюда и блюда из недавней истории просто выбрасываем
+            if created_at < expire_before or dish_name.lower() in avoid_lower:
+                continue
+            if reject and reject(dish_name):
+                continue
+            dish = dish_name
+            break
+        
+        if dish:
+            self.hits += 1
+        else:
+            self.misses += 1
+        tracer.event("[POOL] %s: %s, в буфере %d", meal_type, "попадание" if dish else "промах", len(buffer))
+        
+        self._ensure_refill(meal_type)
+        return dish
+    
+    def get_stats(self):
+        """Размеры буферов и счетчики попаданий"""
+        return {
+            "sizes": {meal_type: len(buffer) for meal_type, buffer in self.buffers.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+    
+    def _ensure_refill(self, meal_type):
+        if not self.enabled or len(self.buffers[meal_type]) >= self.low_watermark:
+            return
+        task = self.refill_tasks.get(meal_type)
+        if task and not task.done():
+            return
+        if time.monotonic() < self.backoff_until.get(meal_type, 0.0):
+            return
+        try:
+            self.refill_tasks[meal_type] = asyncio.get_running_loop().create_task(self._refill(meal_type))
+        except RuntimeError:
+            # Нет запущенного event loop - наполним при следующем обращении
+            pass
+    
+    async def _refill(self, meal_type):
+        buffer = self.buffers[meal_type]
+        attempts = 0
+        while len(buffer) < self.high_watermark:
+            if attempts >= self.high_watermark * 2:
+                # Модель повторяет блюда из буфера - не тратим квоту провайдера впустую
+                self.backoff_until[meal_type] = time.monotonic() + self.refill_backoff
+                logger.warning(f"[POOL] Наполнение {meal_type} остановлено после {attempts} запросов "
+                               f"(повторы), следующее через {self.refill_backoff:.0f}с")
+                return
+            attempts += 1
+            try:
+                dish_name = await self.generate(meal_type)
+            except Exception as e:
+                logger.warning(f"[POOL] Ошибка наполнения {meal_type}: {type(e).__name__}: {e}")
+                return
+            if not dish_name:
+                return
+            if dish_name.lower() not in (dish.lower() for dish in self.peek(meal_type)):
+                buffer.append((dish_name, time.monotonic()))
+        logger.info(f"[POOL] Буфер {meal_type} наполнен: {len(buffer)}")
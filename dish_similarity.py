@@ -0,0 +1,165 @@
+import re
+from collections import Counter, deque
+from itertools import chain
+
+# Служебные слова, которые не влияют на суть блюда
+STOP_WORDS = {"с", "со", "и", "в", "во", "на", "по", "из", "под", "для", "без", "к", "от", "а"}
+
+# Окончания для грубого стемминга русских слов (длинные проверяются первыми)
+ENDINGS = sorted([
+    "ами", "ями", "ого", "его", "ому", "ему", "ыми", "ими", "ых", "их",
+    "ой", "ей", "ий", "ый", "ая", "яя", "ое", "ее", "ые", "ие", "ую", "юю",
+    "ом", "ем", "ах", "ях", "ов", "ев", "ам", "ям",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+], key=len, reverse=True)
+
+# Стем обрезается до этой длины, чтобы "овсянка" и "овсяная" совпали
+STEM_LENGTH = 5
+
+def _stem(word):
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            word = word[:-len(ending)]
+            break
+    return word[:STEM_LENGTH]
+
+def normalize_dish(name):
+    """Нормализованные токены названия блюда (стемы без служебных слов)"""
+    text = name.lower().replace("ё", "е")
+    words = re.findall(r"[a-zа-я]+", text)
+    return frozenset(_stem(word) for word in words if word not in STOP_WORDS)
+
+def _trigrams(tokens):
+    text = " " + " ".join(sorted(tokens)) + " "
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+def similarity(tokens_a, tokens_b, trigrams_a=None, trigrams_b=None):
+    """Оценка похожести двух блюд от 0 до 1"""
+    if not tokens_a or not tokens_b:
+        return 0.0
+    common = len(tokens_a & tokens_b)
+    # Вложенность ловит "Суп куриный" vs "Куриный суп с лапшой", Жаккар штрафует лишние слова
+    token_score = 0.5 * common / min(len(tokens_a), len(tokens_b)) + \
+        0.5 * common / len(tokens_a | tokens_b)
+    
+    trigrams_a = trigrams_a or _trigrams(tokens_a)
+    trigrams_b = trigrams_b or _trigrams(tokens_b)
+    trigram_score = 2 * len(trigrams_a & trigrams_b) / (len(trigrams_a) + len(trigrams_b))
+    return max(token_score, trigram_score)
+
+class _Entry:
+    __slots__ = ("name", "tokens", "trigrams")
+    
+    def __init__(self, name, tokens):
+        self.name = name
+        self.tokens = tokens
+        self.trigrams = _trigrams(tokens)
+
+class DishIndex:
+    """Индекс похожих блюд с инвертированным списком по стемам.
+    
+    Сравнение идет только с блюдами, у которых есть общий стем, поэтому
+    поиск остается быстрым даже при тысячах запомненных блюд. Частые стемы
+    ("курица", "овощи") дают много кандидатов, поэтому дорогое сравнение
+    триграмм делается только для тех, кто может пройти порог: с общими
+    стемами хотя бы в половине слов короткого названия и с подходящим
+    числом триграмм.
+    """
+    
+    def __init__(self, capacity=50):
+        self.capacity = capacity
+        self.entries = deque()
+        self.by_tokens = {}  # набор стемов -> запись
+        self.postings = {}  # стем -> множество наборов стемов
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def names(self):
+        """Названия блюд от старых к новым"""
+        return [entry.name for entry in self.entries]
+    
+    def add(self, name):
+        tokens = normalize_dish(name)
+        if not tokens:
+            return
+        existing = self.by_tokens.get(tokens)
+        if existing is not None:
+            # То же блюдо - просто обновляем его позицию
+            self.entries.remove(existing)
+            self.entries.append(existing)
+            return
+        
+        entry = _Entry(name, tokens)
+        self.entries.append(entry)
+        self.by_tokens[tokens] = entry
+        for token in tokens:
+            self.postings.setdefault(token, set()).add(tokens)
+        
+        while len(self.entries) > self.capacity:
+            self._remove(self.entries.popleft())
+    
+    def _remove(self, entry):
+        del self.by_tokens[entry.tokens]
+        for token in entry.tokens:
+            bucket = self.postings.get(token)
+            if bucket:
+                bucket.discard(entry.tokens)
+                if not bucket:
+                    del self.postings[token]
+    
+    def find_similar(self, name, threshold):
+        """Найти самое похожее блюдо. Возвращает (название, оценка) или None."""
+        tokens = normalize_dish(name)
+        if not tokens:
+            return None
+        # Сколько стемов у каждого кандидата общих с названием
+        shared = Counter(chain.from_iterable(self.postings.get(token, ()) for token in tokens))
+        
+        trigrams = _trigrams(tokens)
+        best = None
+        bar = threshold  # оценка, которую нужно превзойти
+        for candidate, common in shared.items():
+            smaller = min(len(tokens), len(candidate))
+            if common * 2 < smaller:
+                # Общих стемов меньше половины - блюда разные
+                continue
+            entry = self.by_tokens[candidate]
+            # Оценка по стемам считается из числа общих стемов без пересечения множеств
+            score = 0.5 * common / smaller + 0.5 * common / (len(tokens) + len(candidate) - common)
+            total = len(trigrams) + len(entry.trigrams)
+            # Коэффициент Дайса по триграммам не больше 2 * min / сумма - иначе не считаем
+            if 2 * min(len(trigrams), len(entry.trigrams)) / total >= max(bar, score):
+                score = max(score, 2 * len(trigrams & entry.trigrams) / total)
+            if score >= bar and (best is None or score > best[1]):
+                best = (entry.name, score)
+                bar = score
+        return best
+
+class SimilarityStats:
+    """Счетчики проверок ответов AI на похожесть"""
+    
+    def __init__(self):
+        self.checks = 0
+        self.hits = 0  # найден похожий дубль
+        self.rejections = 0  # ответ отброшен и запрошен повторно
+    
+    def record(self, hit, rejected):
+        self.checks += 1
+        if hit:
+            self.hits += 1
+        if rejected:
+            self.rejections += 1
+    
+    def get_stats(self):
+        checks = self.checks or 1
+        return {
+            "checks": self.checks,
+            "hits": self.hits,
+            "rejections": self.rejections,
+            "hit_rate": self.hits / checks,
+            "rejection_rate": self.rejections / checks,
+        }
+
+# Глобальные счетчики
+similarity_stats = SimilarityStats()
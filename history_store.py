@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from memory_manager import DishMemory
+from shared_state import StateError
+
+logger = logging.getLogger(__name__)
+
+class HistoryStore:
+    """Персональная история блюд для каждого чата с хранением в SQLite.
+    
+    Активные пользователи держатся в ограниченном LRU кэше, а запись на диск
+    идет пачками из отдельного потока, поэтому обработчики не ждут fsync.
+    
+    state - общее хранилище (shared_state.SharedState) вместо файла SQLite,
+    например Redis для воркеров на разных хостах. Кэш остается локальным:
+    обновления одного чата обрабатывает один воркер (см. update_router).
+    """
+    
+    def __init__(self, path, cache_size=1000, max_dishes=5, history_size=50, flush_interval=1.0, state=None):
+        self.path = path
+        self.cache_size = cache_size
+        self.max_dishes = max_dishes
+        self.history_size = history_size
+        self.flush_interval = flush_interval
+        self.cache = OrderedDict()  # chat_id -> DishMemory
+        self.pending = {}  # chat_id -> JSON, еще не записанный на диск
+        self.writing = {}  # пачка, которая пишется прямо сейчас
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.state = state
+        
+        # Отдельные соединения для чтения (event loop) и записи (фоновый поток)
+        if state is None:
+            self.write_conn = self._connect()
+            self.write_conn.execute(
+                "CREATE TABLE IF NOT EXISTS dish_history ("
+                "chat_id INTEGER PRIMARY KEY, dishes TEXT NOT NULL)"
+            )
+            self.write_conn.commit()
+            self.read_conn = self._connect()
+        
+        self.writer = threading.Thread(target=self._writer_loop, name="history-writer", daemon=True)
+        self.writer.start()
+    
+    def _connect(self):
+        # busy_timeout - базу могут одновременно писать несколько воркеров
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    
+    async def get_memory(self, chat_id):
+        """Получить память блюд пользователя (из кэша или из хранилища).
+        
+        Чтение из общего хранилища (Redis) идет в отдельном потоке, чтобы не
+        блокировать event loop. Если историю прочитать не удалось, возвращается
+        временная пустая память без сохранения: она не попадает в кэш и не
+        затирает сохраненную историю, а следующий запрос читает ее снова.
+        """
+        memory = self.cache.get(chat_id)
+        if memory is not None:
+            self.cache.move_to_end(chat_id)
+            return memory
+        
+        try:
+            if self.state is not None:
+                data = await asyncio.to_thread(self._load, chat_id)
+            else:
+                data = self._load(chat_id)
+        except StateError as e:
+            logger.error(f"[HISTORY] Ошибка чтения истории чата {chat_id}: {e}")
+            return DishMemory(max_dishes=self.max_dishes, history_size=self.history_size)
+        
+        # Пока история читалась, память чата мог загрузить параллельный запрос
+        memory = self.cache.get(chat_id)
+        if memory is not None:
+            self.cache.move_to_end(chat_id)
+            return memory
+        memory = DishMemory.from_dict(data, max_dishes=self.max_dishes, history_size=self.history_size,
+                                      on_change=lambda m: self._schedule_save(chat_id, m))
+        self.cache[chat_id] = memory
+        # Вытесняем давно неактивных пользователей - их данные уже в очереди на запись
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return memory
+    
+    def _load(self, chat_id):
+        with self.lock:
+            raw = self.pending.get(chat_id) or self.writing.get(chat_id)
+        if raw is None:
+            raw = self._read(chat_id)
+        if not raw:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            logger.warning(f"[HISTORY] Поврежденная история для чата {chat_id}")
+            return None
+    
+    def _read(self, chat_id):
+        if self.state is not None:
+            return self.state.get(f"history:{chat_id}")
+        row = self.read_conn.execute(
+            "SELECT dishes FROM dish_history WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        return row[0] if row else None
+    
+    def _write(self, items):
+        if self.state is not None:
+            self.state.set_many({f"history:{chat_id}": raw for chat_id, raw in items.items()})
+            return
+        self.write_conn.executemany(
+            "INSERT OR REPLACE INTO dish_history (chat_id, dishes) VALUES (?, ?)",
+            list(items.items())
+        )
+        self.write_conn.commit()
+    
+    def _schedule_save(self, chat_id, memory):
+        raw = json.dumps(memory.to_dict(), ensure_ascii=False)
+        with self.lock:
+            self.pending[chat_id] = raw
+        self.wakeup.set()
+    
+    def _writer_loop(self):
+        while not self.closed:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            # Небольшая пауза, чтобы собрать изменения в одну транзакцию
+            time.sleep(self.flush_interval)
+            self.flush()
+    
+    def flush(self):
+        """Записать накопленные изменения одной транзакцией"""
+        with self.lock:
+            if not self.pending:
+                return
+            self.writing, self.pending = self.pending, {}
+        
+        # Запись идет без блокировки, обработчики продолжают добавлять изменения
+        try:
+            self._write(self.writing)
+        except (sqlite3.Error, StateError, OSError) as e:
+            logger.error(f"[HISTORY] Ошибка записи истории: {e}")
+            with self.lock:
+                # Возвращаем пачку в очередь, не затирая более свежие изменения
+                for chat_id, raw in self.writing.items():
+                    self.pending.setdefault(chat_id, raw)
+        finally:
+            with self.lock:
+                self.writing = {}
+    
+    def close(self):
+        """Сбросить изменения на диск и закрыть базу"""
+        self.closed = True
+        self.wakeup.set()
+        self.writer.join(timeout=self.flush_interval + 5)
+        self.flush()
+        if self.state is None:
+            self.write_conn.close()
+            self.read_conn.close()
@@ -0,0 +1,120 @@
+import importlib.util
+import logging
+import time
+
+import httpx
+
+from metrics import ai_http_requests, ai_http_connect_seconds
+
+logger = logging.getLogger(__name__)
+
+class HTTPTransport:
+    """Общий пул keep-alive соединений для всех AI провайдеров.
+    
+    SDK клиенты провайдеров получают один httpx клиент (асинхронный или
+    синхронный), поэтому соединение, открытое одним запросом, переиспользуется
+    следующими. keepalive_expiry - сколько простаивающее соединение держится
+    открытым (по умолчанию у httpx всего 5 секунд).
+    
+    Для каждого запроса через trace расширение httpcore отмечается, открывалось
+    ли новое соединение и сколько заняли TCP/TLS рукопожатия.
+    """
+    
+    def __init__(self, max_connections: int = 100, max_keepalive: int = 20,
+                 keepalive_expiry: float = 60.0, http2: bool = False, timeout: float = 60.0):
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("⚠️ HTTP/2 требует пакет h2 (pip install httpx[http2]), используется HTTP/1.1")
+            http2 = False
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.http2 = http2
+        self.timeout = timeout
+        self.stats = {"requests": 0, "new_connections": 0, "connect_seconds": 0.0}
+        self._async_client = None
+        self._sync_client = None
+    
+    def _record(self, host, new_connection, connect_seconds):
+        self.stats["requests"] += 1
+        ai_http_requests.inc(host, "new" if new_connection else "reused")
+        if new_connection:
+            self.stats["new_connections"] += 1
+            self.stats["connect_seconds"] += connect_seconds
+            ai_http_connect_seconds.observe(connect_seconds, host)
+    
+    def async_client(self) -> httpx.AsyncClient:
+        """Общий асинхронный клиент (создается при первом вызове)"""
+        if self._async_client is None:
+            transport = _TracedAsyncTransport(self, limits=self.limits, http2=self.http2)
+            self._async_client = httpx.AsyncClient(transport=transport, timeout=self.timeout,
+                                                   follow_redirects=True)
+        return self._async_client
+    
+    def sync_client(self) -> httpx.Client:
+        """Общий синхронный клиент (создается при первом вызове)"""
+        if self._sync_client is None:
+            transport = _TracedSyncTransport(self, limits=self.limits, http2=self.http2)
+            self._sync_client = httpx.Client(transport=transport, timeout=self.timeout, follow_redirects=True)
+        return self._sync_client
+    
+    async def aclose(self):
+        """Закрыть соединения пула"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+    
+    def get_stats(self) -> dict:
+        """Сколько запросов ушло по уже открытым соединениям"""
+        stats = dict(self.stats)
+        stats["reused"] = stats["requests"] - stats["new_connections"]
+        stats["reuse_rate"] = stats["reused"] / stats["requests"] if stats["requests"] else None
+        stats["http2"] = self.http2
+        stats["keepalive_expiry"] = self.limits.keepalive_expiry
+        return stats
+
+class _ConnectionTrace:
+    """Отметки httpcore об открытии соединения для одного запроса"""
+    
+    __slots__ = ("connect_started", "connect_seconds")
+    
+    def __init__(self):
+        self.connect_started = None
+        self.connect_seconds = 0.0
+    
+    def on_event(self, name, info):
+        if name == "connection.connect_tcp.started":
+            self.connect_started = time.perf_counter()
+        elif name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            if self.connect_started is not None:
+                self.connect_seconds = time.perf_counter() - self.connect_started
+
+class _TracedAsyncTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, owner: HTTPTransport, **kwargs):
+        super().__init__(**kwargs)
+        self.owner = owner
+    
+    async def handle_async_request(self, request):
+        trace = _ConnectionTrace()
+        
+        async def on_event(name, info):
+            trace.on_event(name, info)
+        
+        request.extensions["trace"] = on_event
+        response = await super().handle_async_request(request)
+        self.owner._record(request.url.host, trace.connect_started is not None, trace.connect_seconds)
+        return response
+
+class _TracedSyncTransport(httpx.HTTPTransport):
+    def __init__(self, owner: HTTPTransport, **kwargs):
+        super().__init__(**kwargs)
+        self.owner = owner
+    
+    def handle_request(self, request):
+        trace = _ConnectionTrace()
+        request.extensions["trace"] = trace.on_event
+        response = super().handle_request(request)
+        self.owner._record(request.url.host, trace.connect_started is not None, trace.connect_seconds)
+        return response
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+class GenerationSuperseded(Exception):
+    """Генерация отменена более новым запросом к тому же сообщению"""
+
+class _InFlight:
+    __slots__ = ("data", "task")
+    
+    def __init__(self, data, task):
+        self.data = data
+        self.task = task
+
+class InFlightRegistry:
+    """Учет генераций, которые сейчас идут для каждого сообщения чата.
+    
+    Новое нажатие на том же сообщении отменяет незавершенную генерацию,
+    а повторное нажатие той же кнопки, пока генерация еще идет, не
+    запускает вторую - сообщение обновит уже начатая генерация. Нажатия,
+    которые только меняют клавиатуру (passive_prefixes), генерацию не отменяют.
+    """
+    
+    def __init__(self, passive_prefixes=()):
+        self.passive_prefixes = tuple(passive_prefixes)
+        self.entries = {}  # (chat_id, message_id) -> _InFlight
+        self.coalesced_updates = set()
+        self.stats = {"started": 0, "coalesced": 0, "superseded": 0}
+    
+    @staticmethod
+    def _key(update):
+        if not isinstance(update, Update) or not update.callback_query:
+            return None, None
+        message = update.callback_query.message
+        if not message:
+            return None, None
+        return (message.chat.id, message.message_id), update.callback_query.data
+    
+    def on_update_received(self, update):
+        """Вызывается при получении обновления, до ожидания очереди чата.
+        
+        Возвращает True для схлопнутого нажатия: ему нужен только ответ на
+        callback, поэтому оно не встает в очередь чата за идущей генерацией.
+        """
+        key, data = self._key(update)
+        entry = self.entries.get(key) if key else None
+        if entry is None or entry.task.done() or (data or "").startswith(self.passive_prefixes):
+            return False
+        if entry.data == data:
+            # Та же кнопка еще обрабатывается - второе нажатие схлопываем
+            self.coalesced_updates.add(update.update_id)
+            self.stats["coalesced"] += 1
+            logger.debug("[INFLIGHT] Повторное нажатие '%s' в чате %s схлопнуто", data, key[0])
+            return True
+        entry.task.cancel()
+        self.stats["superseded"] += 1
+        logger.debug("[INFLIGHT] Генерация '%s' в чате %s отменена нажатием '%s'", entry.data, key[0], data)
+        return False
+    
+    def is_coalesced(self, update):
+        """Проверить (и забыть), было ли обновление схлопнуто с идущей генерацией"""
+        if update.update_id in self.coalesced_updates:
+            self.coalesced_updates.discard(update.update_id)
+            return True
+        return False
+    
+    async def run(self, update, coroutine):
+        """Выполнить генерацию для сообщения из update с учетом отмены.
+        
+        Бросает GenerationSuperseded, если генерацию отменил более новый запрос.
+        """
+        key, data = self._key(update)
+        task = asyncio.ensure_future(coroutine)
+        if key is None:
+            return await task
+        
+        entry = _InFlight(data, task)
+        self.entries[key] = entry
+        self.stats["started"] += 1
+        try:
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            if self.entries.get(key) is entry:
+                del self.entries[key]
+        
+        if task.cancelled():
+            raise GenerationSuperseded(data)
+        return task.result()
+
+# Глобальный реестр генераций
+inflight = InFlightRegistry(passive_prefixes=("menu_day:", "menu_keyboard:"))
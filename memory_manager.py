@@ -1,45 +1,147 @@
+import logging
+
+from dish_similarity import DishIndex
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+class DishSlot:
+    """Зарезервированное место в памяти под блюдо, которое еще генерируется"""
+    
+    def __init__(self, meal_type):
+        self.meal_type = meal_type
+        self.dish_name = None
+
 class DishMemory:
     """Класс для хранения последних предложенных блюд и избежания повторов"""
     
-    def __init__(self, max_dishes=5):
+    def __init__(self, max_dishes=5, on_change=None, history_size=50):
         self.max_dishes = max_dishes
+        self.on_change = on_change  # вызывается после каждого изменения (для сохранения на диск)
         self.recent_dishes = {
             "завтрак": [],
             "обед": [],
             "ужин": []
         }
+        # Более длинная история для поиска похожих блюд (в промпт не попадает)
+        self.indexes = {meal_type: DishIndex(history_size) for meal_type in self.recent_dishes}
+        # Последние сгенерированные меню: вид меню -> {день: [блюда в порядке recent_dishes]}
+        self.menus = {}
+    
+    def to_dict(self):
+        """Сериализовать заполненные блюда для хранения"""
+        return {
+            "recent": {meal_type: self.get_recent_dishes(meal_type) for meal_type in self.recent_dishes},
+            "history": {meal_type: index.names() for meal_type, index in self.indexes.items()},
+            "menus": self.menus,
+        }
+    
+    @classmethod
+    def from_dict(cls, data, max_dishes=5, on_change=None, history_size=50):
+        """Восстановить память из сохраненного словаря"""
+        memory = cls(max_dishes=max_dishes, history_size=history_size)
+        data = data or {}
+        if "recent" not in data:
+            # Старый формат: только последние блюда
+            data = {"recent": data, "history": {}}
+        for meal_type, dishes in data.get("history", {}).items():
+            if meal_type in memory.indexes:
+                for dish_name in dishes:
+                    memory.indexes[meal_type].add(dish_name)
+        for meal_type, dishes in data["recent"].items():
+            for dish_name in dishes:
+                memory.add_dish(meal_type, dish_name)
+        memory.menus = data.get("menus", {})
+        memory.on_change = on_change
+        return memory
+    
+    def _changed(self):
+        if self.on_change:
+            self.on_change(self)
     
     def add_dish(self, meal_type, dish_name):
         """Добавить блюдо в память"""
-        print(f"[MEMORY DEBUG] Добавляем блюдо '{dish_name}' в категорию '{meal_type}'")
-        if meal_type in self.recent_dishes:
-            self.recent_dishes[meal_type].append(dish_name)
-            # Оставляем только последние max_dishes блюд
-            if len(self.recent_dishes[meal_type]) > self.max_dishes:
-                removed = self.recent_dishes[meal_type].pop(0)
-                print(f"[MEMORY DEBUG] Удалили старое блюдо: '{removed}'")
-            print(f"[MEMORY DEBUG] Текущая память для {meal_type}: {self.recent_dishes[meal_type]}")
-        else:
-            print(f"[MEMORY ERROR] Неизвестная категория: {meal_type}")
+        slot = self.reserve_slot(meal_type)
+        if slot:
+            self.fill_slot(slot, dish_name)
+    
+    def reserve_slot(self, meal_type):
+        """Зарезервировать место под блюдо заранее (до ответа AI).
+        
+        Порядок блюд в памяти определяется моментом резервирования, поэтому
+        параллельная генерация меню не перемешивает историю.
+        """
+        if meal_type not in self.recent_dishes:
+            logger.error("[MEMORY] Неизвестная категория: %s", meal_type)
+            return None
+        
+        slot = DishSlot(meal_type)
+        self.recent_dishes[meal_type].append(slot)
+        # Оставляем только последние max_dishes блюд
+        if len(self.recent_dishes[meal_type]) > self.max_dishes:
+            removed = self.recent_dishes[meal_type].pop(0)
+            tracer.event("[MEMORY] Удалили старое блюдо: '%s'", removed.dish_name)
+        return slot
+    
+    def fill_slot(self, slot, dish_name):
+        """Записать сгенерированное блюдо в зарезервированное место"""
+        with tracer.span("memory_update", meal=slot.meal_type):
+            slot.dish_name = dish_name
+            self.indexes[slot.meal_type].add(dish_name)
+            self._changed()
+        tracer.event("[MEMORY] Добавили '%s' в '%s'", dish_name, slot.meal_type)
+    
+    def release_slot(self, slot):
+        """Освободить место, если блюдо так и не было получено"""
+        slots = self.recent_dishes.get(slot.meal_type, [])
+        if slot in slots and slot.dish_name is None:
+            slots.remove(slot)
     
     def get_recent_dishes(self, meal_type):
         """Получить список последних блюд для категории"""
-        return self.recent_dishes.get(meal_type, [])
+        return [slot.dish_name for slot in self.recent_dishes.get(meal_type, []) if slot.dish_name]
+    
+    def find_similar(self, meal_type, dish_name, threshold):
+        """Найти в истории блюдо, похожее на dish_name. (название, оценка) или None."""
+        index = self.indexes.get(meal_type)
+        return index.find_similar(dish_name, threshold) if index else None
     
     def clear_old(self, meal_type=None):
         """Очистить старые блюда (для конкретной категории или всех)"""
         if meal_type and meal_type in self.recent_dishes:
             self.recent_dishes[meal_type] = []
+            self.indexes[meal_type] = DishIndex(self.indexes[meal_type].capacity)
         elif meal_type is None:
             for category in self.recent_dishes:
                 self.recent_dishes[category] = []
+                self.indexes[category] = DishIndex(self.indexes[category].capacity)
+        self._changed()
+    
+    def set_menu(self, kind, menu):
+        """Запомнить сгенерированное меню {день: {прием пищи: блюдо}} для частичной перегенерации"""
+        self.menus[kind] = {
+            day: [meals.get(meal_type) for meal_type in self.recent_dishes] for day, meals in menu.items()
+        }
+        self._changed()
+    
+    def get_menu(self, kind):
+        """Последнее меню этого вида {день: {прием пищи: блюдо}} или None"""
+        stored = self.menus.get(kind)
+        if not stored:
+            return None
+        return {day: dict(zip(self.recent_dishes, dishes)) for day, dishes in stored.items()}
     
-    def get_avoid_list_text(self, meal_type):
+    def get_avoid_list_text(self, meal_type, extra_dishes=None):
         """Получить текст для промпта с блюдами для избежания"""
         recent = self.get_recent_dishes(meal_type)
-        if recent:
-            return f"НЕ предлагай эти блюда (уже были недавно): {', '.join(recent)}."
-        return ""
+        # Добавляем блюда, уже выбранные в текущем меню
+        for dish in extra_dishes or []:
+            if dish not in recent:
+                recent.append(dish)
+        return format_avoid_text(recent)
 
-# Глобальный экземпляр памяти
-dish_memory = DishMemory()
\ No newline at end of file
+def format_avoid_text(dishes):
+    """Текст для промпта со списком блюд, которые нельзя предлагать"""
+    if dishes:
+        return f"НЕ предлагай эти блюда (уже были недавно): {', '.join(dishes)}."
+    return ""
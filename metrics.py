@@ -0,0 +1,270 @@
+import bisect
+import functools
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from deadline import deadline_scope
+
+logger = logging.getLogger(__name__)
+
+# Границы бакетов задержки в секундах
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+class Counter:
+    """Счетчик с метками (монотонно растет)"""
+    
+    kind = "counter"
+    
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+    
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+    
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+    
+    def render(self):
+        lines = []
+        for labels, value in list(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Gauge:
+    """Текущее значение с метками (может расти и уменьшаться)"""
+    
+    kind = "gauge"
+    
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+    
+    def set(self, value, *labels):
+        self.values[labels] = value
+    
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+    
+    def render(self):
+        lines = []
+        for labels, value in list(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Histogram:
+    """Гистограмма с фиксированными бакетами (дешевая запись, без хранения сырых значений)"""
+    
+    kind = "histogram"
+    
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # метки -> [счетчики по бакетам + inf, сумма, количество]
+    
+    def observe(self, value, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+    
+    def count(self, *labels):
+        series = self.series.get(labels)
+        return series[2] if series else 0
+    
+    def mean(self, *labels):
+        series = self.series.get(labels)
+        return series[1] / series[2] if series and series[2] else None
+    
+    def quantile(self, q, *labels):
+        """Оценка квантиля по бакетам (верхняя граница бакета). None, если нет данных."""
+        series = self.series.get(labels)
+        if not series or not series[2]:
+            return None
+        target = q * series[2]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), series[0]):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+    
+    def render(self):
+        lines = []
+        for labels, (counts, total, count) in list(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                label_text = _format_labels(self.labelnames + ("le",), labels + (le,))
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+class Registry:
+    """Набор метрик, отдаваемых в формате Prometheus"""
+    
+    def __init__(self):
+        self.metrics = []
+    
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+    
+    def gauge(self, name, help_text, labelnames=()):
+        metric = Gauge(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+    
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+    
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Глобальный реестр и метрики бота
+registry = Registry()
+
+ai_request_seconds = registry.histogram(
+    "recipe_bot_ai_request_seconds", "Задержка запроса к AI провайдеру", ("provider",))
+ai_request_errors = registry.counter(
+    "recipe_bot_ai_request_errors_total", "Ошибки запросов к AI провайдеру", ("provider", "error"))
+ai_tokens = registry.counter(
+    "recipe_bot_ai_tokens_total", "Токены из response.usage", ("provider", "kind"))
+ai_prompt_cache_seconds = registry.histogram(
+    "recipe_bot_ai_prompt_cache_seconds", "Задержка запроса к AI с попаданием в кэш промпта и без",
+    ("provider", "cache"))
+handler_seconds = registry.histogram(
+    "recipe_bot_handler_seconds", "Полное время обработки кнопки", ("handler",))
+handler_errors = registry.counter(
+    "recipe_bot_handler_errors_total", "Необработанные ошибки в обработчиках", ("handler",))
+handler_deadline_overruns = registry.counter(
+    "recipe_bot_handler_deadline_overruns_total",
+    "Обработчики, не уложившиеся в дедлайн (late) или ответившие без AI из-за исчерпанного бюджета (fallback)",
+    ("handler", "reason"))
+ai_queue_depth = registry.gauge(
+    "recipe_bot_ai_queue_depth", "Запросы, ожидающие лимита провайдера", ("provider",))
+ai_queue_wait_seconds = registry.histogram(
+    "recipe_bot_ai_queue_wait_seconds", "Ожидание в очереди лимита провайдера", ("provider",),
+    buckets=(0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0))
+ai_requests_shed = registry.counter(
+    "recipe_bot_ai_requests_shed_total", "Запросы, отклоненные лимитом провайдера", ("provider", "reason"))
+ai_http_requests = registry.counter(
+    "recipe_bot_ai_http_requests_total", "HTTP запросы к AI провайдерам по новому или открытому соединению",
+    ("host", "connection"))
+ai_http_connect_seconds = registry.histogram(
+    "recipe_bot_ai_http_connect_seconds", "Установка нового соединения с AI провайдером (TCP и TLS)", ("host",),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0))
+broadcast_messages = registry.counter(
+    "recipe_bot_broadcast_messages_total", "Сообщения ежедневной рассылки по результату", ("result",))
+broadcast_phase_seconds = registry.histogram(
+    "recipe_bot_broadcast_phase_seconds", "Длительность подготовки и отправки рассылки", ("phase",),
+    buckets=(1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0))
+
+def cached_prompt_tokens(usage):
+    """Токены промпта, взятые провайдером из кэша: prompt_cache_hit_tokens у DeepSeek,
+    prompt_tokens_details.cached_tokens у OpenAI. None, если провайдер их не сообщает."""
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        if isinstance(details, dict):
+            cached = details.get("cached_tokens")
+        elif details is not None:
+            cached = getattr(details, "cached_tokens", None)
+    return cached
+
+def record_usage(provider, usage, seconds=None):
+    """Записать токены из response.usage (если провайдер их вернул).
+    
+    seconds - задержка запроса: записывается отдельно для ответов
+    с попаданием в кэш промпта и без, чтобы видеть выигрыш от кэша.
+    """
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = getattr(usage, kind, None)
+        if value:
+            ai_tokens.inc(provider, kind.replace("_tokens", ""), amount=value)
+    cached = cached_prompt_tokens(usage)
+    if cached is None:
+        return
+    if cached:
+        ai_tokens.inc(provider, "cached_prompt", amount=cached)
+    if seconds is not None:
+        ai_prompt_cache_seconds.observe(seconds, provider, "hit" if cached else "miss")
+
+def timed_handler(name, deadline=0.0):
+    """Декоратор для async обработчиков: время выполнения и ошибки.
+    
+    deadline - бюджет времени обработчика в секундах (см. deadline.py): запросы к AI
+    внутри подстраивают под него таймауты и fallback, а превышения считаются
+    в handler_deadline_overruns.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            with deadline_scope(deadline, name) as budget:
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    handler_errors.inc(name)
+                    raise
+                finally:
+                    handler_seconds.observe(time.perf_counter() - started, name)
+                    if budget is not None and budget.remaining() < 0:
+                        handler_deadline_overruns.inc(name, "late")
+                    elif budget is not None and budget.exhausted:
+                        handler_deadline_overruns.inc(name, "fallback")
+        return wrapper
+    return decorator
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        # Не засоряем логи бота запросами скрейпера
+        pass
+
+def start_http_server(port, host="127.0.0.1"):
+    """Запустить HTTP эндпоинт /metrics в фоновом потоке"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    logger.info(f"[METRICS] Эндпоинт метрик: http://{host}:{port}/metrics")
+    return server
@@ -1,67 +1,96 @@
+import logging
 import random
 
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Общая неизменная часть всех промптов. Провайдеры кэшируют совпадающий префикс
+# запроса (DeepSeek - от 64 токенов, OpenAI - от 1024), поэтому она идет первой
+# и одинакова для любого приема пищи; все переменное - в конце сообщения пользователя
+SYSTEM_PROMPT = """Ты помогаешь Тане решить, что приготовить. Таня готовит дома, без сложной техники и редких продуктов.
+Правила ответа:
+- предлагай простые домашние блюда из продуктов, которые есть в обычном супермаркете;
+- блюдо должно готовиться не дольше часа и быть понятным по названию;
+- название блюда - на русском языке, максимум 4-5 слов, с заглавной буквы;
+- не добавляй пояснений, рецептов, эмодзи, кавычек и нумерации, если формат ответа не задан явно;
+- не предлагай блюда из строки "НЕ предлагай" и очень похожие на них (то же блюдо с другим гарниром или под другим названием);
+- чередуй основные продукты: крупы, овощи, мясо, птицу, рыбу, яйца, творог, бобовые."""
+
 class PromptGenerator:
-    """Класс для генерации вариативных промптов для избежания повторов"""
+    """Класс для генерации вариативных промптов для избежания повторов.
+    
+    Промпт - список сообщений чата: общий SYSTEM_PROMPT, затем заранее собранная
+    формулировка для приема пищи и в самом конце - список блюд, которых нужно избегать.
+    Так кэшируемый провайдером префикс не зависит от истории пользователя.
+    """
     
     def __init__(self):
+        self.system_message = {"role": "system", "content": SYSTEM_PROMPT}
         self.prompts = {
             "завтрак": [
                 """Предложи простое блюдо для завтрака. Отвечай только названием (максимум 4-5 слов).
-{avoid_text}
 Пример: "Овсянка с ягодами" """,
 
                 """Что приготовить Тане на завтрак? Ответь только названием блюда (до 5 слов).
-{avoid_text}
 Пример: "Творожные сырники" """,
 
                 """Идея для завтрака? Только название простого блюда (максимум 5 слов).
-{avoid_text}
 Пример: "Яичница с зеленью" """
             ],
             
             "обед": [
                 """Предложи простое блюдо для обеда. Отвечай только названием (максимум 4-5 слов).
-{avoid_text}
 Пример: "Куриный суп с лапшой" """,
 
                 """Что приготовить Тане на обед? Ответь только названием блюда (до 5 слов).
-{avoid_text}
 Пример: "Рис с овощами" """,
 
                 """Идея для обеда? Только название простого блюда (максимум 5 слов).
-{avoid_text}
 Пример: "Макароны с фаршем" """
             ],
             
             "ужин": [
                 """Предложи простое блюдо для ужина. Отвечай только названием (максимум 4-5 слов).
-{avoid_text}
 Пример: "Запеченная рыба с картофелем" """,
 
                 """Что приготовить Тане на ужин? Ответь только названием блюда (до 5 слов).
-{avoid_text}
 Пример: "Салат с курицей" """,
 
                 """Идея для ужина? Только название простого блюда (максимум 5 слов).
-{avoid_text}
 Пример: "Котлеты с пюре" """
             ]
         }
+        self.menu_prompt = """Составь меню простых блюд для Тани. Для каждого дня нужны завтрак, обед и ужин.
+Блюда внутри меню не должны повторяться.
+Ответь ТОЛЬКО JSON без пояснений: ключ - день, значение - объект с ключами "завтрак", "обед" и "ужин",
+например {"День": {"завтрак": "...", "обед": "...", "ужин": "..."}}"""
+    
+    def _messages(self, prefix, suffix):
+        """Сообщения чата: неизменный префикс, переменная часть - последней"""
+        content = f"{prefix}\n{suffix}" if suffix else prefix
+        return [self.system_message, {"role": "user", "content": content}]
     
     def get_random_prompt(self, meal_type, avoid_text=""):
-        """Получить случайный промпт для категории еды"""
-        print(f"[PROMPT DEBUG] Генерируем промпт для: {meal_type}")
-        print(f"[PROMPT DEBUG] Избегаем: '{avoid_text}'")
-        
+        """Получить случайный промпт для категории еды (список сообщений чата)"""
         if meal_type not in self.prompts:
-            print(f"[PROMPT WARNING] Неизвестная категория '{meal_type}', используем 'обед'")
+            logger.warning("[PROMPT] Неизвестная категория '%s', используем 'обед'", meal_type)
             meal_type = "обед"  # fallback
         
-        prompt_template = random.choice(self.prompts[meal_type])
-        final_prompt = prompt_template.format(avoid_text=avoid_text)
-        print(f"[PROMPT DEBUG] Выбранный шаблон (первые 50 символов): {prompt_template[:50]}...")
+        index = random.randrange(len(self.prompts[meal_type]))
+        tracer.event("[PROMPT] %s, шаблон %d, избегаем: '%s'", meal_type, index, avoid_text)
+        return self._messages(self.prompts[meal_type][index], avoid_text)
+    
+    def get_menu_prompt(self, days, avoid_texts=None):
+        """Получить промпт для генерации всего меню одним запросом в формате JSON"""
+        avoid_texts = avoid_texts or {}
+        avoid_lines = "\n".join(
+            f"{meal_type.capitalize()}: {text}" for meal_type, text in avoid_texts.items() if text
+        )
+        days_list = ", ".join(f'"{day}"' for day in days)
         
-        return final_prompt
+        tracer.event("[PROMPT] Промпт меню для дней: %d", len(days))
+        return self._messages(self.menu_prompt, f"Дни: {days_list}.\n{avoid_lines}".rstrip())
 
 # Глобальный экземпляр генератора
-prompt_generator = PromptGenerator()
\ No newline at end of file
+prompt_generator = PromptGenerator()
@@ -0,0 +1,159 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict, deque
+
+from metrics import ai_queue_depth, ai_queue_wait_seconds, ai_requests_shed
+
+logger = logging.getLogger(__name__)
+
+# Пользователь (чат), от имени которого идут запросы к AI - ключ справедливой очереди
+current_user = contextvars.ContextVar("current_user", default=None)
+
+class RateLimitExceeded(Exception):
+    """Запрос не пропущен: очередь к провайдеру переполнена или ожидание слишком долгое"""
+
+class TokenBucket:
+    """Ведро токенов: rate_per_minute единиц в минуту, запас не больше capacity"""
+    
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        # По умолчанию разрешаем всплеск на 10 секунд лимита
+        self.capacity = capacity or max(1.0, rate_per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def time_until(self, amount):
+        """Через сколько секунд можно будет списать amount (0 - уже сейчас)"""
+        self._refill()
+        amount = min(amount, self.capacity)  # запрос больше ведра иначе не прошел бы никогда
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+    
+    def consume(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+class FairRateLimiter:
+    """Лимит запросов и токенов в минуту для одного провайдера.
+    
+    Если лимит исчерпан, запросы ждут в ограниченной очереди, которая
+    обслуживается по кругу между пользователями: пользователь, заказавший
+    несколько недельных меню подряд, не задерживает остальных. Когда очередь
+    переполнена или ожидание дольше max_wait, запрос сразу отклоняется
+    (RateLimitExceeded), и вызывающий код отвечает без AI.
+    """
+    
+    def __init__(self, name, requests_per_minute=0, tokens_per_minute=0, max_queue=100,
+                 max_queue_per_user=16, max_wait=5.0):
+        self.name = name
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+        self.queues = OrderedDict()  # пользователь -> deque[(future, токены)], порядок - очередь обхода
+        self.queued = 0
+        self.dispatcher = None
+        self.stats = {"granted": 0, "waited": 0, "shed": 0}
+    
+    def _wait_time(self, tokens):
+        delay = 0.0
+        if self.request_bucket:
+            delay = self.request_bucket.time_until(1)
+        if self.token_bucket:
+            delay = max(delay, self.token_bucket.time_until(tokens))
+        return delay
+    
+    def _consume(self, tokens):
+        if self.request_bucket:
+            self.request_bucket.consume(1)
+        if self.token_bucket:
+            self.token_bucket.consume(tokens)
+        self.stats["granted"] += 1
+    
+    def _shed(self, reason):
+        self.stats["shed"] += 1
+        ai_requests_shed.inc(self.name, reason)
+        logger.warning(f"[RateLimit] {self.name}: запрос отклонен ({reason}), в очереди {self.queued}")
+        raise RateLimitExceeded(f"{self.name}: {reason}")
+    
+    async def acquire(self, tokens=0, max_wait=None):
+        """Дождаться своей очереди на запрос стоимостью tokens токенов.
+        
+        max_wait - ждать не дольше (например, остаток дедлайна), но не дольше self.max_wait.
+        """
+        if not self.queued and self._wait_time(tokens) == 0:
+            self._consume(tokens)
+            ai_queue_wait_seconds.observe(0.0, self.name)
+            return
+        
+        user = current_user.get()
+        queue = self.queues.get(user)
+        if self.queued >= self.max_queue:
+            self._shed("queue_full")
+        if queue and len(queue) >= self.max_queue_per_user:
+            self._shed("user_queue_full")
+        
+        entry = (asyncio.get_running_loop().create_future(), tokens)
+        if queue is None:
+            queue = self.queues[user] = deque()
+        queue.append(entry)
+        self.queued += 1
+        self.stats["waited"] += 1
+        ai_queue_depth.set(self.queued, self.name)
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.ensure_future(self._dispatch())
+        
+        if max_wait is None:
+            max_wait = self.max_wait
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(entry[0], max(0.0, min(max_wait, self.max_wait)))
+        except asyncio.TimeoutError:
+            self._remove(user, entry)
+            self._shed("timeout")
+        except asyncio.CancelledError:
+            self._remove(user, entry)
+            raise
+        finally:
+            ai_queue_wait_seconds.observe(time.monotonic() - started, self.name)
+    
+    def _remove(self, user, entry):
+        queue = self.queues.get(user)
+        if queue and entry in queue:
+            queue.remove(entry)
+            self.queued -= 1
+            if not queue:
+                del self.queues[user]
+            ai_queue_depth.set(self.queued, self.name)
+    
+    async def _dispatch(self):
+        """Выдавать разрешения по кругу между пользователями по мере пополнения ведер"""
+        while self.queued:
+            user, queue = next(iter(self.queues.items()))
+            future, tokens = queue[0]
+            delay = self._wait_time(tokens)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue  # за время сна очередь могла измениться
+            
+            queue.popleft()
+            self.queued -= 1
+            if queue:
+                self.queues.move_to_end(user)
+            else:
+                del self.queues[user]
+            ai_queue_depth.set(self.queued, self.name)
+            if not future.done():
+                self._consume(tokens)
+                future.set_result(None)
+    
+    def get_stats(self) -> dict:
+        return {"queued": self.queued, "users": len(self.queues), **self.stats}
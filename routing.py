@@ -0,0 +1,126 @@
+import itertools
+import random
+from abc import ABC, abstractmethod
+
+class ProviderStats:
+    """Скользящие (EWMA) оценки задержки и успешности провайдера"""
+    
+    def __init__(self, cost_per_1k_tokens=0.0, alpha=0.2):
+        self.alpha = alpha
+        self.cost_per_1k_tokens = cost_per_1k_tokens
+        self.latency = None  # секунды, None пока нет успешных ответов
+        self.success_rate = 1.0
+        self.requests = 0
+    
+    def record(self, success, latency=None):
+        self.requests += 1
+        self.success_rate += self.alpha * ((1.0 if success else 0.0) - self.success_rate)
+        if success and latency is not None:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.alpha * (latency - self.latency)
+    
+    def as_dict(self):
+        return {
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "success_rate": round(self.success_rate, 3),
+            "cost_per_1k_tokens": self.cost_per_1k_tokens,
+            "requests": self.requests,
+        }
+
+class RoutingPolicy(ABC):
+    """Политика выбора порядка провайдеров в режиме mixed"""
+    
+    name = "base"
+    
+    @abstractmethod
+    def order(self, candidates, stats):
+        """Вернуть кандидатов в порядке попыток"""
+        pass
+
+class RandomPolicy(RoutingPolicy):
+    """Случайный основной провайдер (прежнее поведение mixed)"""
+    
+    name = "random"
+    
+    def order(self, candidates, stats):
+        primary = random.choice(candidates)
+        return [primary] + [c for c in candidates if c != primary]
+
+class RoundRobinPolicy(RoutingPolicy):
+    """Провайдеры по очереди"""
+    
+    name = "round_robin"
+    
+    def __init__(self):
+        self.counter = itertools.count()
+    
+    def order(self, candidates, stats):
+        shift = next(self.counter) % len(candidates)
+        return candidates[shift:] + candidates[:shift]
+
+class LeastLatencyPolicy(RoutingPolicy):
+    """Сначала самый быстрый по EWMA задержке (неизвестные - в приоритете, чтобы их измерить)"""
+    
+    name = "least_latency"
+    
+    def order(self, candidates, stats):
+        return sorted(candidates, key=lambda c: stats[c].latency if stats[c].latency is not None else -1.0)
+
+class CostBoundedPolicy(RoutingPolicy):
+    """Самый быстрый из провайдеров не дороже max_cost_per_1k, иначе самый дешевый"""
+    
+    name = "cost_bounded"
+    
+    def __init__(self, max_cost_per_1k=0.001):
+        self.max_cost_per_1k = max_cost_per_1k
+        self.fastest = LeastLatencyPolicy()
+    
+    def order(self, candidates, stats):
+        affordable = [c for c in candidates if stats[c].cost_per_1k_tokens <= self.max_cost_per_1k]
+        expensive = sorted((c for c in candidates if c not in affordable),
+                           key=lambda c: stats[c].cost_per_1k_tokens)
+        return self.fastest.order(affordable, stats) + expensive if affordable else expensive
+
+class WeightedScorePolicy(RoutingPolicy):
+    """Выбор по взвешенной оценке: успешность, задержка и стоимость.
+    
+    С вероятностью exploration основным выбирается случайный провайдер,
+    чтобы оценки редко используемых провайдеров не устаревали.
+    """
+    
+    name = "weighted"
+    
+    def __init__(self, exploration=0.1, cost_weight=0.5):
+        self.exploration = exploration
+        self.cost_weight = cost_weight
+    
+    def score(self, provider_stats, max_cost):
+        # Пока задержка неизвестна, считаем провайдера быстрым - он будет опробован
+        latency = provider_stats.latency if provider_stats.latency is not None else 0.1
+        cost = provider_stats.cost_per_1k_tokens / max_cost if max_cost else 0.0
+        return provider_stats.success_rate / max(latency, 0.01) / (1.0 + self.cost_weight * cost)
+    
+    def order(self, candidates, stats):
+        max_cost = max(stats[c].cost_per_1k_tokens for c in candidates)
+        ranked = sorted(candidates, key=lambda c: self.score(stats[c], max_cost), reverse=True)
+        if len(ranked) > 1 and random.random() < self.exploration:
+            explored = random.choice(ranked[1:])
+            ranked = [explored] + [c for c in ranked if c != explored]
+        return ranked
+
+POLICIES = {
+    RandomPolicy.name: RandomPolicy,
+    RoundRobinPolicy.name: RoundRobinPolicy,
+    LeastLatencyPolicy.name: LeastLatencyPolicy,
+    CostBoundedPolicy.name: CostBoundedPolicy,
+    WeightedScorePolicy.name: WeightedScorePolicy,
+}
+
+def create_policy(name, **kwargs):
+    """Создать политику по имени (random, round_robin, least_latency, cost_bounded, weighted)"""
+    policy_class = POLICIES.get((name or "").lower())
+    if policy_class is None:
+        raise ValueError(f"Неизвестная политика маршрутизации: {name}")
+    return policy_class(**kwargs)
@@ -0,0 +1,371 @@
+import logging
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from typing import Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+class StateError(Exception):
+    """Ошибка общего хранилища состояния (нет связи, неверный ответ)"""
+
+class SharedState(ABC):
+    """Общее состояние воркеров бота: строки по ключам (с необязательным TTL) и очереди.
+    
+    Методы синхронные и быстрые; из event loop долгие операции (pop)
+    вызываются через asyncio.to_thread.
+    """
+    
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        pass
+    
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        pass
+    
+    @abstractmethod
+    def set_if_absent(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """Записать значение, только если ключа нет. True - записали (ключ "захвачен")"""
+    
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+    
+    def set_many(self, items: dict):
+        for key, value in items.items():
+            self.set(key, value)
+    
+    @abstractmethod
+    def push(self, queue: str, value: str):
+        """Добавить значение в конец очереди"""
+    
+    @abstractmethod
+    def pop(self, queue: str, timeout: float = 1.0) -> Optional[str]:
+        """Взять значение из начала очереди, ожидая не дольше timeout. None, если очередь пуста."""
+    
+    def close(self):
+        pass
+
+class LocalState(SharedState):
+    """Состояние в памяти процесса - для одного воркера (по умолчанию)"""
+    
+    name = "local"
+    
+    def __init__(self):
+        self.values = {}  # ключ -> (значение, время истечения или None)
+        self.queues = defaultdict(deque)
+        self.condition = threading.Condition()
+    
+    def _alive(self, key):
+        item = self.values.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self.values[key]
+            return None
+        return item
+    
+    def get(self, key):
+        with self.condition:
+            item = self._alive(key)
+            return item[0] if item else None
+    
+    def set(self, key, value, ttl=None):
+        with self.condition:
+            self.values[key] = (value, time.monotonic() + ttl if ttl else None)
+    
+    def set_if_absent(self, key, value, ttl=None):
+        with self.condition:
+            if self._alive(key):
+                return False
+            self.values[key] = (value, time.monotonic() + ttl if ttl else None)
+            return True
+    
+    def delete(self, key):
+        with self.condition:
+            self.values.pop(key, None)
+    
+    def push(self, queue, value):
+        with self.condition:
+            self.queues[queue].append(value)
+            self.condition.notify_all()
+    
+    def pop(self, queue, timeout=1.0):
+        with self.condition:
+            if not self.queues[queue]:
+                self.condition.wait_for(lambda: self.queues[queue], timeout=timeout)
+            return self.queues[queue].popleft() if self.queues[queue] else None
+
+class SQLiteState(SharedState):
+    """Общее состояние в файле SQLite - для нескольких процессов на одном хосте.
+    
+    Согласованность между процессами обеспечивают файловые блокировки SQLite:
+    захват ключа и извлечение из очереди идут в транзакции BEGIN IMMEDIATE.
+    Очередь опрашивается с интервалом poll_interval.
+    """
+    
+    name = "sqlite"
+    # Истекшие ключи удаляются разом после стольких захватов
+    CLEANUP_EVERY = 1000
+    
+    def __init__(self, path, poll_interval=0.05, busy_timeout=5.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.claims = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None,
+                                    timeout=busy_timeout)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS state ("
+                          "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS queue ("
+                          "id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, value TEXT NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS queue_name ON queue (name, id)")
+    
+    @staticmethod
+    def _expires(ttl):
+        # Время истечения - по часам системы, они общие для процессов хоста
+        return time.time() + ttl if ttl else None
+    
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM state WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                                    (key, time.time())).fetchone()
+        return row[0] if row else None
+    
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO state (key, value, expires) VALUES (?, ?, ?)",
+                              (key, value, self._expires(ttl)))
+    
+    def set_many(self, items):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany("INSERT OR REPLACE INTO state (key, value, expires) VALUES (?, ?, NULL)",
+                                      list(items.items()))
+                self.conn.execute("COMMIT")
+            except sqlite3.Error:
+                self.conn.execute("ROLLBACK")
+                raise
+    
+    def set_if_absent(self, key, value, ttl=None):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.claims += 1
+                if self.claims % self.CLEANUP_EVERY == 0:
+                    self.conn.execute("DELETE FROM state WHERE expires <= ?", (time.time(),))
+                else:
+                    self.conn.execute("DELETE FROM state WHERE key = ? AND expires <= ?", (key, time.time()))
+                cursor = self.conn.execute("INSERT OR IGNORE INTO state (key, value, expires) VALUES (?, ?, ?)",
+                                           (key, value, self._expires(ttl)))
+                self.conn.execute("COMMIT")
+            except sqlite3.Error:
+                self.conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount == 1
+    
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM state WHERE key = ?", (key,))
+    
+    def push(self, queue, value):
+        with self.lock:
+            self.conn.execute("INSERT INTO queue (name, value) VALUES (?, ?)", (queue, value))
+    
+    def _pop_once(self, queue):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT id, value FROM queue WHERE name = ? ORDER BY id LIMIT 1",
+                                        (queue,)).fetchone()
+                if row:
+                    self.conn.execute("DELETE FROM queue WHERE id = ?", (row[0],))
+                self.conn.execute("COMMIT")
+            except sqlite3.Error:
+                self.conn.execute("ROLLBACK")
+                raise
+        return row[1] if row else None
+    
+    def pop(self, queue, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            value = self._pop_once(queue)
+            if value is not None or time.monotonic() >= deadline:
+                return value
+            time.sleep(self.poll_interval)
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class _RESPConnection:
+    """Одно соединение по протоколу Redis (RESP2): команды и разбор ответов"""
+    
+    def __init__(self, host, port, db=0, password=None, timeout=5.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.reader = self.sock.makefile("rb")
+        try:
+            if password:
+                self.execute("AUTH", password)
+            if db:
+                self.execute("SELECT", db)
+        except StateError:
+            self.close()
+            raise
+    
+    @staticmethod
+    def _encode(args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+    
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise StateError("Соединение с Redis закрыто")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            raise StateError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise StateError(f"Неизвестный ответ Redis: {line!r}")
+    
+    def execute(self, *args, timeout=None):
+        # Ошибки сокета (в том числе таймаут медленного Redis) - тоже ошибки хранилища
+        try:
+            if timeout is not None:
+                self.sock.settimeout(timeout)
+            self.sock.sendall(self._encode(args))
+            return self._read_reply()
+        except OSError as e:
+            raise StateError(f"Ошибка связи с Redis: {e!r}") from e
+    
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+class RedisState(SharedState):
+    """Общее состояние в Redis (или любом сервере с протоколом RESP) - для воркеров на разных хостах.
+    
+    Минимальный клиент без внешних зависимостей: GET/SET (PX, NX)/DEL, RPUSH/BLPOP.
+    Соединение открывается при первой команде и переоткрывается после ошибки;
+    блокирующий BLPOP идет по отдельному соединению.
+    """
+    
+    name = "redis"
+    
+    def __init__(self, url="redis://127.0.0.1:6379/0", timeout=5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.blocking_lock = threading.Lock()
+        self._conn = None
+        self._blocking_conn = None
+    
+    def _connect(self):
+        try:
+            return _RESPConnection(self.host, self.port, self.db, self.password, self.timeout)
+        except OSError as e:
+            raise StateError(f"Нет связи с Redis {self.host}:{self.port}: {e}") from e
+    
+    def _execute(self, *args):
+        with self.lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            try:
+                return self._conn.execute(*args)
+            except StateError:
+                # Ответ мог потеряться - соединение больше не используем
+                self._conn.close()
+                self._conn = None
+                raise
+    
+    def get(self, key):
+        return self._execute("GET", key)
+    
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self._execute("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            self._execute("SET", key, value)
+    
+    def set_many(self, items):
+        if not items:
+            return
+        args = ["MSET"]
+        for key, value in items.items():
+            args.extend((key, value))
+        self._execute(*args)
+    
+    def set_if_absent(self, key, value, ttl=None):
+        args = ["SET", key, value, "NX"]
+        if ttl:
+            args.extend(("PX", int(ttl * 1000)))
+        return self._execute(*args) == "OK"
+    
+    def delete(self, key):
+        self._execute("DEL", key)
+    
+    def push(self, queue, value):
+        self._execute("RPUSH", queue, value)
+    
+    def pop(self, queue, timeout=1.0):
+        with self.blocking_lock:
+            if self._blocking_conn is None:
+                self._blocking_conn = self._connect()
+            try:
+                reply = self._blocking_conn.execute("BLPOP", queue, f"{timeout:.3f}",
+                                                    timeout=timeout + self.timeout)
+            except StateError:
+                self._blocking_conn.close()
+                self._blocking_conn = None
+                raise
+        return reply[1] if reply else None
+    
+    def close(self):
+        with self.lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+        with self.blocking_lock:
+            if self._blocking_conn:
+                self._blocking_conn.close()
+                self._blocking_conn = None
+
+def create_state(backend="local", path="shared_state.db", url="redis://127.0.0.1:6379/0") -> SharedState:
+    """Создать хранилище общего состояния: local, sqlite или redis"""
+    if backend == "sqlite":
+        return SQLiteState(path)
+    if backend == "redis":
+        return RedisState(url)
+    if backend != "local":
+        logger.warning(f"[STATE] Неизвестное хранилище '{backend}', используется local")
+    return LocalState()
@@ -0,0 +1,115 @@
+import contextvars
+import logging
+import random
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger("trace")
+
+# Трасса текущего обновления (задачи, созданные внутри, наследуют ее)
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+class Trace:
+    """Трасса одного обновления: спаны с длительностью и отложенные сообщения.
+    
+    Во время обработки только складываются кортежи, строки форматируются
+    в format() - то есть только для трасс, которые действительно выводятся.
+    """
+    
+    __slots__ = ("trace_id", "name", "attrs", "started", "duration", "records", "error")
+    
+    def __init__(self, name, attrs):
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.duration = None
+        self.records = []  # (начало, длительность или None, имя/шаблон, аргументы)
+        self.error = None
+    
+    def format(self):
+        attrs = " ".join(f"{key}={value}" for key, value in self.attrs.items())
+        lines = [f"trace {self.trace_id} {self.name} {self.duration or 0:.3f}s {attrs}".rstrip()]
+        if self.error:
+            lines[0] += f" error={self.error}"
+        for started, duration, text, args in sorted(self.records, key=lambda record: record[0]):
+            offset = started - self.started
+            if duration is None:
+                message = text % args if args else text
+                lines.append(f"  +{offset:.3f} {message}")
+            else:
+                span_attrs = " ".join(f"{key}={value}" for key, value in args.items())
+                lines.append(f"  +{offset:.3f} [{text}] {duration:.3f}s {span_attrs}".rstrip())
+        return "\n".join(lines)
+
+class Tracer:
+    """Трассировка обновлений с выборкой.
+    
+    Трасса выводится в лог, если попала в выборку sample_rate, обработка шла
+    дольше slow_seconds или завершилась ошибкой. Медленные трассы дополнительно
+    хранятся в памяти (recent_slow) и доступны администратору через /trace.
+    """
+    
+    def __init__(self, sample_rate=0.0, slow_seconds=5.0, keep_slow=50):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.recent_slow = deque(maxlen=keep_slow)
+    
+    def configure(self, sample_rate=None, slow_seconds=None):
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if slow_seconds is not None:
+            self.slow_seconds = slow_seconds
+    
+    @contextmanager
+    def trace(self, name, **attrs):
+        """Начать трассу (обычно на одно обновление Telegram)"""
+        trace = Trace(name, attrs)
+        token = current_trace.set(trace)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.error = type(e).__name__
+            raise
+        finally:
+            current_trace.reset(token)
+            trace.duration = time.perf_counter() - trace.started
+            self._finish(trace)
+    
+    def _finish(self, trace):
+        slow = self.slow_seconds and trace.duration >= self.slow_seconds
+        if slow:
+            self.recent_slow.append(trace)
+        if slow or trace.error or (self.sample_rate and random.random() < self.sample_rate):
+            logger.info(trace.format())
+    
+    @contextmanager
+    def span(self, name, **attrs):
+        """Замерить участок обработки в текущей трассе (без трассы ничего не делает)"""
+        trace = current_trace.get()
+        if trace is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            trace.records.append((started, time.perf_counter() - started, name, attrs))
+    
+    def event(self, message, *args):
+        """Отложенное сообщение в текущую трассу: message % args форматируется только при выводе"""
+        trace = current_trace.get()
+        if trace is not None:
+            trace.records.append((time.perf_counter(), None, message, args))
+    
+    def find(self, trace_id):
+        """Найти сохраненную медленную трассу по ID (или префиксу)"""
+        for trace in reversed(self.recent_slow):
+            if trace.trace_id.startswith(trace_id):
+                return trace
+        return None
+
+# Глобальный трассировщик (параметры выборки задаются при запуске бота)
+tracer = Tracer()
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка внутри чата.
+    
+    Обновления разных чатов обрабатываются одновременно (до
+    max_concurrent_updates), а обновления одного чата - строго по очереди,
+    поэтому быстрые повторные нажатия не обгоняют друг друга. Слот
+    обработки занимает только обновление, дошедшее до начала очереди своего
+    чата, так что длинная очередь одного чата не задерживает другие чаты.
+    Обновления, для которых on_update вернул True (схлопнутые повторные
+    нажатия), обрабатываются сразу, без очереди чата. Обработка идет в
+    собственных задачах, которых Application.stop() не ждет, поэтому при
+    остановке нужно вызвать drain() до закрытия бота (см. bot.post_stop).
+    
+    route - async функция, решающая, обрабатывать ли обновление в этом
+    процессе (см. UpdateRouter.route); отклоненное обновление пропускается.
+    """
+    
+    def __init__(self, max_concurrent_updates: int, drain_timeout: float = 30.0, on_update=None, route=None):
+        super().__init__(max_concurrent_updates)
+        self.drain_timeout = drain_timeout
+        self.on_update = on_update  # вызывается сразу при получении; True - обработать вне очереди чата
+        self.route = route
+        # Слоты обработки берутся только обновлением, дошедшим до начала очереди своего чата
+        self.slots = asyncio.Semaphore(max_concurrent_updates)
+        self.chat_locks = {}  # chat_id -> [lock, количество ожидающих]
+        self.tasks = set()
+        self.in_flight = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+    
+    @staticmethod
+    def _chat_key(update):
+        if isinstance(update, Update) and update.effective_chat:
+            return update.effective_chat.id
+        return None
+    
+    async def do_process_update(self, update, coroutine) -> None:
+        # Слот PTB (semaphore process_update) держится только на время приема обновления:
+        # ожидание очереди чата идет в отдельной задаче и не занимает общие слоты
+        if self.route and not await self.route(update):
+            coroutine.close()
+            return
+        chat_id = self._chat_key(update)
+        out_of_order = bool(self.on_update(update)) if self.on_update else False
+        self.in_flight += 1
+        self.idle.clear()
+        task = asyncio.create_task(self._process(update, coroutine, None if out_of_order else chat_id))
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+    
+    def _task_done(self, task):
+        self.tasks.discard(task)
+        self.in_flight -= 1
+        if self.in_flight == 0:
+            self.idle.set()
+        if not task.cancelled() and task.exception():
+            logger.error(f"[UPDATES] Ошибка обработки обновления: {task.exception()}")
+    
+    async def _process(self, update, coroutine, chat_id):
+        # Трасса на все обновление, включая ожидание очереди чата
+        with tracer.trace("update", update_id=getattr(update, "update_id", None), chat_id=chat_id):
+            try:
+                if chat_id is None:
+                    await self._run_in_slot(coroutine)
+                    return
+                
+                entry = self.chat_locks.setdefault(chat_id, [asyncio.Lock(), 0])
+                entry[1] += 1
+                try:
+                    with tracer.span("chat_queue"):
+                        await entry[0].acquire()
+                    try:
+                        await self._run_in_slot(coroutine)
+                    finally:
+                        entry[0].release()
+                finally:
+                    entry[1] -= 1
+                    # Освобождаем замок, когда в чате никого не осталось - память не растет с числом чатов
+                    if entry[1] == 0:
+                        self.chat_locks.pop(chat_id, None)
+            except asyncio.CancelledError:
+                coroutine.close()  # отмена при остановке до начала обработки
+                raise
+    
+    async def _run_in_slot(self, coroutine):
+        with tracer.span("slot_wait"):
+            await self.slots.acquire()
+        try:
+            await coroutine
+        finally:
+            self.slots.release()
+    
+    async def initialize(self) -> None:
+        pass
+    
+    async def drain(self) -> None:
+        """Дождаться обработки начатых обновлений (не дольше drain_timeout), затем отменить оставшиеся.
+        
+        Вызывается из post_stop, пока HTTP клиент бота еще открыт: PTB
+        закрывает бота раньше, чем вызывает shutdown() processor.
+        """
+        if self.in_flight:
+            logger.info(f"[UPDATES] Ожидаем завершения {self.in_flight} обновлений...")
+            try:
+                await asyncio.wait_for(self.idle.wait(), timeout=self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"[UPDATES] Не дождались {self.in_flight} обновлений за {self.drain_timeout}с")
+                for task in list(self.tasks):
+                    task.cancel()
+                await asyncio.gather(*self.tasks, return_exceptions=True)
+    
+    async def shutdown(self) -> None:
+        # Обычно обновления уже дождались в drain() из post_stop
+        await self.drain()
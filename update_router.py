@@ -0,0 +1,80 @@
+import asyncio
+import json
+import logging
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+class UpdateRouter:
+    """Распределение обновлений между воркерами по чатам.
+    
+    Чат закреплен за воркером chat_id % worker_count, поэтому история блюд,
+    очередь чата и учет генераций (inflight) остаются согласованными в памяти
+    одного процесса. Обновления от Telegram получает воркер 0: чужие он кладет
+    в очередь воркера в общем хранилище, остальные воркеры читают свою очередь
+    (consume). Каждое обновление обрабатывается один раз - его ID захватывается
+    в общем хранилище (Telegram может прислать обновление повторно).
+    """
+    
+    # Сколько секунд ждать обновление в очереди за один запрос к хранилищу
+    POP_TIMEOUT = 1.0
+    
+    def __init__(self, state, worker_index=0, worker_count=1, dedup_ttl=3600.0):
+        self.state = state
+        self.worker_index = worker_index
+        self.worker_count = max(1, worker_count)
+        self.dedup_ttl = dedup_ttl
+        self.stats = {"local": 0, "forwarded": 0, "consumed": 0, "duplicates": 0}
+    
+    @property
+    def enabled(self):
+        return self.worker_count > 1
+    
+    def partition(self, update):
+        """Номер воркера для обновления (без чата - воркер 0)"""
+        chat = update.effective_chat if isinstance(update, Update) else None
+        return chat.id % self.worker_count if chat else 0
+    
+    @staticmethod
+    def queue_name(partition):
+        return f"updates:{partition}"
+    
+    async def route(self, update):
+        """True - обновление обрабатывается здесь; False - передано другому воркеру или уже обработано"""
+        if not self.enabled or not isinstance(update, Update):
+            return True
+        partition = self.partition(update)
+        if partition != self.worker_index:
+            payload = json.dumps(update.to_dict(), ensure_ascii=False)
+            await asyncio.to_thread(self.state.push, self.queue_name(partition), payload)
+            self.stats["forwarded"] += 1
+            return False
+        claimed = await asyncio.to_thread(self.state.set_if_absent, f"update:{update.update_id}",
+                                          str(self.worker_index), self.dedup_ttl)
+        if not claimed:
+            self.stats["duplicates"] += 1
+            return False
+        self.stats["local"] += 1
+        return True
+    
+    async def consume(self, update_queue, bot, stop):
+        """Перекладывать обновления своей очереди в очередь приложения, пока не установлен stop.
+        
+        Не отменяется снаружи: отмена во время чтения потеряла бы уже извлеченное обновление.
+        """
+        queue = self.queue_name(self.worker_index)
+        while not stop.is_set():
+            try:
+                payload = await asyncio.to_thread(self.state.pop, queue, self.POP_TIMEOUT)
+            except Exception as e:
+                logger.error(f"[WORKERS] Ошибка чтения очереди {queue}: {e}")
+                await asyncio.sleep(self.POP_TIMEOUT)
+                continue
+            if payload is None:
+                continue
+            self.stats["consumed"] += 1
+            await update_queue.put(Update.de_json(json.loads(payload), bot))
+    
+    def get_stats(self) -> dict:
+        return {"worker": self.worker_index, "workers": self.worker_count, **self.stats}